@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+'''
+Author: nilputs@nilput.com
+see COPYRIGHTS file which is included in this project
+'''
+'''
+ checks the generator end to end, run it after changing the generator
+
+ the checks:
+    grammars    every grammar in grammars/ is built with every algorithm and its C parser is emitted
+                in every table layout, a grammar outside of an algorithm's class has to be rejected
+                with a conflict instead (see REJECTS)
+    incremental every grammar that slr or lalr builds is edited (see EDITS), incremental.update() of its table,
+                and of its table after a round trip through table_cache, has to be the table that
+                a fresh build of the edited grammar gives (or both have to reject it), the grammars are small
+                so it's also checked without the limits that make update_lookaheads() fall back to a full build,
+                and on synthetic grammars (synth_grammar.py) with random edits (synth_edit())
+    parse       lrparse parses the sample inputs of every grammar (see SAMPLES) with the table of every
+                algorithm that builds it, and with the table after a round trip through lrparse.dumps(),
+                the accepted inputs have to parse and the rejected ones have to raise parse_error
+
+ prints the checks that failed, the exit status is 1 if any did
+
+ usage:
+    check.py
+    check.py -v     #prints the checks that passed too
+'''
+import os
+import io
+import sys
+import glob
+import random
+import argparse
+import functools
+import contextlib
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SRC = os.path.join(HERE, '..', 'src')
+GRAMMARS = os.path.join(HERE, '..', 'grammars')
+sys.path.insert(0, SRC)
+import lrgen
+import table_cache
+import incremental
+import generate_slr_c
+import lrparse
+from synth_grammar import synth_grammar, nonterminal_name
+
+ALGORITHMS = lrgen.ALGORITHMS
+#(grammar file, algorithm) pairs that have to be rejected, every other pair has to build
+#(not_lalr1_grammar.gram is lr1, lalr merges the states that lr1 keeps apart)
+REJECTS = {
+    ('lr1.gram', 'slr'),
+    ('not_slr1_grammar.gram', 'slr'),
+    ('not_lalr1_grammar.gram', 'slr'),
+    ('not_lalr1_grammar.gram', 'lalr'),
+}
+
+#{grammar file: (accepted inputs, rejected inputs)}, an input is the kinds of its tokens split by spaces
+SAMPLES = {
+    'lr.gram':                 (['T_id', 'T_id + T_id * T_id', '( T_id + T_id ) * T_id'],
+                                ['', 'T_id +', '( T_id', 'T_id T_id', '+ T_id', 'T_id )']),
+    'lr.printf.gram':          (['1', 'T_id * ( 2 + 3 )', '( ( 1 ) )'],
+                                ['', '1 2', '( 1 + )', '* 3']),
+    'lr1.gram':                (['x', 'x = x', '* x = * * x', '* * x'],
+                                ['', '=', 'x = = x', '*', 'x x']),
+    'lr41.gram':               (['x', 'x + x * x', '( x ) * ( x + x )'],
+                                ['', 'x +', '( x', 'x ( x )']),
+    'lr428.gram':              (['T_id', 'T_id + T_id * T_id', '( T_id + T_id ) * T_id'],
+                                ['', 'T_id +', '* T_id', '( )', 'T_id T_id']),
+    'not_lalr1_grammar.gram':  (['a c d', 'b c d', 'a c e', 'b c e'],
+                                ['', 'a c', 'c d', 'a d', 'a c c d', 'a c d e']),
+    'not_slr1_grammar.gram':   (['T_id', '* T_id = T_id', 'T_id = * * T_id', '* * T_id'],
+                                ['', '= T_id', 'T_id = = T_id', 'T_id =', '*']),
+}
+
+#(description, a function of the grammar's text and its last nonterminal that returns the edited text)
+EDITS = (
+    ('a new alternative',          lambda text, lhs: text + "\n{0} -> 'chk' {0} 'kc'\n".format(lhs)),
+    ('a new nullable nonterminal', lambda text, lhs: text + "\n{} -> 'chk' Chk\nChk -> 'kc' | _EPSILON\n".format(lhs)),
+    ('the last line removed',      lambda text, lhs: text.rstrip('\n').rsplit('\n', 1)[0] + '\n'),
+)
+#the synthetic grammars and how many random edits of each are checked, with slr and lalr
+SYNTH = {'rules': 12, 'alternatives': 2, 'depth': 4, 'literals': 4}
+SYNTH_SEEDS = 3
+SYNTH_EDITS = 8
+
+class check_failed(Exception):
+    '''
+    a check that didn't pass, the message is what went wrong
+    '''
+
+def grammar_files():
+    '''
+    [(name, text), ...] of the grammars in grammars/
+    '''
+    files = []
+    for path in sorted(glob.glob(os.path.join(GRAMMARS, '*.gram'))):
+        with open(path) as f:
+            files.append((os.path.basename(path), f.read()))
+    return files
+
+def parse_bnf(text, filename):
+    return lrgen.extract_bnf(lrgen.grammar_parser(lrgen.token_source(text, filename)).grammar())
+
+def build(text, filename, algorithm):
+    '''
+    (table, None), or (None, the error) when the generator rejects the grammar
+    '''
+    stderr = io.StringIO()
+    try:
+        with contextlib.redirect_stderr(stderr):
+            bnf = parse_bnf(text, filename)
+            return lrgen.generate_slr_table(lrgen.create_states(bnf, algorithm), algorithm), None
+    except SystemExit:
+        return None, stderr.getvalue().strip() or 'exited'
+
+def check_build(name, text, algorithm):
+    table, error = build(text, name, algorithm)
+    if (name, algorithm) in REJECTS:
+        if table is not None:
+            raise check_failed('was accepted, it has to be rejected')
+        if 'conflict' not in error:
+            raise check_failed('was rejected without a conflict: {}'.format(error.splitlines()[0]))
+        return
+    if table is None:
+        raise check_failed(error.splitlines()[0])
+    for table_format in generate_slr_c.TABLE_FORMATS:
+        with contextlib.redirect_stdout(io.StringIO()):
+            generate_slr_c.generate_C_data(table, table_format)
+            generate_slr_c.generate_C_code(table, table_format)
+
+def check_grammars():
+    for name, text in grammar_files():
+        for algorithm in ALGORITHMS:
+            expect = 'rejected' if (name, algorithm) in REJECTS else 'built'
+            yield '{} {} is {}'.format(name, algorithm, expect), functools.partial(check_build, name, text, algorithm)
+
+def table_dump(table):
+    '''
+    what two tables of the same grammar have to agree on
+    '''
+    return ([symbol.name for symbol in table.index_to_symbol], [state.kernel for state in table.index_to_state],
+            [lrgen.row_key(row) for row in table.rows], table.default_reductions, table.ctx.lookaheads)
+
+def check_update(name, text, algorithm, edit):
+    edited = edit(text, list(parse_bnf(text, name).productions)[-1])
+    fresh, error = build(edited, name, algorithm)
+    old = build(text, name, algorithm)[0]
+    data = table_cache.serialize(old)
+    cached = lambda: table_cache.deserialize(data, parse_bnf(text, name), algorithm)
+    updates = (('the table', lambda: old, None), ('the cached table', cached, None),
+               ('the cached table without the limits', cached, 1.0))
+    for what, table, limit in updates:
+        stderr = io.StringIO()
+        limits = (incremental.LOOKAHEADS_MAX_NEW, incremental.LOOKAHEADS_MAX_DIRTY)
+        try:
+            if limit is not None:
+                incremental.LOOKAHEADS_MAX_NEW = incremental.LOOKAHEADS_MAX_DIRTY = limit
+            with contextlib.redirect_stderr(stderr):
+                updated = incremental.update(table(), parse_bnf(edited, name), algorithm)
+        except SystemExit:
+            if fresh is not None:
+                raise check_failed('updating {} rejected it: {}'.format(what, stderr.getvalue().strip()))
+            continue
+        finally:
+            incremental.LOOKAHEADS_MAX_NEW, incremental.LOOKAHEADS_MAX_DIRTY = limits
+        if fresh is None:
+            raise check_failed('updating {} accepted it, a fresh build rejects it: {}'.format(what, error.splitlines()[0]))
+        if table_dump(updated) != table_dump(fresh):
+            raise check_failed('updating {} gave another table than a fresh build'.format(what))
+
+def check_incremental():
+    for name, text in grammar_files():
+        for algorithm in incremental.UPDATABLE:
+            if (name, algorithm) in REJECTS:
+                continue
+            for description, edit in EDITS:
+                yield '{} {} is updated after {}'.format(name, algorithm, description), \
+                      functools.partial(check_update, name, text, algorithm, edit)
+
+def synth_edit(text, rnd, rules):
+    '''
+    text, a synthetic grammar, with an alternative added to one of its nonterminals
+    (in the middle, at the end or an empty one) or with one of its alternatives removed
+    '''
+    lhs = nonterminal_name(rnd.randrange(rules))
+    rhs = nonterminal_name(rnd.randrange(rules))
+    kind = rnd.randrange(4)
+    if kind == 0:
+        return text + "{} -> 'x{}' {} 'y{}'\n".format(lhs, rnd.randrange(100), rhs, rnd.randrange(100))
+    if kind == 1:
+        return text + "{} -> {} 'z{}'\n".format(lhs, rhs, rnd.randrange(100))
+    if kind == 2:
+        return text + '{} -> _EPSILON\n'.format(lhs)
+    lines = text.split('\n')
+    alternatives = [i for i,line in enumerate(lines) if line.lstrip().startswith('|')]
+    del lines[rnd.choice(alternatives)]
+    return '\n'.join(lines)
+
+def check_incremental_synth():
+    for seed in range(SYNTH_SEEDS):
+        text = synth_grammar(seed=seed, **SYNTH)
+        for algorithm in incremental.UPDATABLE:
+            rnd = random.Random(seed)
+            for i in range(SYNTH_EDITS):
+                edited = synth_edit(text, rnd, SYNTH['rules'])
+                yield 'synthetic grammar {} {} is updated after edit {}'.format(seed, algorithm, i), \
+                      functools.partial(check_update, 'synth{}'.format(seed), text, algorithm, lambda text, lhs, edited=edited: edited)
+
+def sample_tokens(sample):
+    return [(kind, kind) for kind in sample.split()]
+
+def check_parse(name, text, algorithm, accepted, rejected):
+    table, error = build(text, name, algorithm)
+    if table is None:
+        raise check_failed(error.splitlines()[0])
+    p = lrparse.parser(table)
+    inputs = [sample_tokens(sample) for sample in accepted + rejected]
+    for what, parser in (('', p), (' after a round trip', lrparse.parser(p.dumps()))):
+        results = parser.parse_many(inputs)
+        for sample, result in zip(accepted, results):
+            if isinstance(result, lrparse.parse_error):
+                raise check_failed('rejected {!r}{}: {}'.format(sample, what, result))
+        for sample, result in zip(rejected, results[len(accepted):]):
+            if not isinstance(result, lrparse.parse_error):
+                raise check_failed('accepted {!r}{}, it has to be rejected'.format(sample, what))
+        try:
+            parser.parse(inputs[-1])
+        except lrparse.parse_error:
+            pass
+        else:
+            raise check_failed('parse() accepted {!r}{}, it has to raise parse_error'.format(rejected[-1], what))
+
+def no_samples():
+    raise check_failed('add its sample inputs to SAMPLES')
+
+def check_samples():
+    for name, text in grammar_files():
+        if name not in SAMPLES:
+            yield '{} has samples'.format(name), no_samples
+            continue
+        accepted, rejected = SAMPLES[name]
+        for algorithm in ALGORITHMS:
+            if (name, algorithm) in REJECTS:
+                continue
+            yield '{} {} parses its samples'.format(name, algorithm), \
+                  functools.partial(check_parse, name, text, algorithm, accepted, rejected)
+
+#every check yields (description, a function that raises check_failed if the check doesn't pass)
+CHECKS = (check_grammars, check_incremental, check_incremental_synth, check_samples)
+
+def main():
+    parser = argparse.ArgumentParser(description='checks the generator end to end')
+    parser.add_argument('-v', action='store_true',
+            help='print the checks that passed too')
+    args = vars(parser.parse_args())
+    failed = 0
+    total = 0
+    for checks in CHECKS:
+        for description, check in checks():
+            total += 1
+            try:
+                check()
+            except check_failed as e:
+                failure = str(e)
+            except Exception as e:
+                failure = '{}: {}'.format(type(e).__name__, e)
+            else:
+                if args['v']:
+                    print('ok   {}'.format(description))
+                continue
+            failed += 1
+            print('FAIL {}: {}'.format(description, failure))
+    print('{} of {} checks failed'.format(failed, total) if failed else 'all {} checks passed'.format(total))
+    if failed:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
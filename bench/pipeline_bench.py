@@ -0,0 +1,283 @@
+#!/usr/bin/env python3
+'''
+Author: nilputs@nilput.com
+see COPYRIGHTS file which is included in this project
+'''
+'''
+ times every phase of the generator on synthetic grammars (synth_grammar.py) of growing size and shape
+ and on any grammar files given with --grammar
+
+ the phases:
+    token_source        tokenizing the whole grammar file on its own
+    grammar             grammar_parser().grammar(), which tokenizes as it parses
+    extract_bnf
+    create_states       with lr1 this includes the first and follow sets that its closures need
+    first_follow        generate_first() and generate_follow(), computed from scratch
+    generate_slr_table  (the first and follow sets are already computed)
+    emit_c              generate_C_data() and generate_C_code() into memory
+ every phase is the best of --repeat runs of the whole pipeline
+
+ the results are written as json with --out, and --compare OLD.json reports the phases that got slower
+ than they were in OLD.json, so runs of different versions of the generator can be compared
+
+ usage:
+    pipeline_bench.py --out before.json
+    (change the generator)
+    pipeline_bench.py --out after.json --compare before.json
+'''
+import os
+import io
+import sys
+import json
+import time
+import argparse
+import platform
+import contextlib
+import subprocess
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SRC = os.path.join(HERE, '..', 'src')
+sys.path.insert(0, SRC)
+import lrgen
+import generate_slr_c
+from synth_grammar import synth_grammar
+
+RESULTS_FORMAT = 1
+PHASES = ('token_source', 'grammar', 'extract_bnf', 'create_states', 'first_follow', 'generate_slr_table', 'emit_c')
+
+#every sweep varies one parameter of BASE
+BASE = {'rules': 50, 'alternatives': 3, 'depth': 4, 'literals': 20}
+SWEEPS = {
+    'rules':        (25, 50, 100, 200, 400),
+    'alternatives': (1, 2, 4, 8),
+    'depth':        (1, 4, 16, 50),
+    'literals':     (5, 20, 100, 500),
+}
+QUICK_SWEEPS = {
+    'rules':        (25, 50, 100),
+    'alternatives': (1, 3),
+    'depth':        (1, 4),
+    'literals':     (5, 20),
+}
+#phases faster than this are too noisy to be compared
+COMPARE_MIN_SECONDS = 0.002
+
+def synth_cases(sweeps, seed=0):
+    '''
+    [(name, params, grammar text), ...] of every point of sweeps, the points that the sweeps share are run once
+    '''
+    cases = []
+    seen = set()
+    for param, values in sweeps.items():
+        for value in values:
+            params = dict(BASE, seed=seed)
+            params[param] = value
+            name = ' '.join('{}={}'.format(key, params[key]) for key in BASE)
+            if name not in seen:
+                seen.add(name)
+                cases.append((name, params, synth_grammar(**params)))
+    return cases
+
+def run_pipeline(text, filename, algorithm, table_format):
+    '''
+    runs every phase once, returns ({phase: seconds}, sizes)
+    '''
+    seconds = {}
+    clock = time.perf_counter
+
+    t = clock()
+    tsrc = lrgen.token_source(text, filename)
+    tokens = 0
+    while tsrc.next_token():
+        tokens += 1
+    seconds['token_source'] = clock() - t
+
+    t = clock()
+    ast = lrgen.grammar_parser(lrgen.token_source(text, filename)).grammar()
+    seconds['grammar'] = clock() - t
+
+    t = clock()
+    bnf = lrgen.extract_bnf(ast)
+    seconds['extract_bnf'] = clock() - t
+
+    t = clock()
+    ctx = lrgen.create_states(bnf, algorithm)
+    seconds['create_states'] = clock() - t
+
+    #lr1's create_states() computes the sets for its closures, they're computed again so that this phase is timed
+    ctx.sets = None
+    t = clock()
+    first = lrgen.generate_first(ctx)
+    lrgen.generate_follow(first, ctx)
+    seconds['first_follow'] = clock() - t
+
+    t = clock()
+    table = lrgen.generate_slr_table(ctx, algorithm)
+    seconds['generate_slr_table'] = clock() - t
+
+    t = clock()
+    out = io.StringIO()
+    with contextlib.redirect_stdout(out):
+        generate_slr_c.generate_C_data(table, table_format)
+        generate_slr_c.generate_C_code(table, table_format)
+    seconds['emit_c'] = clock() - t
+
+    sizes = {
+        'grammar_bytes': len(text),
+        'tokens':        tokens,
+        'symbols':       len(table.index_to_symbol),
+        'rules':         len(table.index_to_rule),
+        'states':        len(table.index_to_state),
+        'unique_rows':   len(table.unique_rows),
+        'c_bytes':       len(out.getvalue()),
+    }
+    return seconds, sizes
+
+def bench_case(name, params, text, algorithm, table_format, repeat):
+    '''
+    the result of a grammar, the best time of every phase over repeat runs
+    a grammar that the generator rejects (conflicts, syntax errors) has its error instead of timings
+    '''
+    result = {'name': name, 'params': params, 'algorithm': algorithm, 'table': table_format}
+    best = {}
+    stderr = io.StringIO()
+    try:
+        with contextlib.redirect_stderr(stderr):
+            for i in range(repeat):
+                seconds, sizes = run_pipeline(text, name, algorithm, table_format)
+                for phase in PHASES:
+                    best[phase] = min(best.get(phase, seconds[phase]), seconds[phase])
+    except SystemExit:
+        result['error'] = stderr.getvalue().strip() or 'exited'
+        return result
+    except Exception as e:
+        result['error'] = '{}: {}'.format(type(e).__name__, e)
+        return result
+    best['total'] = sum(best[phase] for phase in PHASES)
+    result['seconds'] = best
+    result['sizes'] = sizes
+    return result
+
+def revision():
+    '''
+    the git revision of the tree the generator is in, None outside of a git checkout
+    '''
+    try:
+        rev = subprocess.run(['git', 'describe', '--always', '--dirty'], cwd=HERE,
+                             stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, universal_newlines=True)
+    except OSError:
+        return None
+    return rev.stdout.strip() or None
+
+def print_result(result):
+    if 'error' in result:
+        print('{:<48} {:<5} error: {}'.format(result['name'], result['algorithm'], result['error'].splitlines()[0]))
+        return
+    seconds = result['seconds']
+    print('{:<48} {:<5} {:>6} {:>6}'.format(result['name'], result['algorithm'],
+                                         result['sizes']['states'], result['sizes']['unique_rows']),
+          ' '.join('{:9.4f}'.format(seconds[phase]) for phase in PHASES + ('total',)))
+
+def print_header():
+    names = ('tokens', 'grammar', 'bnf', 'states', 'sets', 'table', 'emit_c', 'total')
+    print('{:<48} {:<5} {:>6} {:>6}'.format('grammar', 'alg', 'states', 'rows'),
+          ' '.join('{:>9}'.format(name) for name in names))
+
+def compare(results, old_results, threshold):
+    '''
+    prints the phases that are more than threshold times slower than in old_results, returns how many
+    '''
+    old = {(r['name'], r['algorithm'], r.get('table')): r for r in old_results if 'seconds' in r}
+    slower = 0
+    for result in results:
+        prev = old.get((result['name'], result['algorithm'], result.get('table')))
+        if prev is None or 'seconds' not in result:
+            continue
+        for phase in PHASES + ('total',):
+            before = prev['seconds'].get(phase)
+            after = result['seconds'][phase]
+            if before is None or max(before, after) < COMPARE_MIN_SECONDS:
+                continue
+            if after > before * threshold:
+                slower += 1
+                print('slower: {} {} {}: {:.4f}s -> {:.4f}s ({:.2f}x)'.format(
+                      result['name'], result['algorithm'], phase, before, after, after / before))
+    return slower
+
+def parse_sweep(definition):
+    name, eq, values = definition.partition('=')
+    if not eq or name not in BASE:
+        raise argparse.ArgumentTypeError('expected one of {} =VALUE,VALUE...'.format(', '.join(BASE)))
+    try:
+        return name, tuple(int(value) for value in values.split(','))
+    except ValueError:
+        raise argparse.ArgumentTypeError('the values of {} are integers'.format(name))
+
+def main():
+    parser = argparse.ArgumentParser(description='times the phases of the generator on grammars of growing size')
+    parser.add_argument('--algorithm', action='append', default=None, choices=lrgen.ALGORITHMS,
+            help='can be repeated, slr by default')
+    parser.add_argument('--table', default='dense', choices=generate_slr_c.TABLE_FORMATS,
+            help='layout of the emitted C table')
+    parser.add_argument('--repeat', type=int, default=3,
+            help='the best of this many runs is reported')
+    parser.add_argument('--quick', action='store_true',
+            help='smaller sweeps')
+    parser.add_argument('--sweep', action='append', default=None, type=parse_sweep, metavar='PARAM=N,N,...',
+            help='runs these sweeps instead of the default ones, PARAM is one of: {}'.format(', '.join(BASE)))
+    parser.add_argument('--no-synth', action='store_true',
+            help='only the --grammar files')
+    parser.add_argument('--grammar', action='append', default=[], metavar='FILE',
+            help='also time a grammar file, can be repeated')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', default=None, metavar='FILE',
+            help='where the results are written as json')
+    parser.add_argument('--compare', default=None, metavar='FILE',
+            help='the json of a previous run, the phases that got slower are reported and the exit status is 1')
+    parser.add_argument('--threshold', type=float, default=1.25,
+            help='how many times slower a phase has to be to be reported by --compare')
+    args = vars(parser.parse_args())
+
+    cases = []
+    if not args['no_synth']:
+        sweeps = dict(args['sweep']) if args['sweep'] else QUICK_SWEEPS if args['quick'] else SWEEPS
+        cases += synth_cases(sweeps, args['seed'])
+    for path in args['grammar']:
+        with open(path) as f:
+            cases.append((path, None, f.read()))
+
+    results = []
+    print_header()
+    for algorithm in args['algorithm'] or ['slr']:
+        for name, params, text in cases:
+            result = bench_case(name, params, text, algorithm, args['table'], args['repeat'])
+            print_result(result)
+            results.append(result)
+
+    report = {
+        'format':    RESULTS_FORMAT,
+        'created':   time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'revision':  revision(),
+        'generator': generate_slr_c.generator_digest().hex(),
+        'python':    platform.python_version(),
+        'platform':  platform.platform(),
+        'repeat':    args['repeat'],
+        'phases':    list(PHASES),
+        'results':   results,
+    }
+    if args['out']:
+        with open(args['out'], 'w') as f:
+            json.dump(report, f, indent=1)
+            f.write('\n')
+    if args['compare']:
+        with open(args['compare']) as f:
+            old = json.load(f)
+        if old.get('format') != RESULTS_FORMAT:
+            lrgen.err('{} has results of another format'.format(args['compare']))
+        slower = compare(results, old['results'], args['threshold'])
+        print('{} phase(s) slower than {} ({})'.format(slower, args['compare'], old.get('revision')))
+        if slower:
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
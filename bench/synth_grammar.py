@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+'''
+Author: nilputs@nilput.com
+see COPYRIGHTS file which is included in this project
+'''
+'''
+ generates synthetic grammars of a given shape, for measuring how the generator scales (see pipeline_bench.py)
+
+ the nonterminals are split into depth levels, the alternatives of a level refer to the nonterminals of deeper levels
+ (and with probability recursion to any nonterminal), so depth is how deep the derivations nest
+ every alternative begins and ends with a literal of its own, which keeps the grammars conflict free (even LR(0)),
+ between them are nonterminals and literals drawn from a shared pool of literals
+
+ the output only depends on the parameters and the seed
+
+ usage:
+    synth_grammar.py --rules 200 --alternatives 4 --depth 8 --literals 50 > big.gram
+'''
+import sys
+import random
+import argparse
+
+def nonterminal_name(n):
+    '''
+    identifiers can't have digits, the nonterminals are named Na, Nb, ... Nz, Naa, ...
+    '''
+    name = ''
+    n += 1
+    while n:
+        n, r = divmod(n - 1, 26)
+        name = chr(ord('a') + r) + name
+    return 'N' + name
+
+def synth_grammar(rules=50, alternatives=3, depth=4, literals=20, length=4, recursion=0.1, seed=0):
+    '''
+    the text of a grammar with:
+        rules         nonterminals
+        alternatives  alternatives per nonterminal
+        depth         levels of nonterminals (1 to rules), the start symbol is at the top
+        literals      size of the shared pool of literals, besides the begin and end literal of every alternative
+        length        the most symbols between the begin and end literals of an alternative
+        recursion     probability that a nonterminal in an alternative may be any nonterminal, not just a deeper one
+    '''
+    if rules < 1 or alternatives < 1 or length < 0:
+        raise ValueError('a grammar needs at least one rule with one alternative')
+    depth = max(1, min(depth, rules))
+    rng = random.Random(seed)
+    level = [i * depth // rules for i in range(rules)]
+    deeper = [[n for n in range(rules) if level[n] > level[i]] for i in range(rules)]
+
+    lines = ['_START -> {} _END'.format(nonterminal_name(0))]
+    unique = 0
+    for i in range(rules):
+        bodies = []
+        for k in range(alternatives):
+            seq = ["'b{}'".format(unique)]
+            for j in range(rng.randint(0, length)):
+                candidates = deeper[i]
+                if rng.random() < recursion:
+                    candidates = range(rules)
+                if literals and (not candidates or rng.random() < 0.3):
+                    seq.append("'c{}'".format(rng.randrange(literals)))
+                elif candidates:
+                    seq.append(nonterminal_name(rng.choice(candidates)))
+            seq.append("'e{}'".format(unique))
+            unique += 1
+            bodies.append('{} {{ $$.n = {}; }}'.format(' '.join(seq), k))
+        lines.append('{} -> {}'.format(nonterminal_name(i), '\n    | '.join(bodies)))
+    return '\n'.join(lines) + '\n'
+
+def synth_args(parser):
+    '''
+    adds the parameters of synth_grammar() to an argparse parser
+    '''
+    parser.add_argument('--rules', type=int, default=50,
+            help='number of nonterminals')
+    parser.add_argument('--alternatives', type=int, default=3,
+            help='alternatives per nonterminal')
+    parser.add_argument('--depth', type=int, default=4,
+            help='levels that the nonterminals refer down through')
+    parser.add_argument('--literals', type=int, default=20,
+            help='size of the shared pool of literals')
+    parser.add_argument('--length', type=int, default=4,
+            help='the most symbols in the middle of an alternative')
+    parser.add_argument('--recursion', type=float, default=0.1,
+            help='probability of referring to any nonterminal instead of a deeper one')
+    parser.add_argument('--seed', type=int, default=0)
+
+def main():
+    parser = argparse.ArgumentParser(description='prints a synthetic grammar')
+    synth_args(parser)
+    args = vars(parser.parse_args())
+    sys.stdout.write(synth_grammar(**args))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+'''
+compares the table driven parsers with the direct coded one on the same grammar and input,
+each with the actions in functions and inlined (--inline-actions),
+the input is given both through a pipe (read() in blocks) and as a file (mmap)
+usage: bench.py [--terms N] [--runs N] [--cc CC]
+'''
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+import subprocess
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+GENERATOR = os.path.join(HERE, '..', '..', 'src', 'generate_slr_c.py')
+TABLE_FORMATS = ('dense', 'comb', 'compact', 'direct')
+VARIANTS = [(table_format, flags) for table_format in TABLE_FORMATS for flags in ([], ['--inline-actions'])]
+
+def make_input(terms, seed=0):
+    '''
+    a long expression like 1+2*3+(4+5)*6 ... ;
+    '''
+    rng = random.Random(seed)
+    parts = []
+    for i in range(terms):
+        if rng.random() < 0.2:
+            parts.append('({}+{})'.format(rng.randint(1, 9), rng.randint(1, 9)))
+        else:
+            parts.append(str(rng.randint(1, 9)))
+        parts.append('*' if rng.random() < 0.3 else '+')
+    parts[-1] = ';'
+    return ''.join(parts).encode()
+
+def build(workdir, grammar, table_format, flags, cc):
+    name = '.'.join([table_format] + [flag.strip('-') for flag in flags])
+    src = os.path.join(workdir, 'parse.{}.c'.format(name))
+    exe = os.path.join(workdir, 'parse.{}'.format(name))
+    with open(src, 'w') as f:
+        subprocess.check_call([sys.executable, GENERATOR, '--in', grammar, '--table', table_format] + flags, stdout=f)
+    subprocess.check_call([cc, '-O2', '-w', '-I', HERE, '-o', exe, src])
+    return exe
+
+def run(exe, data, runs, path=None):
+    '''
+    the input is piped when path is None, otherwise it's the file at path (which holds data)
+    returns (best seconds, output)
+    '''
+    best = None
+    for i in range(runs):
+        t = time.perf_counter()
+        if path is None:
+            out = subprocess.run([exe], input=data, stdout=subprocess.PIPE).stdout
+        else:
+            out = subprocess.run([exe, path], stdout=subprocess.PIPE).stdout
+        t = time.perf_counter() - t
+        best = t if best is None else min(best, t)
+    return best, out
+
+def main():
+    parser = argparse.ArgumentParser(description='table driven vs direct coded parser benchmark')
+    parser.add_argument('--in', default=os.path.join(HERE, 'bench.gram'),
+            help='grammar file')
+    parser.add_argument('--terms', type=int, default=1000000,
+            help='number of terms in the input expression')
+    parser.add_argument('--runs', type=int, default=5,
+            help='best of this many runs is reported')
+    parser.add_argument('--cc', default=os.environ.get('CC', 'cc'))
+    args = vars(parser.parse_args())
+
+    data = make_input(args['terms'])
+    print('input: {} bytes'.format(len(data)))
+    with tempfile.TemporaryDirectory() as workdir:
+        path = os.path.join(workdir, 'input')
+        with open(path, 'wb') as f:
+            f.write(data)
+        expected = None
+        print('{:<26} {:>10} {:>10}'.format('', 'pipe MB/s', 'file MB/s'))
+        for table_format,flags in VARIANTS:
+            exe = build(workdir, args['in'], table_format, flags, args['cc'])
+            name = ' '.join([table_format] + flags)
+            speeds = []
+            for input_path in (None, path):
+                seconds, out = run(exe, data, args['runs'], input_path)
+                if expected is None:
+                    expected = out
+                if out != expected:
+                    print('{}: output differs from {}'.format(name, VARIANTS[0][0]))
+                speeds.append(len(data) / seconds / 1e6)
+            print('{:<26} {:10.1f} {:10.1f}'.format(name, *speeds))
+
+if __name__ == '__main__':
+    main()
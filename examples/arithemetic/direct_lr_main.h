@@ -0,0 +1,6 @@
+
+static int parser_run(struct parse_info_s *p, int push)
+{
+    //see parse.h
+    return direct_parse(p, push);
+}
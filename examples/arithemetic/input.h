@@ -0,0 +1,121 @@
+//the input of the generated lexer
+//regular files are memory mapped, anything else (pipes, terminals) is read() in large blocks
+//the lexer sees data[beg..end) and asks for more with input_more()
+#include <fcntl.h>
+#include <unistd.h>
+#include <errno.h>
+#include <sys/stat.h>
+#ifndef INPUT_NO_MMAP
+#include <sys/mman.h>
+#endif
+
+#ifndef INPUT_BLOCK
+#define INPUT_BLOCK (1 << 16)
+#endif
+
+struct input_s{
+    const char *data;
+    size_t beg; //what the lexer didn't consume yet
+    size_t end; //how much of data holds input
+    int eof;
+    int fd;
+    //read() mode
+    char *buf;
+    size_t cap;
+    //mmap mode
+    void *map;
+    size_t map_len;
+};
+
+static int input_open(struct input_s *in, const char *path){
+    //path is NULL for stdin, returns 0 on success, -1 on failure (errno is set)
+    struct stat st;
+    memset(in, 0, sizeof(*in));
+    in->fd = path ? open(path, O_RDONLY) : 0;
+    if (in->fd < 0){
+        return -1;
+    }
+#ifndef INPUT_NO_MMAP
+    if (fstat(in->fd, &st) == 0 && S_ISREG(st.st_mode) && st.st_size > 0){
+        void *map = mmap(NULL, st.st_size, PROT_READ, MAP_PRIVATE, in->fd, 0);
+        if (map != MAP_FAILED){
+#ifdef MADV_SEQUENTIAL
+            madvise(map, st.st_size, MADV_SEQUENTIAL);
+#endif
+            in->map     = map;
+            in->map_len = st.st_size;
+            in->data    = map;
+            in->end     = st.st_size;
+            in->eof     = 1;
+            return 0;
+        }
+    }
+#endif
+    in->cap  = INPUT_BLOCK;
+    in->buf  = malloc(in->cap);
+    if (!in->buf){
+        return -1;
+    }
+    in->data = in->buf;
+    return 0;
+}
+
+static void input_open_mem(struct input_s *in, const char *data, size_t len){
+    //an input that's already in memory, data has to stay valid until input_close()
+    memset(in, 0, sizeof(*in));
+    in->data = data;
+    in->end  = len;
+    in->eof  = 1;
+}
+
+static int input_more(struct input_s *in){
+    //reads a block after in->end, discarding what's before in->beg (so in->beg may change)
+    //returns 0 at the end of the input
+    ssize_t r;
+    if (in->eof){
+        return 0;
+    }
+    if (in->beg == in->end){
+        in->beg = in->end = 0;
+    }
+    else if (in->end == in->cap){
+        if (in->beg > 0){
+            memmove(in->buf, in->buf + in->beg, in->end - in->beg);
+            in->end -= in->beg;
+            in->beg = 0;
+        }
+        else{
+            //a token that doesn't fit in the buffer
+            char *buf = realloc(in->buf, in->cap * 2);
+            if (!buf){
+                in->eof = 1;
+                return 0;
+            }
+            in->buf = buf;
+            in->cap *= 2;
+        }
+    }
+    do{
+        r = read(in->fd, in->buf + in->end, in->cap - in->end);
+    } while (r < 0 && errno == EINTR);
+    if (r <= 0){
+        in->eof = 1;
+        return 0;
+    }
+    in->data = in->buf;
+    in->end += r;
+    return 1;
+}
+
+static void input_close(struct input_s *in){
+#ifndef INPUT_NO_MMAP
+    if (in->map){
+        munmap(in->map, in->map_len);
+    }
+#endif
+    free(in->buf);
+    if (in->fd > 0){
+        close(in->fd);
+    }
+    memset(in, 0, sizeof(*in));
+}
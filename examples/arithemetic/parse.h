@@ -1,25 +1,46 @@
 #include <stdlib.h>
 #include <stdio.h>
 #include <string.h>
+#include <stdint.h>
 #include "data_struct.h" //a user defined struct named pdata_s
+#include "input.h"
 
 struct state_stack_entry_s{
     int state;
 };
+//both stacks live on the heap and grow as needed, they always have room for 2 more entries
 struct state_stack_s{
-    struct state_stack_entry_s data[STACKLEN];
+    struct state_stack_entry_s *data;
     int idx;
 };
 
 struct symbol_stack_s{
-    struct pdata_s data[STACKLEN];
+    struct pdata_s *data;
     int idx;
 };
 
+struct lexer_s{
+    struct input_s *in; //see input.h
+    const char *text;   //the last token, not 0 terminated, valid until the next token is read
+    size_t len;
+};
+
+//everything about a parse, so parses don't share state (one parse_info_s is used by one thread at a time)
 struct parse_info_s{
     struct state_stack_s state_stack;
     struct symbol_stack_s symbol_stack;
+    int stack_cap;
     int next_input;
+    struct pdata_s next_value; //what's shifted for next_input (its .input is set to the symbol)
+    struct lexer_s lexer;
+};
+
+//what parser_parse() returns
+enum PARSE_RESULT{
+    PARSE_ACCEPT = 0,
+    PARSE_REJECT = 1, //a syntax error
+    PARSE_ERROR  = 2, //out of memory, or a broken table
+    PARSE_NEED_MORE = 3, //parser_push() wants the next token
 };
 
 struct action_s{
@@ -37,56 +58,146 @@ struct state_table_s{
 };
 
 
-struct state_table_s states[];
-struct rule_s rules_data[];
+extern const struct rule_s rules_data[];
+
+//defined by the generated code, it knows how the table is laid out (dense, comb or compact)
+//lookup_goto() returns -1 when there's no goto
+static struct action_s lookup_action(int state, int symbol);
+static int lookup_goto(int state, int symbol);
+int next_input(struct lexer_s *lx);
 
 
 
-void reduce_action(struct parse_info_s *p, int rule_num);
+//returns the state that was before the rule's symbols, the caller stores the goto state at p->state_stack.idx
+//or -1 on failure (out of memory, an unknown rule)
+//generated when the actions are inlined (INLINE_ACTIONS)
+static int state_stack_reduce(struct parse_info_s *p, int rule_num);
+int reduce_action(struct parse_info_s *p, int rule_num);
 
-static void syntax_error(){
-    printf("a syntax error has occured\n");
-    exit(1);
+static int parse_stacks_reserve(struct parse_info_s *p){
+    //makes room for 2 more entries above idx, returns -1 when out of memory
+    int cap;
+    struct state_stack_entry_s *states;
+    struct pdata_s *symbols;
+    if (p->state_stack.idx + 3 < p->stack_cap){
+        return 0;
+    }
+    cap = p->stack_cap * 2;
+    states = realloc(p->state_stack.data, cap * sizeof(*states));
+    if (!states){
+        return -1;
+    }
+    p->state_stack.data = states;
+    symbols = realloc(p->symbol_stack.data, cap * sizeof(*symbols));
+    if (!symbols){
+        return -1;
+    }
+    p->symbol_stack.data = symbols;
+    p->stack_cap = cap;
+    return 0;
 }
-static void runtime_error(){
-    printf("a runtime error has occured\n");
-    exit(2);
+
+int parser_init(struct parse_info_s *p){
+    //returns 0 on success, -1 when out of memory
+    memset(p, 0, sizeof(*p));
+    p->stack_cap = STACKLEN;
+    p->state_stack.data  = malloc(p->stack_cap * sizeof(*p->state_stack.data));
+    p->symbol_stack.data = malloc(p->stack_cap * sizeof(*p->symbol_stack.data));
+    if (!p->state_stack.data || !p->symbol_stack.data){
+        free(p->state_stack.data);
+        free(p->symbol_stack.data);
+        return -1;
+    }
+    return 0;
 }
 
+void parser_free(struct parse_info_s *p){
+    free(p->state_stack.data);
+    free(p->symbol_stack.data);
+    memset(p, 0, sizeof(*p));
+}
+
+static void parser_reset(struct parse_info_s *p, struct input_s *in){
+    //the start of a parse, the stacks are kept
+    memset(p->state_stack.data, 0, sizeof(*p->state_stack.data));
+    memset(p->symbol_stack.data, 0, sizeof(*p->symbol_stack.data));
+    p->state_stack.idx  = 0;
+    p->symbol_stack.idx = 0;
+    p->next_input = NO_INPUT; //the lookahead is only read when the current state needs it
+    memset(&p->next_value, 0, sizeof(p->next_value));
+    p->lexer.in   = in;
+    p->lexer.text = NULL;
+    p->lexer.len  = 0;
+}
 
-static void state_stack_pushpop(struct parse_info_s *p){
-    // adds [new] at the end, executes user action, then gets rid of [...old2, old1], and moves new to where the old rule started
 
-    //the rule we're reducing according to
-    int rule_num           = states[p->state_stack.data[p->state_stack.idx].state].actions[p->next_input].target; 
-    int production_sym     = rules_data[rule_num].rule_lhs;
+#ifndef INLINE_ACTIONS
+static int state_stack_reduce(struct parse_info_s *p, int rule_num){
+    // adds [new] at the end, executes user action, then gets rid of [...old2, old1], and moves new to where the old rule started
+    // rule_num is the rule we're reducing according to
+    // returns the state that was before the rule's symbols, the caller stores the goto state at p->state_stack.idx
     int rule_len           = rules_data[rule_num].rule_length;
     int rule_begin_idx     = p->state_stack.idx - rule_len + 1;
-    //the state before the rule's symbols determines where we go next
-    if (states[p->state_stack.data[rule_begin_idx - 1].state].actions[production_sym].action != EA_GOTO){
-        runtime_error();
+    int prev_state         = p->state_stack.data[rule_begin_idx - 1].state;
+    if (rule_len == 0 && parse_stacks_reserve(p) != 0){
+        return -1;
     }
-    int goto_state = states[p->state_stack.data[rule_begin_idx - 1].state].actions[production_sym].target;
     p->symbol_stack.idx++;
-    p->state_stack.data[++p->state_stack.idx].state = goto_state;
+    p->state_stack.idx++;
 
-    reduce_action(p, rule_num); //modfies whats at p->stack.idx
+    if (reduce_action(p, rule_num) != 0){ //modfies whats at p->stack.idx
+        return -1;
+    }
     if (rule_len > 0){
         //overwrite whats after prev_top
-        memcpy(p->state_stack.data + rule_begin_idx, p->state_stack.data + p->state_stack.idx, sizeof(struct state_stack_entry_s)); 
         memcpy(p->symbol_stack.data + rule_begin_idx, p->symbol_stack.data + p->symbol_stack.idx, sizeof(struct pdata_s)); 
         p->state_stack.idx  = rule_begin_idx;
         p->symbol_stack.idx = rule_begin_idx;
     }
+    return prev_state;
 }
+#endif
 
+static int state_stack_shift(struct parse_info_s *p, int input, int state){
+    //returns -1 when out of memory
+    if (parse_stacks_reserve(p) != 0){
+        return -1;
+    }
+    p->symbol_stack.data[++p->symbol_stack.idx] = p->next_value;
+    p->symbol_stack.data[p->symbol_stack.idx].input = input;
+    p->state_stack.data[++p->state_stack.idx].state = state;
+    return 0;
+}
 
-static void accept(struct parse_info_s *p){
-    printf("accepted\n");
-    exit(0);
+//runs the parser until it accepts, rejects or fails
+//the lookahead is p->next_input, when it's NO_INPUT and push is 0 it's read from p->lexer,
+//when push is 1 PARSE_NEED_MORE is returned instead and the parse can be resumed later
+//defined by simple_lr_main.h or direct_lr_main.h
+static int parser_run(struct parse_info_s *p, int push);
+
+int parser_parse(struct parse_info_s *p, struct input_s *in){
+    //parses in from its start, returns a PARSE_RESULT, p can be used again for the next input
+    parser_reset(p, in);
+    return parser_run(p, 0);
+}
+
+//the push interface, for when the tokens come from the caller:
+//    parser_start(&pr);
+//    while ((result = parser_push(&pr, token, &value)) == PARSE_NEED_MORE) ...
+//the last token pushed is _END, parser_start() starts the next parse
+void parser_start(struct parse_info_s *p){
+    parser_reset(p, NULL);
 }
 
-static void reject(struct parse_info_s *p){
-    printf("rejected\n");
-    exit(1);
+int parser_push(struct parse_info_s *p, int token, const struct pdata_s *value){
+    //token is a symbol (T_id, T_LITERAL_n, ... _END), value is its semantic value (can be NULL)
+    //returns PARSE_NEED_MORE when the token was consumed, otherwise a PARSE_RESULT
+    if (value){
+        p->next_value = *value;
+    }
+    else{
+        memset(&p->next_value, 0, sizeof(p->next_value));
+    }
+    p->next_input = token;
+    return parser_run(p, 1);
 }
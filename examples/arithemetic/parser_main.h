@@ -0,0 +1,27 @@
+
+//an example program, parses the file given as the first argument (or stdin)
+int main(int argc, const char **argv)
+{
+    struct parse_info_s pr;
+    struct input_s in;
+    int result;
+
+    if (input_open(&in, argc > 1 ? argv[1] : NULL) != 0){
+        perror(argv[1]);
+        return 2;
+    }
+    if (parser_init(&pr) != 0){
+        input_close(&in);
+        printf("out of memory\n");
+        return 2;
+    }
+    result = parser_parse(&pr, &in);
+    switch (result){
+    case PARSE_ACCEPT: printf("accepted\n"); break;
+    case PARSE_REJECT: printf("rejected\n"); break;
+    default:           printf("a runtime error has occured\n"); break;
+    }
+    parser_free(&pr);
+    input_close(&in);
+    return result;
+}
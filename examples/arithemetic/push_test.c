@@ -0,0 +1,66 @@
+//tests parser_push(): the tokens of every input are read with the lexer and pushed one at a time,
+//every token but _END has to give PARSE_NEED_MORE and the single _END the result of the parse
+//PARSER_C is the generated parser, see the test target of the Makefile
+#define PARSER_NO_MAIN
+#include PARSER_C
+
+struct push_case_s{
+    const char *text;
+    int result;
+};
+
+static const struct push_case_s push_cases[] = {
+    { "1+2;",          PARSE_ACCEPT },
+    { "(1+2)*3;",      PARSE_ACCEPT },
+    { "2*(3+4)*5+6;",  PARSE_ACCEPT },
+    { "((9));",        PARSE_ACCEPT },
+    { "1+;",           PARSE_REJECT },
+    { "(1+2;",         PARSE_REJECT },
+};
+
+static int push_input(struct parse_info_s *pr, const char *text){
+    //returns the result of the parse, or -1 when it ended before or after the _END push
+    struct input_s in;
+    struct lexer_s lx;
+    int token;
+    int result = PARSE_NEED_MORE;
+    input_open_mem(&in, text, strlen(text));
+    memset(&lx, 0, sizeof(lx));
+    lx.in = &in;
+    parser_start(pr);
+    do{
+        token = next_input(&lx); //LEX_ERROR is pushed too, it's rejected
+        result = parser_push(pr, token, NULL);
+        if (token != _END && result != PARSE_NEED_MORE && result != PARSE_REJECT){
+            result = -1;
+            break;
+        }
+    } while (token != _END && result == PARSE_NEED_MORE);
+    if (result == PARSE_NEED_MORE){
+        result = -1;
+    }
+    input_close(&in);
+    return result;
+}
+
+int main(void)
+{
+    struct parse_info_s pr;
+    size_t i;
+    int result;
+    int failed = 0;
+    if (parser_init(&pr) != 0){
+        printf("out of memory\n");
+        return 2;
+    }
+    //the same parse_info_s for every input, parser_start() starts each one over
+    for (i = 0; i < sizeof(push_cases) / sizeof(push_cases[0]); i++){
+        result = push_input(&pr, push_cases[i].text);
+        if (result != push_cases[i].result){
+            fprintf(stderr, "FAIL %s: got %d, expected %d\n", push_cases[i].text, result, push_cases[i].result);
+            failed = 1;
+        }
+    }
+    parser_free(&pr);
+    return failed;
+}
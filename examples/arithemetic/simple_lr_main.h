@@ -1,84 +1,112 @@
 
-int main(int argc, const char **argv)
+static int state_stack_pushpop(struct parse_info_s *p, int rule_num){
+    //returns -1 on failure
+    int production_sym = rules_data[rule_num].rule_lhs;
+    int prev_state     = state_stack_reduce(p, rule_num);
+    int goto_state;
+    if (prev_state < 0){
+        return -1;
+    }
+    goto_state = lookup_goto(prev_state, production_sym);
+    if (goto_state < 0){
+        return -1;
+    }
+    p->state_stack.data[p->state_stack.idx].state = goto_state;
+    return 0;
+}
+
+static int parser_run(struct parse_info_s *p, int push)
 {
+    //see parse.h
     int top;
     int rule_num;
-    int lhs; //left hand side of a rule
+    struct action_s act;
 
-    struct parse_info_s pr = {0}; //all indices should be 0
-    pr.symbol_stack.idx = 0;
-    pr.state_stack.idx = 0;
-    top = 0;
-    pr.next_input = next_input();
     while (1){
-        top = pr.state_stack.data[pr.state_stack.idx].state;
+        top = p->state_stack.data[p->state_stack.idx].state;
 
 
         //safety checks :)
-        if (top > STACKLEN){
+        if (top >= NUM_STATES){
 #ifdef DBG_PRINT
             printf("top %d, %s, exiting\n", top, represent(top));
 #endif
-            exit(1);
+            return PARSE_ERROR;
+        }
+        rule_num = default_reduction[top];
+        if (rule_num >= 0){
+#ifdef DBG_PRINT
+            printf("at state: %3d, reducing by rule: %3d without lookahead, stidx: %d, syidx: %d\n",
+                    top,
+                    rule_num,
+                    p->state_stack.idx,
+                    p->symbol_stack.idx);
+#endif
+            if (state_stack_pushpop(p, rule_num) != 0){
+                return PARSE_ERROR;
+            }
+            continue;
         }
-        if (pr.next_input > SYMBOLSMAX){
+        if (p->next_input == NO_INPUT){
+            if (push){
+                return PARSE_NEED_MORE;
+            }
+            p->next_input = next_input(&p->lexer);
+        }
+        if (p->next_input < 0 || p->next_input >= SYMBOLSMAX){
 #ifdef DBG_PRINT
             printf( "input: %d, %s, exiting\n",
                     top,
-                    represent(pr.next_input));
+                    represent(p->next_input));
 #endif
-            exit(1);
+            return PARSE_REJECT; //LEX_ERROR, input that no token matches
         }
 
-        if (states[top].actions[pr.next_input].action == EA_SHIFT){
+        act = lookup_action(top, p->next_input);
+        if (act.action == EA_SHIFT){
 #ifdef DBG_PRINT
             printf("at state: %3d, shifting state %3d, according to symbol: %s, stidx: %d, syidx: %d\n", top,
-                                                                                   states[top].actions[pr.next_input].target,
-                                                                                   represent(pr.next_input),
-                                                                                   pr.state_stack.idx,
-                                                                                   pr.symbol_stack.idx);
+                                                                                   act.target,
+                                                                                   represent(p->next_input),
+                                                                                   p->state_stack.idx,
+                                                                                   p->symbol_stack.idx);
                                                                                    
 #endif
-            pr.symbol_stack.data[++pr.symbol_stack.idx].input = pr.next_input;
-            pr.state_stack.data[++pr.state_stack.idx].state = states[top].actions[pr.next_input].target;
-            pr.next_input = next_input();
+            if (state_stack_shift(p, p->next_input, act.target) != 0){
+                return PARSE_ERROR;
+            }
+            if (p->next_input != _END){
+                //the input ends at _END, it stays the lookahead of the accept state (nothing is pushed after it)
+                p->next_input = NO_INPUT;
+            }
         }
-        else if(states[top].actions[pr.next_input].action == EA_REDUCE){
+        else if(act.action == EA_REDUCE){
 #ifdef DBG_PRINT
                 printf( "at state: %3d, reducing by rule: %3d, according to symbol: %s, stidx: %d, syidx: %d\n",
                         top,
-                        states[top].actions[pr.next_input].target,
-                        represent(pr.next_input),
-                        pr.state_stack.idx,
-                        pr.symbol_stack.idx);
+                        act.target,
+                        represent(p->next_input),
+                        p->state_stack.idx,
+                        p->symbol_stack.idx);
 #endif
 
-            state_stack_pushpop(&pr); 
-            top = pr.state_stack.data[pr.state_stack.idx].state;
-            /* if (pr.next_input == _END) */
-            /*     goto END; */
+            if (state_stack_pushpop(p, act.target) != 0){
+                return PARSE_ERROR;
+            }
         }
         else{
-            if(states[top].actions[pr.next_input].action == EA_ACC){
-                accept(&pr);
-                return 0;
+            if(act.action == EA_ACC){
+                return PARSE_ACCEPT;
             }
-            else if(states[top].actions[pr.next_input].action == EA_REJ){
-                reject(&pr);
-                return 1;
+            else if(act.action == EA_REJ){
+                return PARSE_REJECT;
             }
 #ifdef DBG_PRINT
-            printf("(action %s), at state: %3d, next_input = %s\nunknown action, exiting\n", represent(states[top].actions[pr.next_input].action),
+            printf("(action %s), at state: %3d, next_input = %s\nunknown action, exiting\n", represent(act.action),
                                                                                 top, 
-                                                                                represent(pr.next_input));
+                                                                                represent(p->next_input));
 #endif
-            return 1;
+            return PARSE_ERROR;
         }
     }
-
-END:
-
-
-
-    printf("\ndone\n");
 }
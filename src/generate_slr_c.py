@@ -5,25 +5,40 @@ see COPYRIGHTS file which is included in this project
 '''
 
 
+import os
+import io
 import sys
 import re
+import shlex
+import bisect
+import hashlib
 import argparse
+import itertools
+import contextlib
+import concurrent.futures
 import time
 from pprint import pprint as pprint
 from types import SimpleNamespace as nms
 sys.path.append('.')
 import lrgen
+import lexgen
+import table_cache
+import incremental
 from ids import *
 from format_types import indent
 
 DEBUG = 0
 
+#lex_accept[] values that aren't symbols, and what next_input() returns on bad input
+LEX_NONE  = -1
+LEX_SKIP  = -2
+LEX_ERROR = -3
+
 
 
-#not used
 def generate_C_rule_data(table):
     nprint('''\
-struct rule_s rules_data[] = {''')
+const struct rule_s rules_data[] = {''')
     for i,rule in enumerate(table.index_to_rule):
         # print(i, rule.lhs, file=sys.stderr) 
         # print(table.ctx.bnf.syms.get_symbol(rule.lhs).sym_num)
@@ -40,10 +55,10 @@ struct rule_s rules_data[] = {''')
 
 def generate_C_states_data(table):
     nprint('''\
-struct state_table_s states[{num_states}] = {{'''.format(num_states = len(table.rows)))
+static const struct state_table_s states[{num_rows}] = {{'''.format(num_rows = len(table.unique_rows)))
 
     nprint('\n')
-    for i,row in enumerate(table.rows):
+    for i,row in enumerate(table.unique_rows):
         nprint('''\
     {{''')
         for sym_idx,entry in enumerate(row):
@@ -58,7 +73,227 @@ struct state_table_s states[{num_states}] = {{'''.format(num_states = len(table.
     nprint(sc('''
     };
     '''))
+    nprint(sc('''
+static struct action_s lookup_action(int state, int symbol){
+    return states[state_row[state]].actions[symbol];
+}
+    '''))
+
+def comb_compress(table):
+    '''
+    compresses the table with row displacement (comb vectors, like yacc's tables):
+    every row gets a default action (its most common reduce, otherwise reject) that is left out of it,
+    the remaining entries of all rows are overlapped into one vector (.next), row i starting at .base[i],
+    .check[n] tells which row owns slot n (identical states share a row, see state_row)
+    lookup:
+        row = state_row[state]
+        n = base[row] + symbol
+        action = next[n] if check[n] == row else default[row]
+    '''
+    nsyms = len(table.index_to_symbol)
+    default = []
+    rows = []
+    #the entries of a row are read from its key (see lrgen.row_key()) instead of scanning every column
+    for row,key in zip(table.unique_rows, table.row_keys):
+        counts = {}
+        for col,action,number in key:
+            if action == EA_REDUCE:
+                counts[number] = counts.get(number, 0) + 1
+        dflt = None
+        if counts:
+            dflt = lrgen.mk_slr_entry(EA_REDUCE, max(counts, key=lambda n: (counts[n], -n)))
+        default.append(dflt)
+        rows.append([(col, row[col]) for col,action,number in key
+                     if not (dflt is not None and action == EA_REDUCE and number == dflt.number)])
+
+    base = [0] * len(rows)
+    check = []
+    nxt = []
+    free = [] #the free slots of check, in order
+    #the longest rows are placed first, each row goes to the first offset where all of its columns are free,
+    #the first column has to land on a free slot, so only those offsets are tried
+    for row_num in sorted(range(len(rows)), key=lambda i: (-len(rows[i]), i)):
+        cells = rows[row_num]
+        if not cells:
+            continue
+        first = cells[0][0]
+        offset = max(0, len(check) - first)
+        for i in range(bisect.bisect_left(free, first), len(free)):
+            candidate = free[i] - first
+            if all(candidate + col >= len(check) or check[candidate + col] == -1 for col,entry in cells):
+                offset = candidate
+                break
+        base[row_num] = offset
+        needed = offset + nsyms
+        if needed > len(check):
+            free.extend(range(len(check), needed))
+            check.extend([-1] * (needed - len(check)))
+            nxt.extend([None] * (needed - len(nxt)))
+        for col,entry in cells:
+            check[offset + col] = row_num
+            nxt[offset + col] = entry
+            del free[bisect.bisect_left(free, offset + col)]
+    if len(check) < nsyms:
+        check.extend([-1] * (nsyms - len(check)))
+        nxt.extend([None] * (nsyms - len(nxt)))
+
+    comb = nms()
+    comb.default = default
+    comb.base = base
+    comb.check = check
+    comb.next = nxt
+    return comb
+
+def C_action(entry):
+    if entry is None:
+        return '{ EA_REJ,EA_REJ }'
+    return '{{ {},{} }}'.format(entry.action, entry.number)
+
+def C_array(ctype, name, values, per_line=16):
+    s = 'static const {} {}[{}] = {{\n'.format(ctype, name, len(values))
+    for i in range(0, len(values), per_line):
+        s += '    ' + ','.join(str(v) for v in values[i:i+per_line]) + ',\n'
+    s += '};\n'
+    return s
 
+def C_int_type(values):
+    '''
+    the smallest signed integer type that can hold all of values
+    '''
+    lo = min(values, default=0)
+    hi = max(values, default=0)
+    for bits in (8, 16, 32):
+        if -(1 << (bits - 1)) <= lo and hi < (1 << (bits - 1)):
+            return 'int{}_t'.format(bits)
+    return 'int64_t'
+
+def C_array2d(ctype, name, rows, width):
+    s = 'static const {} {}[{}][{}] = {{\n'.format(ctype, name, len(rows), width)
+    for row in rows:
+        s += '    {' + ','.join(str(v) for v in row) + '},\n'
+    s += '};\n'
+    return s
+
+def terminals_first(table):
+    '''
+    renumbers the symbols of the table (.sym_num, .index_to_symbol and the columns of the rows)
+    so that the terminals come first, terminal n is then column n of the ACTION table
+    and nonterminal NUM_TERMINALS + n column n of the GOTO table
+    returns the number of terminals
+    '''
+    productions = table.ctx.bnf.productions
+    terminals = [s for s in table.index_to_symbol if s.name not in productions]
+    nonterminals = [s for s in table.index_to_symbol if s.name in productions]
+    order = terminals + nonterminals
+    old_nums = [s.sym_num for s in order]
+    for i,s in enumerate(order):
+        s.sym_num = i
+    table.index_to_symbol = order
+    table.unique_rows = [[row[n] for n in old_nums] for row in table.unique_rows]
+    new_nums = {old: new for new,old in enumerate(old_nums)}
+    table.row_keys = [tuple(sorted((new_nums[col], action, number) for col,action,number in key)) for key in table.row_keys]
+    table.rows = [table.unique_rows[i] for i in table.row_index]
+    return len(terminals)
+
+def compact_action(entry, num_rules):
+    '''
+    an ACTION entry as one integer:
+        0               reject
+        state + 1       shift
+        -(rule + 1)     reduce
+        -(num_rules+1)  accept
+    '''
+    if entry is None:
+        return 0
+    if entry.action == EA_SHIFT:
+        return entry.number + 1
+    if entry.action == EA_REDUCE:
+        return -(entry.number + 1)
+    if entry.action == EA_ACC:
+        return -(num_rules + 1)
+    raise ValueError('unexpected entry in the ACTION table: {}'.format(lrgen.pretty_slr_entry(entry)))
+
+def generate_C_compact_data(table, num_terminals):
+    '''
+    separate ACTION (terminals) and GOTO (nonterminals) tables of single integers (see compact_action()),
+    in the smallest integer types that fit, as static const data, a GOTO entry is the target state or -1
+    '''
+    num_rules = len(table.index_to_rule)
+    actions = [[compact_action(entry, num_rules) for entry in row[:num_terminals]] for row in table.unique_rows]
+    #-1 is no goto, like the lookup_goto() of the other layouts (0 is the start state)
+    gotos = [[entry.number if entry is not None else -1 for entry in row[num_terminals:]] for row in table.unique_rows]
+    nprint(sc('''
+enum {{
+    NUM_TERMINALS = {num_terminals},
+    ACTION_ACCEPT = {accept},
+}};
+    '''.format(num_terminals=num_terminals, accept=-(num_rules + 1))))
+    nprint(C_array2d(C_int_type(list(itertools.chain.from_iterable(actions))), 'action_table', actions, num_terminals))
+    nprint(C_array2d(C_int_type(list(itertools.chain.from_iterable(gotos))), 'goto_table', gotos, len(table.index_to_symbol) - num_terminals))
+    nprint(sc('''
+static struct action_s lookup_action(int state, int symbol){
+    struct action_s a;
+    int v = (symbol < NUM_TERMINALS) ? action_table[state_row[state]][symbol] : 0;
+    if (v > 0){
+        a.action = EA_SHIFT;
+        a.target = v - 1;
+    }
+    else if (v == ACTION_ACCEPT){
+        a.action = EA_ACC;
+        a.target = EA_ACC;
+    }
+    else if (v < 0){
+        a.action = EA_REDUCE;
+        a.target = -v - 1;
+    }
+    else{
+        a.action = EA_REJ;
+        a.target = EA_REJ;
+    }
+    return a;
+}
+static int lookup_goto(int state, int symbol){
+    return goto_table[state_row[state]][symbol - NUM_TERMINALS];
+}
+    '''))
+
+def generate_C_lookup_goto(table):
+    nprint(sc('''
+static int lookup_goto(int state, int symbol){
+    struct action_s goto_action = lookup_action(state, symbol);
+    if (goto_action.action != EA_GOTO){
+        return -1;
+    }
+    return goto_action.target;
+}
+    '''))
+
+def generate_C_comb_data(table):
+    comb = comb_compress(table)
+    nprint(C_array('struct action_s', 'comb_default', [C_action(e) for e in comb.default], 8))
+    nprint(C_array('int', 'comb_base', comb.base))
+    nprint(C_array('int', 'comb_check', comb.check))
+    nprint(C_array('struct action_s', 'comb_next', [C_action(e) for e in comb.next], 8))
+    nprint(sc('''
+static struct action_s lookup_action(int state, int symbol){
+    int row = state_row[state];
+    int n = comb_base[row] + symbol;
+    if (comb_check[n] == row){
+        return comb_next[n];
+    }
+    return comb_default[row];
+}
+    '''))
+
+
+def generate_C_state_info(table):
+    '''
+    state_row: the row of the table each state uses (identical rows are stored once)
+    default_reduction: the rule a state reduces by without reading the lookahead, or -1
+    '''
+    default_reduction = [-1 if r is None else r for r in table.default_reductions]
+    nprint(C_array(C_int_type(table.row_index), 'state_row', table.row_index))
+    nprint(C_array(C_int_type(default_reduction), 'default_reduction', default_reduction))
 
 def generate_C_includes(table):
         nprint('#include "parse.h"\n')
@@ -77,7 +312,9 @@ def generate_C_parse_enum(table):
     enum+='''
 enum PARSE_ENUM{{
     STACKLEN   = 100,
-    SYMBOLSMAX = 50,
+    SYMBOLSMAX = {nsyms},
+    NUM_STATES = {nstates},
+    NO_INPUT   = -1,
     {defs}
 }};
 '''
@@ -98,66 +335,218 @@ enum PARSE_ENUM{{
     defs = '\n'
     for k,v in enum_dict.items():
         defs += '    {k} = {v},\n'.format(k=k, v=v)
-    nprint(enum.format(defs = defs))
+    nprint(enum.format(defs = defs, nsyms = len(table.index_to_symbol), nstates = len(table.rows)))
     if DEBUG:
         generate_represent_function(table,enum_dict)
 
-def generate_C_data(table):
+def generate_C_direct_parser(table):
+    '''
+    the automaton as code instead of data, every state is a label that switches on the lookahead
+    and jumps straight to the next state, every reduction jumps to a switch over the exposed state
+    that does the goto of its left hand side (the most common target is the default case)
+    it starts at the state on top of the stack, so a push parse (see parser_push()) resumes where it stopped
+    '''
+    syms = table.ctx.bnf.syms
+    nprint(sc('''
+static int direct_parse(struct parse_info_s *p, int push){
+    //see parser_run() in parse.h
+    int la = p->next_input; //the lookahead is only read when the current state needs it
+    int prev_state;
+    p->next_input = NO_INPUT;
+    switch (p->state_stack.data[p->state_stack.idx].state){
+    '''))
+    for state_num in range(len(table.rows)):
+        nprint('    case {0}: goto state_{0};\n'.format(state_num))
+    nprint('    }\n')
+    nprint('    return PARSE_ERROR;\n')
+    gotos = {} #lhs sym_num: {state: goto state}
+    reduced = set()
+    for state_num,row in enumerate(table.rows):
+        nprint('state_{}:\n'.format(state_num))
+        rule_num = table.default_reductions[state_num]
+        if rule_num is not None:
+            reduced.add(rule_num)
+            nprint('    goto reduce_{};\n'.format(rule_num))
+            for sym_num,entry in enumerate(row):
+                if entry is not None and entry.action == EA_GOTO:
+                    gotos.setdefault(sym_num, {})[state_num] = entry.number
+            continue
+        cases = {} #statement: [sym_num, ...], so that symbols with the same action share it
+        for sym_num,entry in enumerate(row):
+            if entry is None:
+                continue
+            if entry.action == EA_GOTO:
+                gotos.setdefault(sym_num, {})[state_num] = entry.number
+                continue
+            if entry.action == EA_SHIFT:
+                #_END stays the lookahead after it's shifted, the accept state needs it and nothing is pushed after it
+                consume = '' if table.index_to_symbol[sym_num].name == '_END' else ' la = NO_INPUT;'
+                stmt = 'if (state_stack_shift(p, la, {0}) != 0){{ return PARSE_ERROR; }}{1} goto state_{0};'.format(entry.number, consume)
+            elif entry.action == EA_REDUCE:
+                reduced.add(entry.number)
+                stmt = 'goto reduce_{};'.format(entry.number)
+            elif entry.action == EA_ACC:
+                stmt = 'return PARSE_ACCEPT;'
+            else:
+                raise ValueError('unexpected table entry: {}'.format(lrgen.pretty_slr_entry(entry)))
+            cases.setdefault(stmt, []).append(sym_num)
+        nprint('    if (la == NO_INPUT){\n')
+        nprint('        if (push){ return PARSE_NEED_MORE; }\n')
+        nprint('        la = next_input(&p->lexer);\n')
+        nprint('    }\n')
+        nprint('    switch (la){\n')
+        for stmt,sym_nums in cases.items():
+            nprint('    ' + ' '.join('case {}:'.format(n) for n in sym_nums) + '\n')
+            nprint('        {}\n'.format(stmt))
+        nprint('    default: return PARSE_REJECT;\n')
+        nprint('    }\n')
+
+    for rule_num in sorted(reduced):
+        rule = table.index_to_rule[rule_num]
+        nprint(sc('''
+reduce_{rule_num}: //{rule}
+    prev_state = state_stack_reduce(p, {rule_num});
+    if (prev_state < 0) return PARSE_ERROR;
+    goto goto_{lhs};
+        '''.format(rule_num=rule_num, rule=lrgen.pretty_rule(rule), lhs=syms.get_symbol(rule.lhs).sym_num)))
+
+    for sym_num in sorted(set(syms.get_symbol(table.index_to_rule[r].lhs).sym_num for r in reduced)):
+        targets = gotos.get(sym_num, {})
+        counts = {}
+        for target in targets.values():
+            counts[target] = counts.get(target, 0) + 1
+        common = max(counts, key=counts.get) if counts else None
+        nprint('goto_{}: //{}\n'.format(sym_num, table.index_to_symbol[sym_num].name))
+        nprint('    switch (prev_state){\n')
+        for state_num,target in sorted(targets.items()):
+            if target != common:
+                nprint('    case {0}: p->state_stack.data[p->state_stack.idx].state = {1}; goto state_{1};\n'.format(state_num, target))
+        if common is not None:
+            nprint('    default: p->state_stack.data[p->state_stack.idx].state = {0}; goto state_{0};\n'.format(common))
+        nprint('    }\n')
+        nprint('    return PARSE_ERROR;\n')
+    nprint('    return PARSE_ERROR;\n}\n')
+
+TABLE_FORMATS = ('dense', 'comb', 'compact', 'direct')
+
+def generate_C_data(table, table_format='dense', inline_actions=False):
+    '''
+    table_format:
+        'dense':   a states[][SYMBOLSMAX] array of actions
+        'comb':    row displacement compressed vectors, see comb_compress()
+        'compact': separate ACTION and GOTO tables of small integers, see generate_C_compact_data()
+        'direct':  no table, the automaton is emitted as code by generate_C_code(), see generate_C_direct_parser()
+    inline_actions: the rules' actions are inlined into state_stack_reduce(), see generate_C_inline_reduce()
+    '''
+    if table_format == 'compact':
+        num_terminals = terminals_first(table)
     generate_C_parse_enum(table)
+    if inline_actions:
+        nprint('#define INLINE_ACTIONS\n')
     generate_C_includes(table)
-    generate_C_states_data(table)
+    if table_format != 'direct':
+        generate_C_state_info(table)
+    if table_format == 'direct':
+        pass
+    elif table_format == 'compact':
+        generate_C_compact_data(table, num_terminals)
+    elif table_format == 'comb':
+        generate_C_comb_data(table)
+        generate_C_lookup_goto(table)
+    else:
+        generate_C_states_data(table)
+        generate_C_lookup_goto(table)
     generate_C_rule_data(table)
 
-def genereate_basic_lexer(table):
-    nprint('''
-int next_input(){
-    static char buff[128];
-    static int idx = 0;
-    int r;
-
-    r = fgetc(stdin);
+def lexer_patterns(table, token_patterns=None, end_marker=';'):
+    '''
+    the patterns the lexer recognizes, in priority order (see lexgen.build_dfa()):
+    the literals, the T_ tokens, whitespace (skipped) and end_marker which ends the input like EOF does
+    token_patterns: {T_name: regex}, overrides lexgen.TOKEN_PATTERNS
+    '''
+    regexes = dict(lexgen.TOKEN_PATTERNS)
+    regexes.update(token_patterns or {})
+    patterns = []
+    tokens = []
+    for symbol in table.index_to_symbol:
+        if symbol.name.startswith('T_LITERAL'):
+            patterns.append((symbol.sym_num, 'literal', symbol.val))
+        elif symbol.name.startswith('T_'):
+            if symbol.name not in regexes:
+                lrgen.err('no pattern for the token {0}, use --token {0}=regex'.format(symbol.name))
+            tokens.append((symbol.sym_num, 'regex', regexes[symbol.name]))
+    end = table.ctx.bnf.syms.get_symbol('_END').sym_num
+    patterns += tokens + [('LEX_SKIP', 'regex', lexgen.SKIP_PATTERN)]
+    if end_marker:
+        patterns.append((end, 'literal', end_marker))
+    return patterns
+
+def generate_C_lexer(table, token_patterns=None, end_marker=';'):
+    '''
+    next_input(): a maximal munch lexer driven by the minimized DFA of lexer_patterns()
+    the tables are lex_class[byte] -> byte class, lex_next[state][class] -> state (-1 for none)
+    and lex_accept[state] -> the symbol that ends there (LEX_NONE, LEX_SKIP)
+    '''
+    try:
+        dfa = lexgen.build_dfa(lexer_patterns(table, token_patterns, end_marker))
+    except ValueError as e:
+        lrgen.err(str(e))
+    accept = [LEX_NONE if label is None else LEX_SKIP if label == 'LEX_SKIP' else label for label in dfa.accept]
+    nprint(sc('''
+enum LEX_ENUM{{
+    LEX_NONE   = {none},
+    LEX_SKIP   = {skip},
+    LEX_ERROR  = {error},
+    LEX_STATES = {nstates},
+}};
+    '''.format(none=LEX_NONE, skip=LEX_SKIP, error=LEX_ERROR, nstates=len(dfa.next))))
+    nprint(C_array(C_int_type(dfa.classes), 'lex_class', dfa.classes))
+    nprint(C_array2d(C_int_type(list(itertools.chain.from_iterable(dfa.next))), 'lex_next', dfa.next, dfa.num_classes))
+    nprint(C_array(C_int_type(accept), 'lex_accept', accept))
+    nprint(sc('''
+int next_input(struct lexer_s *lx){
+    struct input_s *in = lx->in;
     while (1){
-        switch(r){
-            case ' ':
-            case '\\n':
-            case '\\t':
-                r = fgetc(stdin);
-                continue;
+        const unsigned char *data = (const unsigned char *)in->data + in->beg;
+        size_t avail = in->end - in->beg;
+        int state = 0;
+        int token = LEX_NONE;
+        size_t n = 0;
+        size_t token_len = 0;
+        while (1){
+            if (n == avail){
+                if (!input_more(in)){
+                    break;
+                }
+                data = (const unsigned char *)in->data + in->beg;
+                avail = in->end - in->beg;
+            }
+            state = lex_next[state][lex_class[data[n]]];
+            if (state < 0){
+                break;
+            }
+            n++;
+            if (lex_accept[state] != LEX_NONE){
+                token = lex_accept[state];
+                token_len = n;
+            }
+        }
+        lx->text = in->data + in->beg;
+        if (token == LEX_NONE){
+            lx->len = 0;
+            return (in->beg == in->end && in->eof) ? _END : LEX_ERROR;
+        }
+        lx->len = token_len;
+        in->beg += token_len;
+        if (token != LEX_SKIP){
+#ifdef DBG_PRINT
+            printf("token %s '%.*s'\\n", represent(token), (int)lx->len, lx->text);
+#endif
+            return token;
         }
-        break;
-    }
-
-    if (r != EOF){
-        buff[idx++] = r;
-        buff[idx] = 0;
-        printf("read '%s'\\n", buff);
-    }
-    ''')
-
-    written = 0
-    for i,symbol in enumerate(table.index_to_symbol):
-        if not symbol.name.startswith('T_LITERAL'):
-            continue
-        c = '' if written == 0 else 'else '
-        c += '''if (strncmp({arg0},{arg1},{slen}) == 0){{
-            return {rv};
-        }}
-        '''
-        
-        c = c.format( arg0 = 'buff+idx-1',
-                      arg1 = '"{}"'.format(symbol.val),
-                      slen = '{}'.format(len(symbol.val)),
-                      rv   =  '{}'.format(symbol.sym_num) )
-        written += 1
-        nprint(c)
-
-    nprint('''
-    if (r == EOF || r == ';'){
-        return _END;
     }
 }
-    ''')
-
+    '''))
 
 def sc(code):
         #strips code
@@ -203,9 +592,87 @@ def fix_arb_code(rule_length, arb_code):
     c = c.replace('$$', '(p->symbol_stack.data[p->symbol_stack.idx])')
     return c
 
-def generate_C_code(table):
-    genereate_basic_lexer(table)
+UNIT_ACTION = re.compile(r'(\s*\$\$(\.\w+)?\s*=\s*\$1\2\s*;)*\s*$')
+
+def is_unit_action(rule):
+    '''
+    whether the action of rule leaves $$ the same as $1 when both are the same stack slot,
+    that is there's no action or it's only things like $$.n = $1.n;
+    '''
+    code = rule.arbcode.val if rule.arbcode else ''
+    return len(rule.seq) > 0 and UNIT_ACTION.match(code) is not None
+
+def generate_C_inline_reduce(table):
+    '''
+    generates state_stack_reduce() (see parse.h) with the rules' actions inlined in it
+    it dispatches with a computed goto where the compiler supports it (and NO_COMPUTED_GOTO isn't defined),
+    otherwise with a switch
+    unit and empty actions ($$ is $1) are done in place, without the push and the copy
+    '''
+    nprint(sc('''
+static int state_stack_reduce(struct parse_info_s *p, int rule_num){
+    int rule_begin_idx;
+#if defined(__GNUC__) && !defined(NO_COMPUTED_GOTO)
+    static const void *const rule_labels[] = {
+    '''))
+    for i,rule in enumerate(table.index_to_rule):
+        nprint('        &&rule_{},\n'.format(i))
+    nprint(sc('''
+    };
+#define RULE_LABEL(n) rule_##n
+    goto *rule_labels[rule_num];
+#else
+#define RULE_LABEL(n) case n
+    switch (rule_num){
+    default:
+        return -1;
+#endif
+    '''))
+    for i,rule in enumerate(table.index_to_rule):
+        rule_len = len(rule.seq)
+        nprint('RULE_LABEL({}): //{}\n'.format(i, lrgen.pretty_rule(rule)))
+        if DEBUG:
+            nprint('    printf("{rule}\\n");\n'.format(rule=lrgen.pretty_rule(rule).replace('"','\\"')))
+        literal = rule_len == 1 and rule.seq[0].val
+        if is_unit_action(rule):
+            if literal:
+                nprint('''    p->symbol_stack.data[p->symbol_stack.idx].input = '{}';\n'''.format(rule.seq[0].val[0]))
+            if rule_len > 1:
+                nprint('    p->symbol_stack.idx -= {};\n'.format(rule_len - 1))
+                nprint('    p->state_stack.idx  -= {};\n'.format(rule_len - 1))
+            nprint('    return p->state_stack.data[p->state_stack.idx - 1].state;\n')
+            continue
+        code = rule.arbcode.val if rule.arbcode else ''
+        if rule_len == 0:
+            nprint('    if (parse_stacks_reserve(p) != 0) return -1;\n')
+        nprint('    rule_begin_idx = p->symbol_stack.idx - {} + 1;\n'.format(rule_len))
+        nprint('    p->symbol_stack.idx++;\n')
+        if literal:
+            nprint('''    p->symbol_stack.data[p->symbol_stack.idx].input = '{}';\n'''.format(rule.seq[0].val[0]))
+        nprint(fix_arb_code(rule_len, code), '\n')
+        if rule_len > 0:
+            nprint('    p->symbol_stack.data[rule_begin_idx] = p->symbol_stack.data[p->symbol_stack.idx];\n')
+            nprint('    p->symbol_stack.idx = rule_begin_idx;\n')
+            if rule_len > 1:
+                nprint('    p->state_stack.idx  -= {};\n'.format(rule_len - 1))
+        else:
+            nprint('    p->state_stack.idx++;\n')
+        nprint('    return p->state_stack.data[p->state_stack.idx - 1].state;\n')
+    nprint(sc('''
+#if !defined(__GNUC__) || defined(NO_COMPUTED_GOTO)
+    }
+#endif
+#undef RULE_LABEL
+}
+    '''))
+
+def generate_C_code(table, table_format='dense', inline_actions=False, token_patterns=None, end_marker=';'):
+    generate_C_lexer(table, token_patterns, end_marker)
     nprint('\n')
+    if inline_actions:
+        generate_C_inline_reduce(table)
+        generate_C_main(table, table_format)
+        return
     rule_numbers = []
 
     for i,rule in enumerate(table.index_to_rule):
@@ -231,7 +698,8 @@ static void reduce_{rule_num}_action(struct parse_info_s *p)
         rule_numbers += [rule.rule_num]
 
     nprint(sc('''
-void reduce_action(struct parse_info_s *p, int rule_num){
+int reduce_action(struct parse_info_s *p, int rule_num){
+    //returns -1 for an unknown rule
     switch(rule_num){
     '''))
 
@@ -244,50 +712,259 @@ void reduce_action(struct parse_info_s *p, int rule_num){
         
     nprint(sc('''
     default:
-        runtime_error();
-        break;
+        return -1;
     }
+    return 0;
 }
     '''))
     
-    generate_C_main(table)
+    generate_C_main(table, table_format)
 
 
-def generate_C_main(table):
-    nprint('\n#include "simple_lr_main.h"')
+def generate_C_main(table, table_format='dense'):
+    if table_format == 'direct':
+        generate_C_direct_parser(table)
+        nprint('\n#include "direct_lr_main.h"\n')
+    else:
+        nprint('\n#include "simple_lr_main.h"\n')
+    nprint(sc('''
+#ifndef PARSER_NO_MAIN
+#include "parser_main.h"
+#endif
+    '''))
+
+def cmd_line_parser():
+    stdin_linux = '/dev/fd/0'
+    parser = argparse.ArgumentParser(description='generates a C parser for a grammar')
+    parser.add_argument('--in', action='append', default=None,
+            help='input file (stdin by default), repeat it with --out to build many parsers')
+    parser.add_argument('--out', action='append', default=None,
+            help='where the parser of the --in at the same position is written (stdout by default)')
+    parser.add_argument('--manifest', default=None, metavar='FILE',
+            help='builds the parsers listed in FILE, a line is: IN OUT [options], options default to the command line\'s')
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+            help='processes that build the parsers (the number of cpus by default)')
+    parser.add_argument('--force', action='store_true',
+            help='build the parsers even when they\'re up to date')
+    parser.add_argument('--mmap', action='store_true',
+            help='memory map the input file instead of reading it')
+    parser.add_argument('--algorithm', default='slr', choices=lrgen.ALGORITHMS,
+            help='how reduce lookaheads are computed')
+    parser.add_argument('--cache', default=None, metavar='DIR',
+            help='reuse the automaton and table from DIR when the grammar\'s structure (not its actions) is unchanged, '
+                 'and update the ones of the previous version of the input when it changed')
+    parser.add_argument('--cache-size', type=float, default=None, metavar='MB',
+            help='remove the least recently used files of the --cache directory beyond this size (it isn\'t pruned by default)')
+    parser.add_argument('--table', default='dense', choices=TABLE_FORMATS,
+            help='layout of the generated parse table')
+    parser.add_argument('--inline-actions', action='store_true',
+            help='inline the rules\' actions into a single reduce dispatch (computed goto where supported)')
+    parser.add_argument('--token', action='append', default=[], metavar='T_NAME=REGEX',
+            help='the pattern of a T_ token (see lexgen.py for the syntax and the builtin ones)')
+    parser.add_argument('--end-marker', default=';',
+            help='input that ends the parse like EOF does, \'\' for EOF only')
+    parser.add_argument('-v', action='store_true')
+    return parser
 
 def parse_cmd_line_args():
     '''
     parses command line args, returns a dictionary of them
     '''
-    stdin_linux = '/dev/fd/0'
-    parser = argparse.ArgumentParser(description='vcpu assembler')
-    parser.add_argument('--in', default=stdin_linux,
-            help='input file')
-    parser.add_argument('--out', default='p.out',
-            help='out file')
-    parser.add_argument('-v', action='store_true')
-
-    args = vars(parser.parse_args())
+    args = vars(cmd_line_parser().parse_args())
     for i in range(sys.argv.count('-v')):
         global DEBUG
         DEBUG += 1
     return args
 
-def main():
-    global TSRC
-
-    args = parse_cmd_line_args()
-    input_str = open(args['in']).read()
-    lrgen.TSRC = lrgen.token_source(input_str)
-
-    ast   = lrgen.grammar() #returns a tree like dictionary (SimpleNamespace tree)
+def generate_parser(args):
+    '''
+    prints the parser of the grammar args['in'], args are like parse_cmd_line_args()'s with a single input
+    '''
+    with lrgen.open_grammar(args['in'], args['mmap']) as tsrc:
+        try:
+            ast = lrgen.grammar_parser(tsrc).grammar() #returns a tree like dictionary (SimpleNamespace tree)
+        except lrgen.grammar_error as e:
+            lrgen.err(str(e))
+        #a memory mapped input is closed with tsrc, the previous version is kept as bytes
+        content = tsrc.content if isinstance(tsrc.content, str) or not args['cache'] else bytes(tsrc.content)
     bnf   = lrgen.extract_bnf(ast) #bnf, contains .productions and .syms (grammar and symbol table)
-    ctx   = lrgen.create_states(bnf) #(contains .items (states))
-    table = lrgen.generate_slr_table(ctx) #turns the .items into a table
+    table = None
+    if args['cache']:
+        table = table_cache.load(args['cache'], bnf, args['algorithm'])
+        if table is None and args['algorithm'] in incremental.UPDATABLE:
+            #the structure changed, update the table of the previous version of the file if it's cached
+            previous = table_cache.load_previous(args['cache'], args['in'], args['algorithm'])
+            if previous is not None:
+                table = incremental.update(previous, bnf, args['algorithm'])
+                table_cache.store(args['cache'], table)
+    if table is None:
+        ctx   = lrgen.create_states(bnf, args['algorithm']) #(contains .items (states))
+        table = lrgen.generate_slr_table(ctx, args['algorithm']) #turns the .items into a table
+        if args['cache']:
+            table_cache.store(args['cache'], table)
+    if args['cache']:
+        table_cache.store_previous(args['cache'], args['in'], args['algorithm'], content)
+        if args['cache_size'] is not None:
+            table_cache.prune(args['cache'], int(args['cache_size'] * 1024 * 1024))
     #uses table to generate a parser
-    generate_C_data(table) 
-    generate_C_code(table)
+    generate_C_data(table, args['table'], args['inline_actions'])
+    token_patterns = {}
+    for definition in args['token']:
+        name, eq, regex = definition.partition('=')
+        if not eq or not name.startswith('T_'):
+            lrgen.err('bad --token "{}", expected T_NAME=REGEX'.format(definition))
+        token_patterns[name] = regex
+    generate_C_code(table, args['table'], args['inline_actions'], token_patterns, args['end_marker'])
+
+'''
+build mode (--out or --manifest): many parsers are generated by a pool of processes,
+every output is written atomically and a parser is skipped when it's up to date:
+its stamp (OUT.stamp) has the hash of what it was made from (the grammar, the options and the generator)
+and the hash of the output
+'''
+#the options that change the generated parser
+OUTPUT_OPTIONS = ('algorithm', 'table', 'inline_actions', 'token', 'end_marker')
+STAMP_SUFFIX = '.stamp'
+
+_generator_digest = None
+
+def generator_digest():
+    '''
+    a hash of the sources of the generator, including the modules that make the table with --cache
+    '''
+    global _generator_digest
+    if _generator_digest is None:
+        h = hashlib.sha256()
+        for name in (__name__, 'lrgen', 'lexgen', 'table_cache', 'incremental', 'ids', 'format_types', 'nms'):
+            with open(sys.modules[name].__file__, 'rb') as f:
+                h.update(f.read())
+        _generator_digest = h.digest()
+    return _generator_digest
+
+def input_key(job):
+    '''
+    the hash of what the parser of job is made from
+    '''
+    h = hashlib.sha256(generator_digest())
+    h.update(repr([job[name] for name in OUTPUT_OPTIONS] + [DEBUG]).encode())
+    with open(job['in'], 'rb') as f:
+        h.update(f.read())
+    return h.hexdigest()
+
+def file_digest(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+def up_to_date(job, key):
+    try:
+        with open(job['out'] + STAMP_SUFFIX) as f:
+            stamp = f.read().split()
+        return stamp == [key, file_digest(job['out'])]
+    except OSError:
+        return False
+
+def build_job(job, key):
+    '''
+    generates the parser of job into job['out'] (run in the processes of build())
+    returns None or an error message
+    '''
+    out = io.StringIO()
+    errors = io.StringIO()
+    try:
+        with contextlib.redirect_stdout(out), contextlib.redirect_stderr(errors):
+            generate_parser(job)
+    except SystemExit:
+        #lrgen.err()
+        return errors.getvalue().strip() or 'failed'
+    except Exception as e:
+        return '{}: {}'.format(type(e).__name__, e)
+    data = out.getvalue().encode()
+    try:
+        table_cache.write_atomic(job['out'], data)
+        table_cache.write_atomic(job['out'] + STAMP_SUFFIX, '{} {}\n'.format(key, hashlib.sha256(data).hexdigest()).encode())
+    except OSError as e:
+        return str(e)
+    return None
+
+def read_manifest(path, args):
+    '''
+    the jobs of a manifest, every line that isn't empty or a # comment is: IN OUT [options]
+    relative paths are relative to the manifest's directory
+    '''
+    parser = cmd_line_parser()
+    base = os.path.dirname(os.path.abspath(path))
+    jobs = []
+    with open(path) as f:
+        for lineno,line in enumerate(f, 1):
+            words = shlex.split(line, comments=True)
+            if not words:
+                continue
+            if len(words) < 2:
+                lrgen.err('{}:{}: expected IN OUT [options]'.format(path, lineno))
+            job = argparse.Namespace(**args)
+            parser.parse_args(words[2:], namespace=job)
+            job = vars(job)
+            job['in'] = os.path.join(base, words[0])
+            job['out'] = os.path.join(base, words[1])
+            jobs.append(job)
+    return jobs
+
+def build_jobs(args):
+    '''
+    the jobs of the command line, one for every --in/--out pair and every line of the manifest
+    '''
+    inputs = args['in'] or []
+    outputs = args['out'] or []
+    if len(inputs) != len(outputs):
+        lrgen.err('every --in needs an --out in build mode ({} inputs, {} outputs)'.format(len(inputs), len(outputs)))
+    jobs = []
+    for path, out in zip(inputs, outputs):
+        job = dict(args)
+        job['in'] = path
+        job['out'] = out
+        jobs.append(job)
+    if args['manifest']:
+        jobs += read_manifest(args['manifest'], args)
+    return jobs
+
+def build(jobs, processes=None, force=False):
+    '''
+    builds the parsers of jobs that aren't up to date, processes at a time
+    returns the number of parsers that failed
+    '''
+    stale = []
+    failed = 0
+    for job in jobs:
+        try:
+            key = input_key(job)
+        except OSError as e:
+            print('{}: {}'.format(job['in'], e), file=sys.stderr)
+            failed += 1
+            continue
+        if force or not up_to_date(job, key):
+            stale.append((job, key))
+    processes = min(processes or os.cpu_count() or 1, len(stale))
+    if processes <= 1:
+        results = (build_job(job, key) for job,key in stale)
+    else:
+        pool = concurrent.futures.ProcessPoolExecutor(processes)
+        results = pool.map(build_job, *zip(*stale))
+    for (job, key), error in zip(stale, results):
+        if error is not None:
+            print('{} -> {}: {}'.format(job['in'], job['out'], error), file=sys.stderr)
+            failed += 1
+    if processes > 1:
+        pool.shutdown()
+    return failed
+
+def main():
+    args = parse_cmd_line_args()
+    if args['out'] or args['manifest']:
+        sys.exit(1 if build(build_jobs(args), args['jobs'], args['force']) else 0)
+    if args['in'] and len(args['in']) > 1:
+        lrgen.err('many --in need an --out each')
+    args['in'] = args['in'][0] if args['in'] else '/dev/fd/0'
+    generate_parser(args)
 
 
 if __name__ == '__main__':
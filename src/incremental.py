@@ -0,0 +1,631 @@
+#!/usr/bin/env python3
+'''
+Author: nilputs@nilput.com
+see COPYRIGHTS file which is included in this project
+'''
+'''
+ updates the automaton and the table of a grammar after an edit, instead of rebuilding them
+
+ given the table of the previous version of a grammar (from generate_slr_table() or table_cache.load())
+ and the bnf of the new version:
+    the nonterminals whose rules changed are found by diffing the productions (diff_productions())
+    a state of the previous automaton is reused when its kernel is still reached and its closure
+    doesn't expand a changed nonterminal (its closure and its transitions are the same),
+    the other states (the affected ones and whatever only they lead to) are built like create_states() does
+    nullable, first() and follow() are recomputed for the nonterminals that depend on a changed one
+    through those relations, the others keep their previous sets (update_sets())
+    the lalr lookaheads are recomputed for the transitions and the reductions that the new states, the lost paths
+    and the changed sets can reach through the reads and includes relations, the others keep their previous
+    ones (update_lookaheads())
+    a reused state keeps its row when its transitions, its reductions and their lookaheads didn't change,
+    the other rows are built like generate_slr_table() does
+
+ the states are numbered like a full rebuild numbers them, so the table is the same as the one a full rebuild gives
+ finding what's affected walks the rules and the transitions, but no sets are computed for the rest,
+ a table without its sets or its transition follow sets (see lalr_lookaheads()) has them computed from scratch
+
+ usage:
+    table = incremental.update(old_table, bnf, algorithm)
+
+ the rules that didn't change are carried over into bnf (see carry_rules()), so old_table can't be used afterwards
+ lr1 tables (and tables of another algorithm) are rebuilt with a rebuild_warning,
+ Pager's merging depends on the order the states are built in
+'''
+
+import sys
+import warnings
+from collections import deque
+sys.path.append('.')
+import lrgen
+from nms import nms
+
+#the algorithms whose tables update() updates, the others are rebuilt
+UPDATABLE = ('slr', 'lalr')
+#symbol_remap() moves the bits one at a time when the symbols were reordered into more runs than this
+REMAP_MAX_RUNS = 32
+#update_lookaheads() uses lalr_lookaheads() instead when more than these fractions
+#of the states are new or of the nonterminal transitions can differ
+LOOKAHEADS_MAX_NEW = 0.25
+LOOKAHEADS_MAX_DIRTY = 0.5
+
+class rebuild_warning(UserWarning):
+    '''
+    update() built the table from scratch instead of updating it
+    '''
+
+def rule_signature(rule):
+    return tuple(symbol.name for symbol in rule.seq)
+
+def diff_productions(old_bnf, bnf):
+    '''
+    the names of the nonterminals whose rules (their symbols, not their actions) differ between the two grammars,
+    including the ones that only one of them defines
+    '''
+    changed = set()
+    for name in set(old_bnf.productions).union(bnf.productions):
+        old = old_bnf.productions.get(name)
+        new = bnf.productions.get(name)
+        if old is None or new is None or list(map(rule_signature, old.rules)) != list(map(rule_signature, new.rules)):
+            changed.add(name)
+    return changed
+
+def carry_rules(old_bnf, bnf):
+    '''
+    replaces the rules of bnf with the rules of old_bnf that have the same lhs and symbols
+    (they take the new actions and numbers), so the rptrs of the old states are valid in bnf
+    returns (carried, prev_rule_num), the ids of the rules that were carried over
+    and the old rule number of every rule number (None for new rules)
+    '''
+    carried = set()
+    prev_rule_num = []
+    for name, production in bnf.productions.items():
+        available = {}
+        if name in old_bnf.productions:
+            for rule in old_bnf.productions[name].rules:
+                available.setdefault(rule_signature(rule), deque()).append(rule)
+        for i,rule in enumerate(production.rules):
+            candidates = available.get(rule_signature(rule))
+            if not candidates:
+                prev_rule_num.append(None)
+                continue
+            old_rule = candidates.popleft()
+            prev_rule_num.append(old_rule.rule_num)
+            old_rule.seq = rule.seq
+            old_rule.arbcode = rule.arbcode
+            old_rule.rule_num = rule.rule_num
+            production.rules[i] = old_rule
+            carried.add(id(old_rule))
+    return carried, prev_rule_num
+
+def kernel_rptrs(state):
+    '''
+    the rptrs that a state was made from, before closure
+    '''
+    return state.rptrs[:len(state.kernel)]
+
+def update_states(old_ctx, bnf, changed, carried):
+    '''
+    the LR(0) automaton of bnf (like create_states()), reusing the states of old_ctx that the change doesn't affect
+    returns (ctx, prev), prev[state_num] is the state of old_ctx that was reused or None
+    '''
+    ctx = lrgen.mk_ctx(bnf, old_ctx.algorithm)
+    #a name that wasn't a nonterminal doesn't show up in .has
+    undefined = changed.difference(old_ctx.bnf.productions)
+    def affected(state):
+        if state.has & changed:
+            return True
+        if undefined:
+            for rptr in state.rptrs:
+                if rptr.index < len(rptr.rule.seq) and rptr.rule.seq[rptr.index].name in undefined:
+                    return True
+        return False
+    reusable = {}
+    for state in old_ctx.items:
+        kernel = kernel_rptrs(state)
+        if all(id(rptr.rule) in carried for rptr in kernel) and not affected(state):
+            reusable[lrgen.kernel_key(kernel)] = state
+
+    states = []
+    prev = []
+    kernels = {}
+    def add(rptrs, key, on):
+        old = reusable.get(key)
+        if old is None:
+            item = lrgen.mk_item(rptrs, ctx)
+        else:
+            item = lrgen.lr_item(rptrs=old.rptrs, has=old.has, goto=dict(), kernel=key)
+        item.on = on
+        states.append(item)
+        prev.append(old)
+        kernels[key] = item
+        return item
+
+    product = bnf.productions['_START'].rules[0]
+    start = [lrgen.mk_rptr(rule=product, index=0)]
+    add(start, lrgen.kernel_key(start), '?')
+    #the same breadth first order as extract_items()
+    sym_order = {name: i for i,name in enumerate(bnf.syms.syms)}
+    queue_idx = 0
+    while queue_idx < len(states):
+        state = states[queue_idx]
+        old = prev[queue_idx]
+        queue_idx += 1
+        if old is not None:
+            buckets = {sym: kernel_rptrs(target) for sym,target in old.goto.items()}
+        else:
+            buckets = {}
+            for rptr in state.rptrs:
+                if rptr.index >= len(rptr.rule.seq):
+                    continue
+                cur_sym = rptr.rule.seq[rptr.index].name
+                if cur_sym not in buckets:
+                    buckets[cur_sym] = []
+                buckets[cur_sym].append(lrgen.mk_rptr(rptr.rule, rptr.index+1))
+        for sym in sorted(buckets, key=sym_order.__getitem__):
+            rptrs = buckets[sym]
+            key = lrgen.kernel_key(rptrs)
+            item = kernels.get(key)
+            if item is None:
+                item = add(rptrs, key, sym)
+            state.goto[sym] = item
+    ctx.items = states
+    return ctx, prev
+
+def symbol_remap(old_symbols, sym_index):
+    '''
+    a function that renumbers a bitset of old_symbols' numbers into sym_index's numbers,
+    the bits of the symbols that sym_index doesn't have are dropped
+    the symbols of an edited grammar mostly keep their order, so the bits are moved in runs of consecutive numbers
+    '''
+    numbers = [sym_index.get(symbol.name) for symbol in old_symbols]
+    runs = []
+    for i,n in enumerate(numbers):
+        if n is None:
+            continue
+        if runs and runs[-1][0] + runs[-1][1] == i and runs[-1][2] + runs[-1][1] == n:
+            runs[-1][1] += 1
+        else:
+            runs.append([i, 1, n])
+    if len(runs) == 1 and runs[0][0] == runs[0][2] and runs[0][1] == len(numbers):
+        return lambda bits: bits
+    if len(runs) > REMAP_MAX_RUNS:
+        def remap(bits):
+            out = 0
+            for i in lrgen.iter_bits(bits):
+                if numbers[i] is not None:
+                    out |= 1 << numbers[i]
+            return out
+        return remap
+    runs = [(start, (1 << length) - 1, to) for start, length, to in runs]
+    def remap(bits):
+        out = 0
+        for start, mask, to in runs:
+            out |= ((bits >> start) & mask) << to
+        return out
+    return remap
+
+def update_sets(old_sets, old_bnf, bnf, changed):
+    '''
+    grammar_sets() of bnf from old_sets, the sets of old_bnf
+    nullable is recomputed for the nonterminals whose rules mention a changed name (transitively),
+    first() for the ones that reach a changed name, or one whose nullable changed, through the first() relation
+    and follow() for the ones that occur in a changed rule or before a symbol whose first() or nullable changed,
+    and the ones whose follow() includes theirs
+    returns (sets, nullable_changed), the names whose nullable changed
+    '''
+    productions = bnf.productions
+    index_to_symbol = list(bnf.syms)
+    sym_index = {s.name: i for i,s in enumerate(index_to_symbol)}
+    nsyms = len(index_to_symbol)
+    remap = symbol_remap(old_sets.index_to_symbol, sym_index)
+    old_index = old_sets.sym_index
+
+    #the rules that mention every nonterminal and every changed name, the only walk over the whole grammar
+    users = {}
+    for rule in lrgen.iter_rules(productions):
+        for sym in rule.seq:
+            if sym.name in productions or sym.name in changed:
+                users.setdefault(sym.name, []).append(rule)
+    mentions = set(changed.intersection(productions))
+    queue = list(changed)
+    while queue:
+        for rule in users.get(queue.pop(), ()):
+            if rule.lhs not in mentions:
+                mentions.add(rule.lhs)
+                queue.append(rule.lhs)
+    changed_symbols = set(name for name in changed if name in sym_index)
+
+    #nullable, like grammar_sets() over the rules of mentions, the other nonterminals keep theirs
+    nullable = remap(old_sets.nullable)
+    for name in mentions.union(changed_symbols):
+        nullable &= ~(1 << sym_index[name])
+    remaining = {}
+    waiting = {}
+    for name in mentions:
+        for rule in productions[name].rules:
+            if any(sym.name not in mentions and not nullable & (1 << sym_index[sym.name]) for sym in rule.seq):
+                continue
+            remaining[id(rule)] = 0
+            for sym in rule.seq:
+                if sym.name in mentions:
+                    remaining[id(rule)] += 1
+                    waiting.setdefault(sym.name, []).append(rule)
+            if remaining[id(rule)] == 0:
+                queue.append(name)
+    while queue:
+        name = queue.pop()
+        if nullable & (1 << sym_index[name]):
+            continue
+        nullable |= 1 << sym_index[name]
+        for rule in waiting.get(name, ()):
+            remaining[id(rule)] -= 1
+            if remaining[id(rule)] == 0:
+                queue.append(rule.lhs)
+    def was_nullable(name):
+        return name in old_index and bool(old_sets.nullable & (1 << old_index[name]))
+    nullable_changed = set(name for name in mentions.union(changed_symbols)
+                           if bool(nullable & (1 << sym_index[name])) != was_nullable(name))
+
+    #first(), the nonterminals that reach a changed name through it are a subset of mentions
+    first_users = {}
+    for name in mentions:
+        for rule in productions[name].rules:
+            for sym in rule.seq:
+                if sym.name in productions or sym.name in changed:
+                    first_users.setdefault(sym.name, set()).add(name)
+                if sym.name not in productions or not nullable & (1 << sym_index[sym.name]):
+                    break
+    affected = set(changed_symbols.union(nullable_changed).intersection(productions))
+    queue = list(changed_symbols.union(nullable_changed))
+    while queue:
+        for name in first_users.get(queue.pop(), ()):
+            if name not in affected:
+                affected.add(name)
+                queue.append(name)
+    first = [0] * nsyms
+    for i,s in enumerate(index_to_symbol):
+        if s.name not in productions:
+            first[i] = 1 << i
+        elif s.name not in affected:
+            first[i] = remap(old_sets.first[old_index[s.name]])
+    nodes = list(affected)
+    local = {name: k for k,name in enumerate(nodes)}
+    init = [0] * len(nodes)
+    edges = [[] for name in nodes]
+    for k,name in enumerate(nodes):
+        for rule in productions[name].rules:
+            for sym in rule.seq:
+                n = sym_index[sym.name]
+                if sym.name in local:
+                    edges[k].append(local[sym.name])
+                else:
+                    init[k] |= first[n]
+                if sym.name not in productions or not nullable & (1 << n):
+                    break
+    for name, bits in zip(nodes, lrgen.digraph(len(nodes), edges, init)):
+        first[sym_index[name]] = bits
+    first_changed = changed_symbols.union(name for name in affected.difference(changed_symbols)
+                                  if first[sym_index[name]] != remap(old_sets.first[old_index[name]]))
+
+    #follow(), seeded with the nonterminals whose occurrences changed, then the ones whose follow() includes theirs
+    touched = []
+    for name in changed:
+        if name in productions:
+            touched += productions[name].rules
+        if name in old_bnf.productions:
+            touched += old_bnf.productions[name].rules
+    for name in first_changed.union(nullable_changed):
+        touched += users.get(name, ())
+    affected = set(sym.name for rule in touched for sym in rule.seq if sym.name in productions)
+    affected.update(changed_symbols.intersection(productions))
+    queue = list(affected)
+    while queue:
+        name = queue.pop()
+        for rule in productions[name].rules:
+            for sym in reversed(rule.seq):
+                if sym.name in productions and sym.name != name and sym.name not in affected:
+                    affected.add(sym.name)
+                    queue.append(sym.name)
+                if sym.name not in productions or not nullable & (1 << sym_index[sym.name]):
+                    break
+    follow = [0] * nsyms
+    for name in productions:
+        if name not in affected:
+            follow[sym_index[name]] = remap(old_sets.follow[old_index[name]])
+    nodes = list(affected)
+    local = {name: k for k,name in enumerate(nodes)}
+    init = [0] * len(nodes)
+    edges = [[] for name in nodes]
+    if '_START' in local:
+        init[local['_START']] = 1 << sym_index['_END']
+    for k,name in enumerate(nodes):
+        seen = set()
+        for rule in users.get(name, ()):
+            if id(rule) in seen:
+                continue
+            seen.add(id(rule))
+            rest_first = 0
+            rest_nullable = True
+            for sym in reversed(rule.seq):
+                n = sym_index[sym.name]
+                if sym.name == name:
+                    init[k] |= rest_first
+                    if rest_nullable and rule.lhs != name:
+                        if rule.lhs in local:
+                            edges[k].append(local[rule.lhs])
+                        else:
+                            init[k] |= follow[sym_index[rule.lhs]]
+                if nullable & (1 << n):
+                    rest_first |= first[n]
+                else:
+                    rest_first = first[n]
+                    rest_nullable = False
+    for name, bits in zip(nodes, lrgen.digraph(len(nodes), edges, init)):
+        follow[sym_index[name]] = bits
+
+    sets = nms()
+    sets.index_to_symbol = index_to_symbol
+    sets.sym_index = sym_index
+    sets.nullable = nullable
+    sets.first = first
+    sets.follow = follow
+    return sets, nullable_changed
+
+def update_lookaheads(old_ctx, ctx, prev, nullable_changed, prev_rule_num):
+    '''
+    lalr_lookaheads() of ctx (with its sets) from the lookaheads and the transition follow sets of old_ctx
+    the transitions whose Follow can differ are found first:
+        the transitions of the new states and the transitions into them,
+        the transitions of the items whose paths back to their origin went through a new state or a lost predecessor
+        (a reused state that fewer reused states lead to than before),
+        the ones next to a symbol whose nullable changed,
+        and the transitions that read or include those
+    only these get DeRemer and Pennello's relations, the others keep their previous Follow (renumbered),
+    the same goes for the lookaheads of the reductions
+    when many states are new or many transitions can differ (see LOOKAHEADS_MAX_NEW), lalr_lookaheads() is used instead
+    '''
+    if prev.count(None) > len(prev) * LOOKAHEADS_MAX_NEW:
+        return lrgen.lalr_lookaheads(ctx)
+    productions = ctx.bnf.productions
+    sets = ctx.sets
+    sym_index = sets.sym_index
+    remap = symbol_remap(old_ctx.sets.index_to_symbol, sym_index)
+    states = ctx.items
+    index_to_rule = list(lrgen.iter_rules(productions))
+    for i,state in enumerate(states):
+        state.state_num = i
+    #every transition into a state is on the same symbol, state.on
+    preds = [[] for state in states]
+    ntrans = 0
+    for state in states:
+        for sym,target in state.goto.items():
+            preds[target.state_num].append(state)
+            ntrans += sym in productions
+    reused = {old.state_num: state for state,old in zip(states, prev) if old is not None}
+    suffixes = {}
+    def nullable_suffix(rule):
+        if rule.rule_num not in suffixes:
+            suffixes[rule.rule_num] = lrgen.rule_suffix_sets(rule, sets)[1]
+        return suffixes[rule.rule_num]
+    def ancestors(state_num, distance):
+        found = {state_num}
+        for i in range(distance):
+            found = set(p.state_num for s in found for p in preds[s])
+        return found
+
+    dirty = set()
+    recompute = set()
+    #the items of a reused state whose paths back go through a new state or a lost predecessor, as packed rptrs
+    tainted = {}
+    work = []
+    def taint(state, packed):
+        if prev[state.state_num] is None:
+            return
+        fresh = packed.difference(tainted.setdefault(state.state_num, set()))
+        if fresh:
+            tainted[state.state_num].update(fresh)
+            work.append((state, fresh))
+    #everything in a new state is recomputed, the reductions of its closure are found through its transitions
+    for state in states:
+        if prev[state.state_num] is None:
+            for rule_num, index in map(lrgen.rptr_unpack, state.kernel):
+                rule = index_to_rule[rule_num]
+                if index == len(rule.seq) and rule.lhs != '_START':
+                    recompute.add((state.state_num, rule_num))
+            for sym,target in state.goto.items():
+                if sym in productions:
+                    dirty.add((state.state_num, sym))
+                taint(target, set(target.kernel))
+            if state.on in productions:
+                dirty.update((p.state_num, state.on) for p in preds[state.state_num])
+    #the reused states that an old state which wasn't reused led to
+    for old in old_ctx.items:
+        if old.state_num not in reused:
+            for target in old.goto.values():
+                state = reused.get(target.state_num)
+                if state is not None:
+                    taint(state, set(state.kernel))
+    while work:
+        state, packed = work.pop()
+        for packed_rptr in packed:
+            rule_num, index = lrgen.rptr_unpack(packed_rptr)
+            rule = index_to_rule[rule_num]
+            if index == len(rule.seq):
+                if rule.lhs != '_START':
+                    recompute.add((state.state_num, rule_num))
+                continue
+            sym = rule.seq[index].name
+            if sym in productions:
+                dirty.add((state.state_num, sym))
+            taint(state.goto[sym], {packed_rptr + 1})
+    if nullable_changed:
+        for state in states:
+            for rptr in state.rptrs:
+                seq = rptr.rule.seq
+                if rptr.index < len(seq) and seq[rptr.index].name in productions and \
+                        any(sym.name in nullable_changed for sym in seq[rptr.index+1:]):
+                    dirty.add((state.state_num, seq[rptr.index].name))
+            if state.on in productions and nullable_changed.intersection(state.goto):
+                dirty.update((p.state_num, state.on) for p in preds[state.state_num])
+
+    #the transitions that include or read a dirty one, and the reductions they're in the lookback of
+    queue = list(dirty)
+    def mark(t):
+        if t not in dirty:
+            dirty.add(t)
+            queue.append(t)
+    while queue:
+        state_num, lhs = queue.pop()
+        for rule in productions[lhs].rules:
+            suffix = nullable_suffix(rule)
+            q = states[state_num]
+            for i,sym in enumerate(rule.seq):
+                if sym.name in productions and suffix[i+1]:
+                    mark((q.state_num, sym.name))
+                q = q.goto[sym.name]
+            recompute.add((q.state_num, rule.rule_num))
+        on = states[state_num].on
+        if on in productions and sets.nullable & (1 << sym_index[lhs]):
+            for p in preds[state_num]:
+                mark((p.state_num, on))
+
+    if len(dirty) > ntrans * LOOKAHEADS_MAX_DIRTY:
+        return lrgen.lalr_lookaheads(ctx)
+
+    #Read of the dirty transitions and of the ones they read, Follow of the dirty ones
+    trans = list(dirty)
+    trans_index = {t: i for i,t in enumerate(trans)}
+    DR = []
+    reads = []
+    i = 0
+    while i < len(trans):
+        state_num, sym = trans[i]
+        r = states[state_num].goto[sym]
+        dr = 0
+        rd = []
+        for nsym in r.goto:
+            n = sym_index[nsym]
+            if nsym not in productions:
+                dr |= 1 << n
+            elif sets.nullable & (1 << n):
+                t = (r.state_num, nsym)
+                if t not in trans_index:
+                    trans_index[t] = len(trans)
+                    trans.append(t)
+                rd.append(trans_index[t])
+        DR.append(dr)
+        reads.append(rd)
+        i += 1
+    read = lrgen.digraph(len(trans), reads, DR)
+    old_follow = old_ctx.transition_follow
+    def kept_follow(state_num, sym):
+        return remap(old_follow[(prev[state_num].state_num, sym)])
+    ndirty = len(dirty)
+    init = read[:ndirty]
+    includes = [[] for i in range(ndirty)]
+    by_state = {}
+    for k,(state_num, sym) in enumerate(trans[:ndirty]):
+        by_state.setdefault(state_num, {})[sym] = k
+    for state_num, ks in by_state.items():
+        for rptr in states[state_num].rptrs:
+            seq = rptr.rule.seq
+            if rptr.index < len(seq) and seq[rptr.index].name in ks and nullable_suffix(rptr.rule)[rptr.index+1]:
+                k = ks[seq[rptr.index].name]
+                for p in ancestors(state_num, rptr.index):
+                    t = (p, rptr.rule.lhs)
+                    if t in dirty:
+                        includes[k].append(trans_index[t])
+                    else:
+                        init[k] |= kept_follow(*t)
+    follow = lrgen.digraph(ndirty, includes, init)
+    def transition_follow(t):
+        if t in dirty:
+            return follow[trans_index[t]]
+        return kept_follow(*t)
+
+    new_rule = {old: rule_num for rule_num,old in enumerate(prev_rule_num) if old is not None}
+    lookaheads = {}
+    for (state_num, rule_num),bits in old_ctx.lookaheads.items():
+        if state_num in reused:
+            lookaheads[(reused[state_num].state_num, new_rule[rule_num])] = remap(bits)
+    for state_num, rule_num in recompute:
+        rule = index_to_rule[rule_num]
+        bits = 0
+        for p in ancestors(state_num, len(rule.seq)):
+            bits |= transition_follow((p, rule.lhs))
+        lookaheads[(state_num, rule_num)] = bits
+    ctx.transition_follow = {}
+    for state in states:
+        for sym in state.goto:
+            if sym in productions:
+                ctx.transition_follow[(state.state_num, sym)] = transition_follow((state.state_num, sym))
+    return lookaheads
+
+def update_table(old_table, old_sets, ctx, prev, prev_rule_num):
+    '''
+    the table of ctx (like generate_slr_table()), reusing the rows of old_table that didn't change
+    old_sets are the grammar_sets() of the old grammar, ctx has its sets and lookaheads already
+    '''
+    algorithm = old_table.algorithm
+    sets = lrgen.grammar_sets(ctx)
+    lookaheads = ctx.lookaheads
+    old_lookaheads = old_table.ctx.lookaheads
+    numbering = lrgen.number_table(ctx)
+    index_to_state, index_to_symbol, index_to_rule = numbering
+    same_columns = [s.name for s in index_to_symbol] == [s.name for s in old_table.index_to_symbol]
+
+    def same_row(state, old):
+        for sym, target in state.goto.items():
+            if old.goto[sym].state_num != target.state_num:
+                return False
+        for rptr in state.rptrs:
+            if rptr.index != len(rptr.rule.seq) or rptr.rule.lhs == '_START':
+                continue
+            rule_num = rptr.rule.rule_num
+            if prev_rule_num[rule_num] != rule_num:
+                return False
+            if lookaheads is None:
+                n = sets.sym_index[rptr.rule.lhs]
+                if sets.follow[n] != old_sets.follow[n]:
+                    return False
+            elif lookaheads.get((state.state_num, rule_num), 0) != old_lookaheads.get((old.state_num, rule_num), 0):
+                return False
+        return True
+
+    rows = []
+    keys = []
+    for state, old in zip(index_to_state, prev):
+        if same_columns and old is not None and same_row(state, old):
+            i = old_table.row_index[old.state_num]
+            row, key = old_table.unique_rows[i], old_table.row_keys[i]
+        else:
+            row, key = lrgen.table_row(state, ctx, sets, lookaheads, index_to_symbol)
+        rows.append(row)
+        keys.append(key)
+    return lrgen.mk_table(ctx, algorithm, rows, keys, numbering)
+
+def update(old_table, bnf, algorithm):
+    '''
+    the table of bnf, like generate_slr_table(create_states(bnf, algorithm), algorithm),
+    made from old_table, the table of a previous version of the grammar
+    an algorithm that isn't in UPDATABLE or isn't old_table's is built from scratch, with a rebuild_warning
+    '''
+    if algorithm not in UPDATABLE or algorithm != old_table.algorithm:
+        if algorithm not in UPDATABLE:
+            reason = '{} tables can\'t be updated'.format(algorithm)
+        else:
+            reason = 'the previous table is {}'.format(old_table.algorithm)
+        warnings.warn('the table is rebuilt, {}'.format(reason), rebuild_warning)
+        return lrgen.generate_slr_table(lrgen.create_states(bnf, algorithm), algorithm)
+    old_ctx = old_table.ctx
+    old_sets = lrgen.grammar_sets(old_ctx)
+    changed = diff_productions(old_ctx.bnf, bnf)
+    carried, prev_rule_num = carry_rules(old_ctx.bnf, bnf)
+    ctx, prev = update_states(old_ctx, bnf, changed, carried)
+    ctx.sets, nullable_changed = update_sets(old_sets, old_ctx.bnf, bnf, changed)
+    if algorithm == 'lalr':
+        if old_ctx.transition_follow is None or old_ctx.lookaheads is None:
+            ctx.lookaheads = lrgen.lalr_lookaheads(ctx)
+        else:
+            ctx.lookaheads = update_lookaheads(old_ctx, ctx, prev, nullable_changed, prev_rule_num)
+    return update_table(old_table, old_sets, ctx, prev, prev_rule_num)
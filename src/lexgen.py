@@ -0,0 +1,344 @@
+#!/usr/bin/env python3
+'''
+Author: nilputs@nilput.com
+see COPYRIGHTS file which is included in this project
+'''
+'''
+ compiles token patterns (literals and regular expressions) into one minimized DFA,
+ which generate_slr_c.py emits as the lexer of the generated parser
+
+ the DFA works on bytes, every pattern is given a label (what the lexer returns),
+ when several patterns match the same longest input the one that was given first wins
+'''
+
+import sys
+from nms import nms
+sys.path.append('.')
+
+'''
+supported regular expression syntax:
+    a|b  ab  a*  a+  a?  (a)
+    .           any byte except newline
+    [a-z_]      a class,  [^...] a negated class
+    \\n \\t \\r \\\\ \\. ...  escapes, \\d \\w \\s (also inside classes)
+'''
+#patterns of the T_ tokens that the lexer knows about without --token
+TOKEN_PATTERNS = {
+    'T_id':         r'[a-zA-Z_][a-zA-Z0-9_]*',
+    'T_ident':      r'[a-zA-Z_][a-zA-Z0-9_]*',
+    'T_identifier': r'[a-zA-Z_][a-zA-Z0-9_]*',
+    'T_num':        r'[0-9]+',
+    'T_number':     r'[0-9]+',
+    'T_int':        r'[0-9]+',
+    'T_float':      r'[0-9]+\.[0-9]*([eE][-+]?[0-9]+)?',
+    'T_string':     r'"([^"\\\n]|\\.)*"',
+}
+SKIP_PATTERN = r'[ \t\r\n]+'
+
+ALL_BYTES  = frozenset(range(256))
+DIGITS     = frozenset(b'0123456789')
+WORD_BYTES = frozenset(b'abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789_')
+SPACES     = frozenset(b' \t\r\n\v\f')
+ESCAPES    = { 'n': ord('\n'), 't': ord('\t'), 'r': ord('\r'), 'v': ord('\v'), 'f': ord('\f'), '0': 0 }
+CLASS_ESCAPES = { 'd': DIGITS, 'w': WORD_BYTES, 's': SPACES,
+                  'D': ALL_BYTES - DIGITS, 'W': ALL_BYTES - WORD_BYTES, 'S': ALL_BYTES - SPACES }
+
+class nfa:
+    '''
+    a thompson NFA, state n has .edges[n]: [(byteset, target), ...] and .eps[n]: [target, ...]
+    '''
+    def __init__(self):
+        self.edges = []
+        self.eps = []
+    def new_state(self):
+        self.edges.append([])
+        self.eps.append([])
+        return len(self.edges) - 1
+    def fragment(self, byteset):
+        beg = self.new_state()
+        end = self.new_state()
+        self.edges[beg].append((frozenset(byteset), end))
+        return beg, end
+    def empty(self):
+        beg = self.new_state()
+        return beg, beg
+    def concat(self, frags):
+        if not frags:
+            return self.empty()
+        for (b0, e0), (b1, e1) in zip(frags, frags[1:]):
+            self.eps[e0].append(b1)
+        return frags[0][0], frags[-1][1]
+    def alternate(self, frags):
+        beg = self.new_state()
+        end = self.new_state()
+        for b, e in frags:
+            self.eps[beg].append(b)
+            self.eps[e].append(end)
+        return beg, end
+    def repeat(self, frag, op):
+        b, e = frag
+        beg = self.new_state()
+        end = self.new_state()
+        self.eps[beg].append(b)
+        self.eps[e].append(end)
+        if op in '*?':
+            self.eps[beg].append(end)
+        if op in '*+':
+            self.eps[e].append(b)
+        return beg, end
+    def literal(self, data):
+        return self.concat([self.fragment((byte,)) for byte in data])
+
+class regex_parser:
+    '''
+    recursive descent parser of a regular expression into fragments of an nfa
+        alternation -> concat ('|' concat)*
+        concat      -> repeat*
+        repeat      -> atom ('*' | '+' | '?')*
+        atom        -> '(' alternation ')' | class | '.' | escape | byte
+    '''
+    def __init__(self, automaton, pattern):
+        self.automaton = automaton
+        self.pattern = pattern.encode() if isinstance(pattern, str) else pattern
+        self.idx = 0
+
+    def error(self, msg):
+        raise ValueError('bad pattern {!r} at {}: {}'.format(self.pattern.decode(errors='replace'), self.idx, msg))
+
+    def peek(self):
+        return chr(self.pattern[self.idx]) if self.idx < len(self.pattern) else None
+
+    def take(self):
+        c = self.peek()
+        if c is None:
+            self.error('unexpected end')
+        self.idx += 1
+        return c
+
+    def parse(self):
+        frag = self.alternation()
+        if self.peek() is not None:
+            self.error('unexpected {!r}'.format(self.peek()))
+        return frag
+
+    def alternation(self):
+        frags = [self.concat()]
+        while self.peek() == '|':
+            self.take()
+            frags.append(self.concat())
+        return frags[0] if len(frags) == 1 else self.automaton.alternate(frags)
+
+    def concat(self):
+        frags = []
+        while self.peek() not in (None, '|', ')'):
+            frags.append(self.repeat())
+        return self.automaton.concat(frags)
+
+    def repeat(self):
+        frag = self.atom()
+        while self.peek() in ('*', '+', '?'):
+            frag = self.automaton.repeat(frag, self.take())
+        return frag
+
+    def escape(self):
+        '''
+        returns a byteset
+        '''
+        c = self.take()
+        if c in CLASS_ESCAPES:
+            return CLASS_ESCAPES[c]
+        return frozenset((ESCAPES.get(c, ord(c)),))
+
+    def byte_class(self):
+        negate = self.peek() == '^'
+        if negate:
+            self.take()
+        byteset = set()
+        first = True
+        while first or self.peek() != ']':
+            first = False
+            c = self.take()
+            if c == '\\':
+                member = self.escape()
+            else:
+                member = frozenset((ord(c),))
+            if self.peek() == '-' and len(member) == 1 and self.pattern[self.idx + 1:self.idx + 2] not in (b']', b''):
+                self.take()
+                hi = self.take()
+                hi = min(self.escape()) if hi == '\\' else ord(hi)
+                lo = min(member)
+                if hi < lo:
+                    self.error('bad range')
+                member = frozenset(range(lo, hi + 1))
+            byteset |= member
+        self.take()
+        return frozenset(ALL_BYTES - byteset) if negate else frozenset(byteset)
+
+    def atom(self):
+        c = self.take()
+        if c == '(':
+            frag = self.alternation()
+            if self.peek() != ')':
+                self.error('expected )')
+            self.take()
+            return frag
+        if c == '[':
+            return self.automaton.fragment(self.byte_class())
+        if c == '.':
+            return self.automaton.fragment(ALL_BYTES - {ord('\n')})
+        if c == '\\':
+            return self.automaton.fragment(self.escape())
+        if c in '*+?)|':
+            self.error('unexpected {!r}'.format(c))
+        return self.automaton.fragment((ord(c),))
+
+def byte_classes(bytesets):
+    '''
+    partitions the 256 bytes into classes that no byteset tells apart
+    returns (class of every byte, number of classes)
+    '''
+    bytesets = list(set(bytesets))
+    signatures = {}
+    classes = []
+    for byte in range(256):
+        signature = tuple(byte in s for s in bytesets)
+        classes.append(signatures.setdefault(signature, len(signatures)))
+    return classes, len(signatures)
+
+def eps_closure(automaton, states):
+    stack = list(states)
+    seen = set(states)
+    while stack:
+        s = stack.pop()
+        for t in automaton.eps[s]:
+            if t not in seen:
+                seen.add(t)
+                stack.append(t)
+    return frozenset(seen)
+
+def subset_construction(automaton, start, accepts):
+    '''
+    accepts: {nfa state: (priority, label)}
+    returns nms(classes, num_classes, next, accept), state 0 is the start
+        next[state][byte class] is the next state or -1
+        accept[state] is the label of the highest priority pattern that ends there or None
+    '''
+    classes, num_classes = byte_classes(byteset for edges in automaton.edges for byteset, _ in edges)
+    representative = [None] * num_classes
+    for byte, c in enumerate(classes):
+        if representative[c] is None:
+            representative[c] = byte
+
+    def accept_of(states):
+        found = [accepts[s] for s in states if s in accepts]
+        return min(found)[1] if found else None
+
+    start = eps_closure(automaton, (start,))
+    state_num = {start: 0}
+    next_table = []
+    accept = []
+    #breadth first, in the order the states were numbered
+    order = [start]
+    i = 0
+    while i < len(order):
+        states = order[i]
+        i += 1
+        row = []
+        for c in range(num_classes):
+            byte = representative[c]
+            targets = set()
+            for s in states:
+                for byteset, t in automaton.edges[s]:
+                    if byte in byteset:
+                        targets.add(t)
+            if not targets:
+                row.append(-1)
+                continue
+            targets = eps_closure(automaton, targets)
+            if targets not in state_num:
+                state_num[targets] = len(order)
+                order.append(targets)
+            row.append(state_num[targets])
+        next_table.append(row)
+        accept.append(accept_of(states))
+    return nms(classes=classes, num_classes=num_classes, next=next_table, accept=accept)
+
+def minimize(dfa):
+    '''
+    moore's partition refinement, states are equivalent when they accept the same label
+    and go to equivalent states on every byte class, returns a new dfa (the start stays 0)
+    '''
+    block = {}
+    part = [block.setdefault(label, len(block)) for label in dfa.accept]
+    num_blocks = len(block)
+    while True:
+        signatures = {}
+        new_part = []
+        for s,row in enumerate(dfa.next):
+            signature = (part[s],) + tuple(part[t] if t >= 0 else -1 for t in row)
+            new_part.append(signatures.setdefault(signature, len(signatures)))
+        part = new_part
+        if len(signatures) == num_blocks:
+            break
+        num_blocks = len(signatures)
+
+    #renumber the blocks in the order they're first reached from the start state
+    renumber = {part[0]: 0}
+    order = [0]
+    i = 0
+    while i < len(order):
+        s = order[i]
+        i += 1
+        for t in dfa.next[s]:
+            if t >= 0 and part[t] not in renumber:
+                renumber[part[t]] = len(renumber)
+                order.append(t)
+    next_table = [[renumber[part[t]] if t >= 0 else -1 for t in dfa.next[s]] for s in order]
+    accept = [dfa.accept[s] for s in order]
+
+    #merge the byte classes that became indistinguishable
+    columns = {}
+    class_map = []
+    for c in range(dfa.num_classes):
+        column = tuple(row[c] for row in next_table)
+        class_map.append(columns.setdefault(column, len(columns)))
+    merged = [[None] * len(columns) for row in next_table]
+    for c in range(dfa.num_classes):
+        for s,row in enumerate(next_table):
+            merged[s][class_map[c]] = row[c]
+    classes = [class_map[c] for c in dfa.classes]
+    return nms(classes=classes, num_classes=len(columns), next=merged, accept=accept)
+
+def build_dfa(patterns):
+    '''
+    patterns: [(label, kind, pattern), ...] in priority order
+        kind is 'literal' (matched as is) or 'regex'
+    returns a minimized dfa, see subset_construction()
+    '''
+    automaton = nfa()
+    start = automaton.new_state()
+    accepts = {}
+    for priority, (label, kind, pattern) in enumerate(patterns):
+        if kind == 'literal':
+            data = pattern.encode() if isinstance(pattern, str) else pattern
+            frag = automaton.literal(data)
+        else:
+            frag = regex_parser(automaton, pattern).parse()
+        automaton.eps[start].append(frag[0])
+        accepts.setdefault(frag[1], (priority, label))
+    return minimize(subset_construction(automaton, start, accepts))
+
+def dfa_match(dfa, data, idx=0):
+    '''
+    maximal munch, returns (label, end) of the longest match at idx or None
+    '''
+    state = 0
+    found = None
+    while idx < len(data):
+        state = dfa.next[state][dfa.classes[data[idx]]]
+        if state < 0:
+            break
+        idx += 1
+        if dfa.accept[state] is not None:
+            found = (dfa.accept[state], idx)
+    return found
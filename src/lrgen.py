@@ -4,15 +4,18 @@ Author: nilputs@nilput.com
 see COPYRIGHTS file which is included in this project
 '''
 '''
- generates a states table, currently only supports slr(1) grammars
+ generates a states table, supports slr(1), lalr(1) and lr(1) grammars
 '''
 
 import sys
 import re
+import mmap
 import time
+from bisect import bisect_right
+from collections import deque
 
 import argparse
-from nms import nms
+from nms import nms, slots_ns
 sys.path.append('.')
 from ids import *
 from format_types import *
@@ -62,31 +65,34 @@ the definition for its grammar
                 | T_T_IDENTIFER #prefixed by T_, recognized by the external lexer (not implementd currently)
 '''
 
-TSRC = None
 DEBUG = 0
 
 
+BLOCK_BRACKETS = re.compile(r'[{}]')
+BLOCK_BRACKETS_BYTES = re.compile(rb'[{}]')
+
 def get_block(string, idx):
     '''
     given a string and an index for '{' in the string
     it returns when does the block end (ignoring nested ones)
+    it jumps from bracket to bracket instead of looking at every character
+    string can also be bytes like (a memory mapped file)
     '''
-    brack_beg, brack_end = ('{','}')
-    if string[idx] != brack_beg:
+    if isinstance(string, str):
+        brack_beg, brackets = '{', BLOCK_BRACKETS
+    else:
+        brack_beg, brackets = b'{', BLOCK_BRACKETS_BYTES
+    if string[idx:idx+1] != brack_beg:
         return None
     nested = 1
     start = idx
-    idx += 1
-    while idx < len(string):
-        if string[idx] == brack_beg:
+    for m in brackets.finditer(string, idx + 1):
+        if m.group() == brack_beg:
             nested += 1
-        elif string[idx] == brack_end:
+        else:
             nested -= 1
             if nested == 0:
-                break
-        idx += 1
-    if string[idx] == brack_end:
-        return (start, idx + 1)
+                return (start, m.end())
     return None
 
 
@@ -102,6 +108,67 @@ token_defs = (\
                 (T_ARB_CODE     ,   r'{'                                                            , get_block ), \
              )
 
+class token_scanner:
+    '''
+    token_defs compiled once into a single alternation regex, with one named group per definition
+    alternatives are tried in the order of the definitions, so the first definition that matches wins
+    (exactly like trying the regexes one after another)
+    binary scanners match bytes like input (bytes, mmap) instead of str
+    '''
+    def __init__(self, defs, binary=False):
+        self.defs = []
+        parts = []
+        for i, (tid, regex, skip_tpl) in enumerate(defs):
+            parts.append('(?P<t{}>{})'.format(i, regex))
+        master = '|'.join(parts)
+        self.regex = re.compile(master.encode() if binary else master)
+        for i, (tid, regex, skip_tpl) in enumerate(defs):
+            base = self.regex.groupindex['t{}'.format(i)]
+            reobj = re.compile(regex.encode() if binary else regex)
+            self.defs.append((tid, regex, skip_tpl, base, reobj))
+
+    def match(self, content, idx):
+        '''
+        returns (tid, val_begin, val_end, advance_to) for the token starting at idx, or None if nothing matches
+        the value itself is not sliced out of content, content[val_begin:val_end] is left to the caller
+        '''
+        m = self.regex.match(content, idx)
+        if not m:
+            return None
+        i = int(m.lastgroup[1:])
+        rv = self._match_def(self.defs[i], m, content, idx)
+        if rv is not None:
+            return rv
+        #a block definition rejected the match, try the definitions after it one by one
+        for d in self.defs[i+1:]:
+            m = d[4].match(content, idx)
+            if m:
+                rv = self._match_def(d, m, content, idx)
+                if rv is not None:
+                    return rv
+        return None
+
+    def _match_def(self, d, m, content, idx):
+        tid, regex, skip_tpl, base, reobj = d
+        if m.re is reobj:
+            base = 0
+        if isinstance(skip_tpl, tuple):
+            grp, skip_to = skip_tpl
+            advance_to = m.end(base + skip_to)
+            if (advance_to - idx) <= 0:
+                raise RuntimeError(("infinite loop detected in next_token()," +\
+                                    "regex: '{}' idx: '{}'").format(regex, idx))
+            return (tid, m.start(base + grp), m.end(base + grp), advance_to)
+        #it's a function
+        rv = skip_tpl(content, idx)
+        if rv is None:
+            return None
+        beg, end = rv
+        return (tid, beg, end, end)
+
+TOKEN_SCANNER = token_scanner(token_defs)
+TOKEN_SCANNER_BYTES = token_scanner(token_defs, binary=True)
+
 '''
 special tokens that should probably be parsed as tokens with different tids: (now they're not, they're just treated differently)
 _START
@@ -128,11 +195,28 @@ class token:
     .tid: token id
     .val: its value (string)
     .xyz: its position (a coord object)
+    .span: (begin, end) offsets of the token in the input
+
+    tokens made by a token_source can keep only the offsets of their value (.vspan),
+    .val is then taken out of the source the first time it is needed
     '''
-    def __init__(self, tid, val, xyz):
+    def __init__(self, tid, val, xyz, span=None, src=None, vspan=None):
         self.tid = tid
-        self.val = val
+        self._val = val
         self.xyz = xyz
+        self.span = span
+        self.src = src
+        self.vspan = vspan
+    @property
+    def val(self):
+        if self._val is None and self.vspan is not None:
+            self._val = self.src.value(*self.vspan)
+            self.src = None
+        return self._val
+    @val.setter
+    def val(self, val):
+        self._val = val
+        self.vspan = None
     def tidval(self):
         return self.tid, self.val
     def is_eof(self):
@@ -154,23 +238,33 @@ class token:
 
 class token_source:
     '''
-    a class that is initialized with a (fp (.open())able) or a string
+    a class that is initialized with a (fp (.open())able), a string, or bytes like content (bytes, mmap)
+    bytes like content is tokenized in place and only decoded (utf-8) one token value at a time,
+    see open_grammar()
     it tokenizes it according to token_defs, it has methods for skipping, getting, and ungetting tokens
     ungetting tokens is only relevant if we are dealing with grammars that involve backtracking, or in this case inefficient and lazily designed ones :)
     '''
     DEFAULT_STACK_MAX = 5
     DEFAULT_SKIP = (T_WHITESPACE, T_NEWL, T_COMMENT)
-    def __init__(self, input_src):
-        if hasattr(input_src, 'read'):
+    def __init__(self, input_src, filename=''):
+        if isinstance(input_src, (str, bytes, bytearray, mmap.mmap)):
+            self.content = input_src
+            self.filename = filename
+        else:
+            assert hasattr(input_src, 'read')
             self.content = input_src.read()
             self.filename = input_src.name
+        if isinstance(self.content, str):
+            self.scanner = TOKEN_SCANNER
+            self.newline = '\n'
         else:
-            assert isinstance(input_src, str)
-            self.content = input_src
-            self.filename = ''
+            self.scanner = TOKEN_SCANNER_BYTES
+            self.newline = b'\n'
         self.idx = 0
-        self.lineno = 1
-        self.undo_stack = [(self.idx, self.lineno)]
+        #offsets where lines begin, extended lazily as the input is consumed
+        self.line_starts = [0]
+        self.lines_indexed_upto = 0
+        self.undo_stack = [self.idx]
 
 
     def next_token(self, skip=DEFAULT_SKIP):
@@ -191,52 +285,35 @@ class token_source:
         '''
         internal
         '''
-        for tid, regex, skip_tpl in token_defs:
-            reobj = re.compile(regex)
-            m = reobj.match(self.content, self.idx)
-            if m:
-                if isinstance(skip_tpl, tuple):
-                    grp, skip_to = skip_tpl
-                    if (m.span(skip_to)[1] - self.idx) <= 0:
-                        raise RuntimeError(("infinite loop detected in next_token()," +\
-                                            "regex: '{}' idx: '{}'").format(regex, self.idx))
-                    self.undo_stack.append((self.idx, self.lineno,))
-                    if len(self.undo_stack) > token_source.DEFAULT_STACK_MAX:
-                        self.undo_stack = self.undo_stack[-token_source.DEFAULT_STACK_MAX:]
-                    advance_to = m.span(skip_to)[1]
-                    val = m.group(grp)
-                else:
-                    #it's a function
-                    self.undo_stack.append((self.idx, self.lineno,))
-                    rv = skip_tpl(self.content, self.idx)
-                    if rv is None:
-                        continue
-                    beg, end = rv
-                    val = self.content[beg:end]
-                    advance_to = end
-
-                t = token(tid, val, coord(self.filename, self.lineno, self.colno))
-                self.lineno += self.count_lines(val)
-                self.idx = advance_to
-                if DEBUG:
-                    print('next token:',t)
-                    self.dbg_last_tok = t
-                return t
-        self.undo_stack.append((self.idx, self.lineno,))
+        self.undo_stack.append(self.idx)
+        if len(self.undo_stack) > token_source.DEFAULT_STACK_MAX:
+            del self.undo_stack[0]
+        rv = self.scanner.match(self.content, self.idx)
+        if rv is not None:
+            tid, vbeg, vend, advance_to = rv
+            t = token(tid, None, self.coord(), (self.idx, advance_to), self, (vbeg, vend))
+            self.idx = advance_to
+            if DEBUG:
+                print('next token:',t)
+                self.dbg_last_tok = t
+            return t
+        span = (self.idx, self.idx)
         if self.idx >= len(self.content):
-            return token(T_END, None, coord(self.filename, self.lineno, self.colno))
-        return token(None, None, coord(self.filename, self.lineno, self.colno))
-
-    def count_lines(self, val):
-        return val.count('\n')
+            return token(T_END, None, self.coord(), span)
+        return token(None, None, self.coord(), span)
 
     def skip(self, what = DEFAULT_SKIP):
-        tok = self._next_token()
-        while tok.tid in what:
-            dprint(1, 'skipped:' ,tok)
-            tok = self._next_token()
+        '''
+        advances past tokens whose tid is in what, without building them or touching the undo stack
+        '''
+        rv = self.scanner.match(self.content, self.idx)
+        while rv is not None and rv[0] in what:
+            tid, vbeg, vend, advance_to = rv
+            if DEBUG:
+                dprint(1, 'skipped:' , token(tid, self.value(vbeg, vend), None))
+            self.idx = advance_to
+            rv = self.scanner.match(self.content, self.idx)
         dprint(1, '(unskipped): ',end='')
-        self.unget()
 
     def unget(self):
         if DEBUG:
@@ -247,31 +324,86 @@ class token_source:
 
         if not self.undo_stack:
             raise RuntimeError("unget(): attempted to undo more than the default allowed size, idx: {}".format(self.idx))
-        self.idx, self.lineno = self.undo_stack.pop()
+        self.idx = self.undo_stack.pop()
 
-    @property
-    def colno(self):
-        prv = self.content.rfind('\n',0, self.idx)
-        if prv == -1:
-            return 0
-        return self.idx - prv
-
-def ensure(what, skip_what = None):
-    '''
-    it tries to get a token with a tid matching the 'what' argument, while skipping what's specified in the skip_what tuple
-    it makes sure the token stream is at the first non-skipped position if it can't get it
-    '''
-    args = ()
-    if skip_what:
-        args = (skip_what,)
-    nxt = TSRC.next_token(*args)
-    if nxt.tid != what:
-        TSRC.unget()
-        return None
-    return nxt
+    def index_lines(self, upto):
+        '''
+        records the start of every line that begins at or before upto
+        each part of the input is scanned for newlines only once
+        '''
+        if upto <= self.lines_indexed_upto:
+            return
+        find = self.content.find
+        newline = self.newline
+        pos = self.lines_indexed_upto
+        while True:
+            nl = find(newline, pos, upto)
+            if nl == -1:
+                break
+            self.line_starts.append(nl + 1)
+            pos = nl + 1
+        self.lines_indexed_upto = upto
+
+    def position(self, idx):
+        '''
+        returns (lineno, colno) of an offset into the input
+        '''
+        self.index_lines(idx)
+        lineno = bisect_right(self.line_starts, idx)
+        if lineno == 1:
+            return lineno, 0
+        return lineno, idx - self.line_starts[lineno - 1] + 1
+
+    def value(self, beg, end):
+        '''
+        the text of the input between two offsets
+        '''
+        val = self.content[beg:end]
+        if not isinstance(val, str):
+            val = val.decode('utf-8')
+        return val
+
+    def close(self):
+        '''
+        releases a memory mapped input, tokens that already took their .val stay valid
+        '''
+        if isinstance(self.content, mmap.mmap):
+            self.content.close()
+
+    def __enter__(self):
+        return self
 
+    def __exit__(self, *exc_info):
+        self.close()
 
+    def coord(self):
+        lineno, colno = self.position(self.idx)
+        return coord(self.filename, lineno, colno)
 
+    @property
+    def lineno(self):
+        return self.position(self.idx)[0]
+
+    @property
+    def colno(self):
+        return self.position(self.idx)[1]
+
+def open_grammar(filename, use_mmap=False):
+    '''
+    returns a token_source for the grammar file filename
+    with use_mmap the file is memory mapped and tokenized in place instead of being read into a string,
+    inputs that can't be mapped (pipes like /dev/fd/0, empty files) are read normally
+    '''
+    if use_mmap:
+        with open(filename, 'rb') as f:
+            try:
+                content = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except (ValueError, OSError):
+                content = None
+            if content is not None:
+                return token_source(content, filename)
+    with open(filename) as f:
+        return token_source(f.read(), filename)
 
 def err(m):
     '''
@@ -286,129 +418,202 @@ def err(m):
 Top down parser for bnf grammar
 todo: left factor
 '''
-def goal_name():
-    dprint(1, 'goal_name: ',end='')
-    #ends on newline
-    return ensure(T_IDENTIFER, (T_WHITESPACE,T_COMMENT))
-
-def terminal():
-    dprint(1, 'terminal: ',end='')
-    #ends on newline
-    t = ensure(T_T_IDENTIFER, (T_WHITESPACE,))
-    if not t:
-        t = ensure(T_LITERAL, (T_WHITESPACE,))
-    return t
-
-def symbol():
-    dprint(1, 'symbol: ',end='')
-    s = goal_name()
-    if not s:
-        s = terminal()
-    #could be none
-    return s
-
-def symlist():
-    dprint(1, 'symlist: ',end='')
-    s = symbol()
-    if not s:
+class grammar_error(ValueError):
+    '''
+    a syntax error in a grammar, .filename, .lineno and .colno are where it was found
+    '''
+    def __init__(self, msg, where):
+        self.filename = where.filename
+        self.lineno = where.lineno
+        self.colno = where.colno
+        super().__init__('{}: {}'.format(where.verbose_repr(), msg))
+
+class grammar_parser:
+    '''
+    the recursive descent parser of the grammar definition language (see the grammar at the top of this file)
+    every parser owns its token_source, so many grammars can be parsed at the same time (for example from different threads)
+    errors are raised as grammar_error, debug is the debug level of the parser (DEBUG when it's None)
+
+    usage:
+        with open_grammar(filename) as tsrc:
+            ast = grammar_parser(tsrc).grammar()
+    '''
+    def __init__(self, tsrc, debug=None):
+        self.tsrc = tsrc
+        self.debug = DEBUG if debug is None else debug
+
+    def dprint(self, when, *args, **kwargs):
+        if when <= self.debug:
+            print(*args, **kwargs)
+
+    def error(self, msg, where=None):
+        raise grammar_error(msg, where.xyz if where is not None else self.tsrc.coord())
+
+    def ensure(self, what, skip_what = None):
+        '''
+        it tries to get a token with a tid matching the 'what' argument, while skipping what's specified in the skip_what tuple
+        it makes sure the token stream is at the first non-skipped position if it can't get it
+        '''
+        args = ()
+        if skip_what:
+            args = (skip_what,)
+        nxt = self.tsrc.next_token(*args)
+        if nxt.tid != what:
+            self.tsrc.unget()
+            return None
+        return nxt
+
+    def goal_name(self):
+        self.dprint(1, 'goal_name: ',end='')
+        #ends on newline
+        return self.ensure(T_IDENTIFER, (T_WHITESPACE,T_COMMENT))
+
+    def terminal(self):
+        self.dprint(1, 'terminal: ',end='')
+        #ends on newline
+        t = self.ensure(T_T_IDENTIFER, (T_WHITESPACE,))
+        if not t:
+            t = self.ensure(T_LITERAL, (T_WHITESPACE,))
+        return t
+
+    def symbol(self):
+        self.dprint(1, 'symbol: ',end='')
+        s = self.goal_name()
+        if not s:
+            s = self.terminal()
+        #could be none
         return s
-    slist = symlist()
-    if not slist:
-        slist = [s]
-    else:
-        slist = [s] + slist
-    dprint(1, 'symlist ', slist)
-    return slist
-
-def arb_code():
-    dprint(1, 'arb_code: ',end='')
-    return ensure(T_ARB_CODE, ensure(T_WHITESPACE,))
-
-def rule():
-    dprint(1, 'rule: ',end='')
-    slist = symlist()
-    if not slist:
+
+    def symlist(self):
+        '''
+        symlist -> symbol symlist
+                 | symbol
+        (parsed with a loop, so long rules don't recurse once per symbol)
+        '''
+        self.dprint(1, 'symlist: ',end='')
+        slist = []
+        s = self.symbol()
+        while s:
+            slist.append(s)
+            s = self.symbol()
+        self.dprint(1, 'symlist ', slist)
         return slist
-    arbcode = arb_code()
-    return [slist, arbcode]
-
-def rule_list():
-    dprint(1, 'rule_list: ',end='')
-    rulelist = []
-    a = rule()
-    while a:
-        rulelist.append(a)
-        dprint(1, 'expecting | or a New rule')
-        or_symbol = ensure(T_OR_SYMBOL)
-        if not or_symbol:
-            break
-        a = rule()
-    return rulelist
-
-def ddef():
-    '''
-    ddef -> goal_name T_DRV_SYMBOL rule_list
-    '''
-    definition = nms()
-    dprint(1, 'ddef: ',end='')
-    gn = goal_name()
-    if not gn:
-        dprint(1, 'no goalname')
-        return gn
-    definition.goalname = gn
-
-    #discarded but needed
-    if not ensure(T_DRV_SYMBOL, (T_WHITESPACE,)):
-        err('invalid definition declaration, expected -> after {}'.format(goalname)) 
-
-    rls = rule_list()
-    if not rls:
-        err('invalid definition body, expected symbols after definition {}'.format(definition.goalname))
-
-    definition.rules = rls
-    return definition
-
-def def_list():
-    '''
-    def_list    = def def_list
-                | ddef
-    '''
-    dprint(1, 'def_list: ',end='')
-    defs_list = []
-    d = ddef()
-    if not d:
-        return d
-    while d:
-        defs_list.append(d)
-        d = ddef()
-    dprint(1, 'defslist: ', defs_list)
-    return defs_list
-
-def grammar():
-    '''
-    start -> def_list
-    '''
-    dprint(1, 'grammar: ',end='')
-    defs = def_list()
-    tkn = TSRC.next_token()
-    if not tkn.is_eof():
-        err('error, unexpected token: {}'.format(tkn))
-    if DEBUG:
-        print(defs)
-    if not defs:
-        raise ValueError('no dlist')
-    return defs
+
+    def arb_code(self):
+        self.dprint(1, 'arb_code: ',end='')
+        return self.ensure(T_ARB_CODE)
+
+    def rule(self):
+        self.dprint(1, 'rule: ',end='')
+        slist = self.symlist()
+        if not slist:
+            return slist
+        arbcode = self.arb_code()
+        return [slist, arbcode]
+
+    def rule_list(self):
+        self.dprint(1, 'rule_list: ',end='')
+        rulelist = []
+        a = self.rule()
+        while a:
+            rulelist.append(a)
+            self.dprint(1, 'expecting | or a New rule')
+            or_symbol = self.ensure(T_OR_SYMBOL)
+            if not or_symbol:
+                break
+            a = self.rule()
+        return rulelist
+
+    def ddef(self):
+        '''
+        ddef -> goal_name T_DRV_SYMBOL rule_list
+        '''
+        definition = nms()
+        self.dprint(1, 'ddef: ',end='')
+        gn = self.goal_name()
+        if not gn:
+            self.dprint(1, 'no goalname')
+            return gn
+        definition.goalname = gn
+
+        #discarded but needed
+        if not self.ensure(T_DRV_SYMBOL, (T_WHITESPACE,)):
+            self.error('invalid definition declaration, expected -> after {}'.format(gn.val), gn)
+
+        rls = self.rule_list()
+        if not rls:
+            self.error('invalid definition body, expected symbols after definition {}'.format(gn.val), gn)
+
+        definition.rules = rls
+        return definition
+
+    def def_list(self):
+        '''
+        def_list    = def def_list
+                    | ddef
+        '''
+        self.dprint(1, 'def_list: ',end='')
+        defs_list = []
+        d = self.ddef()
+        if not d:
+            return d
+        while d:
+            defs_list.append(d)
+            d = self.ddef()
+        self.dprint(1, 'defslist: ', defs_list)
+        return defs_list
+
+    def grammar(self):
+        '''
+        start -> def_list
+        '''
+        self.dprint(1, 'grammar: ',end='')
+        defs = self.def_list()
+        tkn = self.tsrc.next_token()
+        if not tkn.is_eof():
+            self.error('unexpected token: {}'.format(tkn), tkn)
+        self.dprint(1, defs)
+        if not defs:
+            self.error('expected a definition')
+        #the values of the tokens in the tree are taken out of the source now, so it can be closed
+        for definition in defs:
+            definition.goalname.val
+            for slist, arbcode in definition.rules:
+                for symbol in slist:
+                    symbol.val
+                if arbcode:
+                    arbcode.val
+        return defs
 
 '''
 End of the top down parser
 '''
 
+'''
+compact datastructures, these are created in large numbers so they use __slots__ instead of nms
+'''
+class grammar_symbol(slots_ns):
+    __slots__ = ('name', 'ttype', 'val', 'sym_num')
+
+class grammar_rule(slots_ns):
+    __slots__ = ('lhs', 'seq', 'arbcode', 'rule_num')
+
+class rule_pointer(slots_ns):
+    __slots__ = ('rule', 'index')
+
+class lr_item(slots_ns):
+    __slots__ = ('rptrs', 'has', 'goto', 'on', 'kernel', 'state_num', 'lookaheads')
+    def __repr__(self):
+        #goto targets are shown by their state_num, following them would repr the whole automaton
+        members = ', '.join('{}={!r}'.format(name, getattr(self, name)) for name in self.__slots__ if name != 'goto')
+        goto = {sym: target.state_num for sym,target in (self.goto or {}).items()}
+        return 'lr_item({}, goto={!r})'.format(members, goto)
+
+class slr_entry(slots_ns):
+    __slots__ = ('action', 'number')
+
 def mk_symbol(name, ttype, value):
-    symbol = nms()
-    symbol.name = name
-    symbol.ttype = ttype
-    symbol.val = value
-    return symbol
+    return grammar_symbol(name=name, ttype=ttype, val=value)
 
 class symbol_table:
     def __init__(self):
@@ -454,6 +659,9 @@ def extract_bnf(ast):
             seq = []
             for token in sequence:
                 sym = None
+                if token.val == '_EPSILON':
+                    #the empty string, X -> _EPSILON is an empty rule
+                    continue
                 if token.tid == T_IDENTIFER:
                     sym = syms.add_if_uniq(mk_symbol(token.val, R_NONTERM, None))
                 elif token.tid == T_T_IDENTIFER:
@@ -463,10 +671,7 @@ def extract_bnf(ast):
                 else:
                     err('unknown token type: {}, {}'.format(token.val, global_rep(token.tid)))
                 seq.append(sym)
-            rule = nms() 
-            rule.arbcode = arbcode
-            rule.seq = seq
-            rule.lhs = lhs
+            rule = grammar_rule(lhs=lhs, seq=seq, arbcode=arbcode)
             syms.add_if_uniq(mk_symbol(lhs, R_NONTERM, None))
             rhs.append(rule)
 
@@ -485,25 +690,47 @@ def extract_bnf(ast):
         (len(start_rl.rules[0].seq) != 2) or \
         (start_rl.rules[0].seq[1].name != '_END'):
         raise ValueError('start rule must have one target with one token followed by a literal: _END')
+    for i,r in enumerate(iter_rules(productions)):
+        r.rule_num = i
     bnf = nms()
     bnf.productions = productions
     bnf.syms = syms
     return bnf
 
-def create_states(bnf):
+def mk_ctx(bnf, algorithm):
+    '''
+    the grammar context that create_states() fills
+    '''
     ctx = nms()
     ctx.states = []
     ctx.items = None
     ctx.bnf = bnf
+    ctx.algorithm = algorithm
+    ctx.sets = None #see grammar_sets()
+    ctx.lookaheads = None
+    ctx.transition_follow = None #see lalr_lookaheads()
+    return ctx
+
+def create_states(bnf, algorithm='slr'):
+    '''
+    builds the LR(0) automaton (used by the 'slr' and 'lalr' tables)
+    or with algorithm='lr1' the LR(1) automaton with merged states (see extract_lr1_items())
+    '''
+    ctx = mk_ctx(bnf, algorithm)
     dprint(1, pretty_productions(bnf.productions))
 
     product = ctx.bnf.productions['_START'].rules[0]
     start_rptr = mk_rptr(rule=product, index=0)
     
-    start_item = mk_item([start_rptr], ctx)
-    dprint(1,'start item:')
-    dprint(1,pretty_item(start_item))
-    items = extract_items(start_item, ctx)
+    if algorithm == 'lr1':
+        start_item = lr_item(rptrs=[start_rptr], lookaheads=[0], goto=dict(), on='?',
+                             kernel=kernel_key([start_rptr]))
+        items = extract_lr1_items(start_item, ctx)
+    else:
+        start_item = mk_item([start_rptr], ctx)
+        dprint(1,'start item:')
+        dprint(1,pretty_item(start_item))
+        items = extract_items(start_item, ctx)
     ctx.items = items
     return ctx
 
@@ -524,11 +751,19 @@ def mk_rptr(rule, index):
     rptr .rule=X, .index=3
     X ->   Y0   Y1   Y2 •
     '''
-    rptr = nms()
-    rptr.rule = rule
-    rptr.index = index
-    rptr.visited = False
-    return rptr
+    return rule_pointer(rule=rule, index=index)
+
+#an rptr packed into an int: (rule_num << RPTR_DOT_BITS) | index
+RPTR_DOT_BITS = 32
+
+def rptr_pack(rptr):
+    return (rptr.rule.rule_num << RPTR_DOT_BITS) | rptr.index
+
+def rptr_unpack(packed):
+    '''
+    returns (rule_num, index)
+    '''
+    return packed >> RPTR_DOT_BITS, packed & ((1 << RPTR_DOT_BITS) - 1)
 
 def rptr_first_symbol(rptr):
     if rptr.index >= len(rptr.rule.seq):
@@ -545,6 +780,34 @@ def iter_rules(productions):
     for p in productions.values():
         yield from p.rules
 
+def closure(rptrs, productions):
+    '''
+    expands a list of rptrs (in place) with an rptr at the beginning of every rule of every nonterminal
+    that appears right after the dot, until nothing new can be added
+    the rules of a nonterminal are looked up in productions[lhs].rules (no scanning of the whole grammar),
+    and every rptr is visited once, in the order it was added
+    returns the set of the nonterminals that were expanded
+    '''
+    has = set()
+    i = 0
+    while i < len(rptrs):
+        rptr = rptrs[i]
+        i += 1
+        if rptr.index >= len(rptr.rule.seq):
+            continue
+        name = rptr.rule.seq[rptr.index].name
+        if name in has:
+            continue
+        production = productions.get(name)
+        if production is None:
+            #a terminal
+            continue
+        has.add(name)
+        for rule in production.rules:
+            # 0 is the index into the rule, all of what we add starts at the beginning
+            rptrs.append(mk_rptr(rule, 0))
+    return has
+
 def mk_item(rptrs, ctx):
     '''
     an item is a collection of rule pointers (.rptrs)
@@ -555,58 +818,21 @@ def mk_item(rptrs, ctx):
     for rptr in rptrs:
         dprint(1, '   ', pretty_rptr(rptr))
         pass
-    item = nms()
-    item.rptrs = []
-    item.rptrs.extend(rptrs)
+    item = lr_item(rptrs=list(rptrs), goto=dict(), on='?', kernel=kernel_key(rptrs))
     #the production targets it already contains expanded, (to avoid readding them)
-    item.has = set()
-    item.goto = dict()
-    item.on = '?'
-    done = False
-    while not done:
-        done = True
-        for rptr in item.rptrs:
-            if rptr.index < len(rptr.rule.seq):
-                token = rptr.rule.seq[rptr.index]
-                if token.name in item.has:
-                    continue
-                for rule in iter_rules(ctx.bnf.productions):
-                    if rule.lhs == token.name:
-                        # 0 is the index into the rule, all of what we add starts at the beginning
-                        item.rptrs.append(mk_rptr(rule, 0)) 
-                        item.has.update([token.name])
-                        done = False
+    item.has = closure(item.rptrs, ctx.bnf.productions)
     dprint(1, 'mk_item() produced: ')
     dprint(1, indent(pretty_item(item),4))
     return item
 
 
-def rptr_identity(rptr):
+def kernel_key(rptrs):
     '''
-    a value that we can use to decide whether two rptrs are equivalent
+    a hashable value that we can use to decide whether two items are equivalent
+    two items are the same state when their kernels (the rptrs they were made from, before closure)
+    are the same set of (rule_num, index) pairs, the key is the sorted tuple of their packed rptrs
     '''
-    return (id(rptr.rule) * rptr.index)
-
-def item_identity(item):
-    '''
-    a value that we can use to decide whether two items are equivalent
-    '''
-    h = list()
-    item.rptrs.sort(key=rptr_identity)
-    for r in item.rptrs:
-        h.append(rptr_identity(r))
-    return tuple(h)
-
-def item_index(item, item_list):
-    '''
-    find an equivalent of item in item_list
-    returns an index or -1
-    '''
-    item_id = item_identity(item)
-    for i,litem in enumerate(item_list):
-        if item_identity(litem) == item_id:
-            return i
-    return -1
+    return tuple(sorted(set(map(rptr_pack, rptrs))))
 
 
 
@@ -614,129 +840,345 @@ def extract_items(start_item, ctx):
     '''
     given a start_item and a ctx (grammar context)
     returns all states reachable (a list that will include the start_item)
+
+    states are expanded from a queue, each one exactly once: its rptrs are bucketed by the symbol after the dot
+    in one pass, and the buckets are visited in symbol table order, so state numbering and goto maps are deterministic
     '''
+    sym_order = {name: i for i,name in enumerate(ctx.bnf.syms.syms)}
     states =  [start_item]
-    done = False
-    while not done:
-        done = True
-        for state in states:
-            for sym in ctx.bnf.syms.syms:
-                if sym in state.goto:
-                    continue
-                relevant_rptrs = []
-                for rptr in state.rptrs:
-                    #even something that points to the end is accepted
-                    if rptr.index >= len(rptr.rule.seq):
-                        continue
-                    cur_sym = rptr.rule.seq[rptr.index].name
-                    if cur_sym != sym:
-                        continue
-                    nrptr = mk_rptr(rptr.rule, rptr.index+1)
-                    relevant_rptrs.append(nrptr)
-                if not relevant_rptrs:
-                    continue
-                done = False
-                item = mk_item(relevant_rptrs, ctx)
-                item.on = sym
-                item_idx = item_index(item, states)
-                if item_idx != -1:
-                    dprint(1, 'original: ', pretty_item(states[item_idx]))
-                    dprint(1, 'new: ', pretty_item(item))
-                    #state is not new
-                    state.goto[sym] = states[item_idx]
-                else:
-                    state.goto[sym] = item
-                    states.append(item)
-                dprint(1, '\n\n',pretty_item(item),'\n\n')
+    kernels = {start_item.kernel: start_item}
+    queue_idx = 0
+    while queue_idx < len(states):
+        state = states[queue_idx]
+        queue_idx += 1
+        buckets = {}
+        for rptr in state.rptrs:
+            #something that points to the end has no transition
+            if rptr.index >= len(rptr.rule.seq):
+                continue
+            cur_sym = rptr.rule.seq[rptr.index].name
+            if cur_sym not in buckets:
+                buckets[cur_sym] = []
+            buckets[cur_sym].append(mk_rptr(rptr.rule, rptr.index+1))
+        for sym in sorted(buckets, key=sym_order.__getitem__):
+            relevant_rptrs = buckets[sym]
+            key = kernel_key(relevant_rptrs)
+            item = kernels.get(key)
+            if item is not None:
+                dprint(1, 'original: ', pretty_item(item))
+                #state is not new
+                state.goto[sym] = item
+                continue
+            item = mk_item(relevant_rptrs, ctx)
+            item.on = sym
+            state.goto[sym] = item
+            states.append(item)
+            kernels[key] = item
+            dprint(1, '\n\n',pretty_item(item),'\n\n')
     return states
 
+def lr1_closure(item, ctx, sets, suffixes):
+    '''
+    LR(1) closure of the kernel of an lr1 item (the first len(item.kernel) rptrs, and their lookaheads)
+    [A -> α • B β, L] adds [B -> • γ, first(β L)] for every rule of B, lookaheads that grow are propagated again
+    returns (rptrs, lookaheads)
+    '''
+    k = len(item.kernel)
+    rptrs = item.rptrs[:k]
+    las = item.lookaheads[:k]
+    where = {rptr_pack(rptr): i for i,rptr in enumerate(rptrs)}
+    queue = deque(range(k))
+    productions = ctx.bnf.productions
+    while queue:
+        i = queue.popleft()
+        rptr = rptrs[i]
+        if rptr.index >= len(rptr.rule.seq):
+            continue
+        production = productions.get(rptr.rule.seq[rptr.index].name)
+        if production is None:
+            continue
+        if rptr.rule.rule_num not in suffixes:
+            suffixes[rptr.rule.rule_num] = rule_suffix_sets(rptr.rule, sets)
+        firsts, nullables = suffixes[rptr.rule.rule_num]
+        bits = firsts[rptr.index + 1]
+        if nullables[rptr.index + 1]:
+            bits |= las[i]
+        for rule in production.rules:
+            packed = rule.rule_num << RPTR_DOT_BITS
+            j = where.get(packed)
+            if j is None:
+                where[packed] = len(rptrs)
+                queue.append(len(rptrs))
+                rptrs.append(mk_rptr(rule, 0))
+                las.append(bits)
+            elif bits & ~las[j]:
+                las[j] |= bits
+                queue.append(j)
+    return rptrs, las
+
+def weakly_compatible(l, m):
+    '''
+    Pager's weak compatibility of the kernel lookaheads of two states with the same core
+    merging them can't create a reduce/reduce conflict that the unmerged states don't have
+    '''
+    for i in range(len(l)):
+        for j in range(i+1, len(l)):
+            if ((l[i] & m[j]) | (l[j] & m[i])) and not (l[i] & l[j]) and not (m[i] & m[j]):
+                return False
+    return True
+
+def extract_lr1_items(start_item, ctx):
+    '''
+    given an lr1 start_item and a ctx (grammar context)
+    returns all states of the LR(1) automaton, built with Pager's algorithm:
+    a new state is merged into an existing state with the same core when their lookaheads are weakly compatible,
+    so the state count stays close to LALR(1) while conflicts are those of canonical LR(1)
+
+    states are expanded from a queue, a state whose lookaheads grew because of a merge is expanded again
+    every state has .lookaheads (a bitset for every rptr), and ctx.lookaheads maps (state_num, rule_num) to
+    the lookaheads of the reductions (see generate_slr_table())
+    '''
+    sets = grammar_sets(ctx)
+    sym_order = {name: i for i,name in enumerate(ctx.bnf.syms.syms)}
+    suffixes = {}
+    states = [start_item]
+    cores = {start_item.kernel: [start_item]}
+    queue = deque([start_item])
+    queued = set([id(start_item)])
+    while queue:
+        state = queue.popleft()
+        queued.discard(id(state))
+        state.rptrs, state.lookaheads = lr1_closure(state, ctx, sets, suffixes)
+        buckets = {}
+        for rptr, la in zip(state.rptrs, state.lookaheads):
+            if rptr.index >= len(rptr.rule.seq):
+                continue
+            cur_sym = rptr.rule.seq[rptr.index].name
+            if cur_sym not in buckets:
+                buckets[cur_sym] = []
+            buckets[cur_sym].append((rptr_pack(rptr) + 1, mk_rptr(rptr.rule, rptr.index+1), la))
+        for sym in sorted(buckets, key=sym_order.__getitem__):
+            kernel = sorted(buckets[sym], key=lambda x: x[0])
+            key = tuple(packed for packed,rptr,la in kernel)
+            las = [la for packed,rptr,la in kernel]
+            candidates = cores.get(key, [])
+            old = state.goto.get(sym)
+            if old is not None and old.kernel == key:
+                candidates = [old] + candidates
+            target = None
+            for c in candidates:
+                if weakly_compatible(c.lookaheads[:len(key)], las):
+                    target = c
+                    break
+            if target is None:
+                target = lr_item(rptrs=[rptr for packed,rptr,la in kernel], lookaheads=las,
+                                 goto=dict(), on=sym, kernel=key)
+                states.append(target)
+                if key not in cores:
+                    cores[key] = []
+                cores[key].append(target)
+                queue.append(target)
+                queued.add(id(target))
+            else:
+                grew = False
+                for i,la in enumerate(las):
+                    if la & ~target.lookaheads[i]:
+                        target.lookaheads[i] |= la
+                        grew = True
+                if grew and id(target) not in queued:
+                    queue.append(target)
+                    queued.add(id(target))
+            state.goto[sym] = target
+
+    #states that lost all their incoming transitions to a merge are dropped, the rest are numbered breadth first
+    reachable = [start_item]
+    seen = set([id(start_item)])
+    for state in reachable:
+        for target in state.goto.values():
+            if id(target) not in seen:
+                seen.add(id(target))
+                reachable.append(target)
+    ctx.lookaheads = {}
+    for i,state in enumerate(reachable):
+        state.state_num = i
+        for rptr, la in zip(state.rptrs, state.lookaheads):
+            if rptr.index == len(rptr.rule.seq):
+                ctx.lookaheads[(i, rptr.rule.rule_num)] = la
+        dprint(1, '\n\n',pretty_item(state),'\n\n')
+    return reachable
+
 '''
 note about first and follow
 for some languages those arent defined (read 'recursive descent vs lalr' a post in google groups)
 (these are languages that require backtracking)
 '''
 
-def update_first(first_dict, sym, ctx):
-    changed = False
-    #is a terminal
-    if sym.name not in ctx.bnf.syms:
-        changed = sym.name not in first_dict
-        first_dict[sym.name] = set([sym.name]) #terminals have themselves in their first() set
-    else:
-        first_dict[sym.name] = set()
-        for rule in ctx.bnf.productions[sym.name].rules:
-            for i,rsym in enumerate(rule.seq):
-                if rsym.name not in first_dict:
-                    changed = True
-                    update_first(first_dict, rsym, ctx)
-                first_dict[sym.name] |= (first_dict[rsym.name] - set(['_EPSILON']))
-                if '_EPSILON' in first_dict[rsym.name]:
-                    #if its the last then we add epsilon (this implies all of X-> Y0,Y1,Yk have epsilon, so X has epsilon too)
-                    if rsym is rule.seq[-1]:
-                        first_dict[sym] |= set(['_EPSILON'])
-                else:
-                    break
-    return changed
+def iter_bits(bits):
+    '''
+    yields the indices of the set bits of an int bitset, lowest first
+    '''
+    while bits:
+        low = bits & -bits
+        yield low.bit_length() - 1
+        bits ^= low
 
+def digraph(nodes_count, edges, init):
+    '''
+    DeRemer and Pennello's digraph algorithm
+    computes F(x) = init[x] | F(y) for every y in edges[x] (transitively), where the sets are int bitsets
+    every node is traversed once (no recursion), the members of a strongly connected component share one set
+    returns the list of F
+    '''
+    done = nodes_count + 1
+    F = list(init)
+    N = [0] * nodes_count
+    stack = []
+    for start in range(nodes_count):
+        if N[start] != 0:
+            continue
+        stack.append(start)
+        N[start] = len(stack)
+        work = [(start, iter(edges[start]), len(stack))]
+        while work:
+            x, it, depth = work[-1]
+            descended = False
+            for y in it:
+                if N[y] == 0:
+                    stack.append(y)
+                    N[y] = len(stack)
+                    work.append((y, iter(edges[y]), len(stack)))
+                    descended = True
+                    break
+                N[x] = min(N[x], N[y])
+                F[x] |= F[y]
+            if descended:
+                continue
+            work.pop()
+            if N[x] == depth:
+                while True:
+                    top = stack.pop()
+                    N[top] = done
+                    F[top] = F[x]
+                    if top == x:
+                        break
+            if work:
+                parent = work[-1][0]
+                N[parent] = min(N[parent], N[x])
+                F[parent] |= F[x]
+    return F
+
+def grammar_sets(ctx):
+    '''
+    computes nullable, first() and follow() for every symbol of the grammar (cached in ctx.sets)
+    symbols are numbered in symbol table order (the same numbers generate_slr_table gives them as .sym_num),
+    sets are int bitsets where bit n stands for symbol number n
+    returns an nms with:
+        .index_to_symbol
+        .sym_index:  symbol name -> symbol number
+        .nullable:   bitset of the nonterminals that can derive the empty string
+        .first:      list of bitsets indexed by symbol number
+        .follow:     list of bitsets indexed by symbol number
+    '''
+    if ctx.sets is not None:
+        return ctx.sets
+    bnf = ctx.bnf
+    productions = bnf.productions
+    index_to_symbol = list(bnf.syms)
+    sym_index = {s.name: i for i,s in enumerate(index_to_symbol)}
+    nsyms = len(index_to_symbol)
+    rules = list(iter_rules(productions))
+
+    #nullable, each rule counts its symbols that aren't known to be nullable yet
+    nullable = 0
+    remaining = []
+    users = [[] for i in range(nsyms)]
+    queue = []
+    for rule_idx,rule in enumerate(rules):
+        remaining.append(len(rule.seq))
+        for sym in rule.seq:
+            if sym.name in productions:
+                users[sym_index[sym.name]].append(rule_idx)
+        if not rule.seq:
+            queue.append(sym_index[rule.lhs])
+    while queue:
+        n = queue.pop()
+        if nullable & (1 << n):
+            continue
+        nullable |= (1 << n)
+        for rule_idx in users[n]:
+            remaining[rule_idx] -= 1
+            if remaining[rule_idx] == 0:
+                queue.append(sym_index[rules[rule_idx].lhs])
+
+    #first(), terminals have themselves, A -> α B β with α nullable makes first(A) include first(B)
+    init = [0] * nsyms
+    edges = [[] for i in range(nsyms)]
+    for i,s in enumerate(index_to_symbol):
+        if s.name not in productions:
+            init[i] = 1 << i
+    for rule in rules:
+        lhs = sym_index[rule.lhs]
+        for sym in rule.seq:
+            n = sym_index[sym.name]
+            if sym.name not in productions:
+                init[lhs] |= 1 << n
+                break
+            edges[lhs].append(n)
+            if not nullable & (1 << n):
+                break
+    first = digraph(nsyms, edges, init)
+
+    #follow(), A -> α B β makes follow(B) include first(β), and follow(A) too when β is nullable
+    init = [0] * nsyms
+    edges = [[] for i in range(nsyms)]
+    init[sym_index['_START']] = 1 << sym_index['_END']
+    for rule in rules:
+        lhs = sym_index[rule.lhs]
+        rest_first = 0
+        rest_nullable = True
+        for sym in reversed(rule.seq):
+            n = sym_index[sym.name]
+            if sym.name in productions:
+                init[n] |= rest_first
+                if rest_nullable and n != lhs:
+                    edges[n].append(lhs)
+            if nullable & (1 << n):
+                rest_first |= first[n]
+            else:
+                rest_first = first[n]
+                rest_nullable = False
+    follow = digraph(nsyms, edges, init)
+
+    sets = nms()
+    sets.index_to_symbol = index_to_symbol
+    sets.sym_index = sym_index
+    sets.nullable = nullable
+    sets.first = first
+    sets.follow = follow
+    ctx.sets = sets
+    return sets
+
+def sets_to_dict(sets, bitsets):
+    return {s.name: set(sets.index_to_symbol[n].name for n in iter_bits(bitsets[i]))
+            for i,s in enumerate(sets.index_to_symbol)}
 
 def generate_first(ctx):
     '''
     returns a dictionary mapping: symbol -> [first_set]
+    nullable symbols have _EPSILON in their first() set
     '''
-    first = {}
-    changed = True
-    while changed:
-        changed = False
-        for sym in ctx.bnf.syms:
-            changed = changed or update_first(first, sym, ctx)
+    sets = grammar_sets(ctx)
+    first = sets_to_dict(sets, sets.first)
+    for n in iter_bits(sets.nullable):
+        first[sets.index_to_symbol[n].name].add('_EPSILON')
     return first
 
-def update_follow(follow,first, sym, ctx):
-    changed = False
-    for rule in iter_rules(ctx.bnf.productions):
-        all_had_epsilon = True
-        for i,sym in enumerate(rule.seq):
-            if sym.ttype == R_TERM:
-                follow[sym.name] = set()
-            elif not sym.name in follow:
-                follow[sym.name] = set()
-            if (len(rule.seq) - i - 1) > 0: # there is something ahead of current sym
-                #add the next sym's first() to this sym's follow()
-                if sym.ttype == R_NONTERM:
-                    nsym = rule.seq[i+1]
-                    follow[sym.name] |= (first[nsym.name] - set(['_EPSILON']))
-            if '_EPSILON' not in first[sym.name]:
-                all_had_epsilon = False
-
-            if sym is rule.seq[-1]:
-                #if lhs -> 
-                fsym  = sym
-                if '_EPSILON' in first[fsym.name]:
-                    if i > 0:
-                        psym = rule.seq[i-1]
-                        if '_EPSILON' in first[psym.name]:
-                            raise ValueError('multiple possibly empty syms in the end of rule {}'.format(rule))
-                        follow[psym.name] |= first[rule.lhs]
-                else:
-                    if fsym.ttype == R_NONTERM and fsym.name not in ['_END']:
-                        if fsym.name not in follow:
-                            follow[fsym.name] = set()
-                        dprint(2,'add all of {} follow() to {} follow()'.format(rule.lhs, fsym.name))
-                        follow[fsym.name] |= follow[rule.lhs] 
-    return changed
-
 def generate_follow(first, ctx):
     '''
         returns a dictionary mapping: symbol -> [follow_set]
     '''
-    follow = {}
-    changed = True
-    follow['_START'] = set(['_END'])
-    while changed:
-        changed = False
-        for sym in ctx.bnf.syms:
-            changed = changed or update_follow(follow, first, sym, ctx)
-    return follow
+    sets = grammar_sets(ctx)
+    return sets_to_dict(sets, sets.follow)
 
 def mk_slr_entry(action_type, number=None):
     '''
@@ -746,14 +1188,11 @@ def mk_slr_entry(action_type, number=None):
         mk_slr_entry(EA_SHIFT, 3)
         mk_slr_entry(EA_GOTO, 0)
     '''
-    entry = nms()
     if action_type is None:
         action_type = EA_NONE
     if action_type not in EA_ACTIONS:
         raise ValueError('unknown action type: {}'.format(global_rep(action_type)))
-    entry.action  = action_type
-    entry.number = number
-    return entry
+    return slr_entry(action=action_type, number=number)
 
 def slr_entry_equ(lhs, rhs):
     return (lhs.action == rhs.action) and (rhs.number == lhs.number)
@@ -764,25 +1203,163 @@ def slr_table_action_conflict(symbol_literal, taken_action, new_action):
                                                     pretty_slr_entry(taken_action),
                                                     pretty_slr_entry(new_action)))
 
-def generate_slr_table(ctx):
+def rule_suffix_sets(rule, sets):
     '''
-    the algorithm can be found in page 253, in the dragon book
+    returns (firsts, nullables), two lists indexed by position in rule.seq
+    firsts[i] is the first() bitset of rule.seq[i:], nullables[i] is true when rule.seq[i:] can derive the empty string
     '''
-    states = ctx.items #contains .items:(rptrs to rules)
-    #rows are state indices, columns are gotos based on symbols
-    index_to_symbol  = []
-    index_to_state   = []
-    index_to_rule    = []
+    n = len(rule.seq)
+    firsts = [0] * (n + 1)
+    nullables = [True] * (n + 1)
+    for i in range(n - 1, -1, -1):
+        sym = sets.sym_index[rule.seq[i].name]
+        if sets.nullable & (1 << sym):
+            firsts[i] = sets.first[sym] | firsts[i+1]
+            nullables[i] = nullables[i+1]
+        else:
+            firsts[i] = sets.first[sym]
+            nullables[i] = False
+    return firsts, nullables
 
-    #sets of literal symbols (rather than token refernces,
-    #they're guarenteed to be unique, we can use the symbol table to get the original token reference)
-    first = generate_first(ctx)
-    follow = generate_follow(first, ctx)
+def lalr_lookaheads(ctx):
+    '''
+    LALR(1) lookaheads for the LR(0) automaton in ctx.items, computed with DeRemer and Pennello's relations
+    over the nonterminal transitions (p, A) of the automaton:
+        DR(p, A)    the terminals that can be shifted right after p --A--> r
+        reads       (p, A) reads (r, C) when r --C--> exists and C is nullable
+        includes    (p, A) includes (p', B) when B -> β A γ, γ is nullable and p' --β--> p
+        lookback    (q, A -> ω) lookback (p, A) when p --ω--> q
+    Read = digraph(reads, DR), Follow = digraph(includes, Read)
+    and the lookahead of a reduction is the union of Follow(p, A) over its lookback
+    returns a dictionary mapping: (state_num, rule_num) -> bitset of symbol numbers
+    Follow is kept in ctx.transition_follow, (state_num, nonterminal) -> bitset, for incremental.update_lookaheads()
+    '''
+    sets = grammar_sets(ctx)
+    productions = ctx.bnf.productions
+    sym_index = sets.sym_index
+    for i,state in enumerate(ctx.items):
+        state.state_num = i
 
-    ctx.bnf.syms.special_symbol('_START')
-    end_symbol = ctx.bnf.syms.special_symbol('_END')
+    trans = []
+    trans_index = {}
+    for state in ctx.items:
+        for sym in state.goto:
+            if sym in productions:
+                trans_index[(state.state_num, sym)] = len(trans)
+                trans.append((state, sym))
+
+    DR = []
+    reads = []
+    for state, sym in trans:
+        r = state.goto[sym]
+        dr = 0
+        rd = []
+        for nsym in r.goto:
+            n = sym_index[nsym]
+            if nsym not in productions:
+                dr |= 1 << n
+            elif sets.nullable & (1 << n):
+                rd.append(trans_index[(r.state_num, nsym)])
+        DR.append(dr)
+        reads.append(rd)
+    read = digraph(len(trans), reads, DR)
+
+    includes = [[] for t in trans]
+    lookback = {}
+    suffixes = {}
+    for t,(p, lhs) in enumerate(trans):
+        for rule in productions[lhs].rules:
+            if rule.rule_num not in suffixes:
+                suffixes[rule.rule_num] = rule_suffix_sets(rule, sets)[1]
+            nullable_suffix = suffixes[rule.rule_num]
+            q = p
+            for i,sym in enumerate(rule.seq):
+                if sym.name in productions and nullable_suffix[i+1]:
+                    includes[trans_index[(q.state_num, sym.name)]].append(t)
+                q = q.goto[sym.name]
+            key = (q.state_num, rule.rule_num)
+            if key not in lookback:
+                lookback[key] = []
+            lookback[key].append(t)
+    follow = digraph(len(trans), includes, read)
+    ctx.transition_follow = {(state.state_num, sym): follow[t] for t,(state, sym) in enumerate(trans)}
+
+    lookaheads = {}
+    for key, ts in lookback.items():
+        bits = 0
+        for t in ts:
+            bits |= follow[t]
+        lookaheads[key] = bits
+    return lookaheads
+
+def row_default_reduction(row):
+    '''
+    returns the rule number of the only reduce of a row (or of its entries) that has no shift or accept,
+    a parser in that state can reduce without reading the lookahead (a wrong lookahead is caught after the reduction),
+    None otherwise
+    '''
+    reduce_rule = None
+    for entry in row:
+        if entry is None or entry.action == EA_GOTO:
+            continue
+        if entry.action != EA_REDUCE:
+            return None
+        if reduce_rule is not None and reduce_rule != entry.number:
+            return None
+        reduce_rule = entry.number
+    return reduce_rule
+
+def row_key(row):
+    '''
+    a hashable value that tells rows apart, (symbol number, action, number) for every entry that isn't empty
+    '''
+    return tuple((i, entry.action, entry.number) for i,entry in enumerate(row) if entry is not None)
 
-    for i,state in enumerate(states):
+def share_rows(rows, keys=None):
+    '''
+    identical rows are stored once, keys (see row_key()) are computed when they're not given
+    returns (unique_rows, row_index, unique_keys), row_index[state_num] is the index of the state's row in unique_rows
+    '''
+    unique_rows = []
+    unique_keys = []
+    row_index = []
+    seen = {}
+    for i,row in enumerate(rows):
+        key = keys[i] if keys is not None else row_key(row)
+        if key not in seen:
+            seen[key] = len(unique_rows)
+            unique_rows.append(row)
+            unique_keys.append(key)
+        row_index.append(seen[key])
+    return unique_rows, row_index, unique_keys
+
+ALGORITHMS = ('slr', 'lalr', 'lr1')
+
+def table_lookaheads(ctx, algorithm):
+    '''
+    the lookaheads of the reductions, (state_num, rule_num) -> bitset of symbol numbers, None for 'slr' (follow() is used)
+    '''
+    if algorithm == 'slr':
+        return None
+    if algorithm == 'lalr':
+        return lalr_lookaheads(ctx)
+    if algorithm == 'lr1':
+        if ctx.algorithm != 'lr1':
+            raise ValueError('lr1 tables need the states of create_states(bnf, \'lr1\')')
+        return ctx.lookaheads
+    raise ValueError('unknown algorithm: {}'.format(algorithm))
+
+def number_table(ctx):
+    '''
+    numbers the states, symbols and rules (.state_num, .sym_num, .rule_num)
+    returns (index_to_state, index_to_symbol, index_to_rule)
+    '''
+    ctx.bnf.syms.special_symbol('_START')
+    ctx.bnf.syms.special_symbol('_END')
+    index_to_state  = []
+    index_to_symbol = []
+    index_to_rule   = []
+    for i,state in enumerate(ctx.items):
         state.state_num = i
         index_to_state.append(state)
     for i,s in enumerate(ctx.bnf.syms):
@@ -791,57 +1368,95 @@ def generate_slr_table(ctx):
     for i,r in enumerate(iter_rules(ctx.bnf.productions)):
         r.rule_num = i
         index_to_rule.append(r)
+    return index_to_state, index_to_symbol, index_to_rule
 
-    rows = []
-    for state_num,state in enumerate(index_to_state):
-        row = [None for i in range(len(index_to_symbol))]
-        for symbol_num,symbol in enumerate(index_to_symbol):
-            #current symbol's action, can only have 1
-            taken_action = None
-
-            goto_target = None
-            if symbol.name in state.goto:
-                goto_target = state.goto[symbol.name].state_num
-            #nonterminal
-            if symbol.name in ctx.bnf.productions:
-                if goto_target:
-                    row[symbol_num] = mk_slr_entry(EA_GOTO, goto_target)
-                continue
-            #find in what rptrs does the symbol appear and follow the algorithm rules
-            for rptr in state.rptrs:
-                #check for algorithm rule 1.
-                if symbol.name in state.goto:
-                    first_symbol = rptr_first_symbol(rptr) 
-                    if first_symbol and first_symbol.name == symbol.name: # lhs -> • rptr A B
-                        new_action =  mk_slr_entry(EA_SHIFT, goto_target)
-                        if goto_target < 0:
-                            #raise ValueError()
-                            pass
-                        if (taken_action is not None) and not slr_entry_equ(new_action, taken_action):
-                            slr_table_action_conflict(symbol.name, taken_action, new_action)
-                        row[symbol_num] = new_action
-                if (rptr_first_symbol(rptr) is None) and rptr_prev_symbol(rptr): # lhs -> A B rptr •
-                    #rule 3.
-                    if rptr.rule.lhs == '_START':
-                        row[end_symbol.sym_num] = mk_slr_entry(EA_ACC, EA_ACC)
-                    else:
-                        #rule 2 
-                        for follower_symbol_name in follow[rptr.rule.lhs]:
-                            follower_index = ctx.bnf.syms.get_symbol(follower_symbol_name).sym_num
-                            new_action = mk_slr_entry(EA_REDUCE, rptr.rule.rule_num)
-                            if (row[follower_index] is not None) and not slr_entry_equ(new_action, row[follower_index]):
-                                slr_table_action_conflict(follower_symbol, row[follower_index], new_action)
-                            row[follower_index] = new_action
-        rows.append(row)
+def table_row(state, ctx, sets, lookaheads, index_to_symbol):
+    '''
+    the row of a state, the states and symbols have to be numbered (see number_table())
+    returns (row, key), the key is row_key(row), made from the entries that were set instead of scanning the row
+    '''
+    syms = ctx.bnf.syms
+    productions = ctx.bnf.productions
+    row = [None] * len(index_to_symbol)
+    cols = set()
+    #rule 1. (shifts) and gotos, lhs -> • A B
+    for sym_name, target in state.goto.items():
+        symbol = syms.get_symbol(sym_name)
+        if sym_name in productions:
+            if target.state_num:
+                row[symbol.sym_num] = mk_slr_entry(EA_GOTO, target.state_num)
+                cols.add(symbol.sym_num)
+        else:
+            row[symbol.sym_num] = mk_slr_entry(EA_SHIFT, target.state_num)
+            cols.add(symbol.sym_num)
+    for rptr in state.rptrs:
+        if rptr.index != len(rptr.rule.seq): # lhs -> A B rptr •
+            continue
+        #rule 3.
+        if rptr.rule.lhs == '_START':
+            end_num = syms.get_symbol('_END').sym_num
+            row[end_num] = mk_slr_entry(EA_ACC, EA_ACC)
+            cols.add(end_num)
+            continue
+        #rule 2
+        if lookaheads is None:
+            bits = sets.follow[sets.sym_index[rptr.rule.lhs]]
+        else:
+            bits = lookaheads.get((state.state_num, rptr.rule.rule_num), 0)
+        new_action = mk_slr_entry(EA_REDUCE, rptr.rule.rule_num)
+        for follower_index in iter_bits(bits):
+            if (row[follower_index] is not None) and not slr_entry_equ(new_action, row[follower_index]):
+                slr_table_action_conflict(index_to_symbol[follower_index].name, row[follower_index], new_action)
+            row[follower_index] = new_action
+            cols.add(follower_index)
+    key = tuple((i, row[i].action, row[i].number) for i in sorted(cols))
+    return row, key
+
+def mk_table(ctx, algorithm, rows, keys, numbering):
+    '''
+    the table of the rows of every state (see generate_slr_table())
+    '''
+    index_to_state, index_to_symbol, index_to_rule = numbering
+    default_reductions = [row_default_reduction(row[i] for i,action,number in key) for row,key in zip(rows, keys)]
+    unique_rows, row_index, unique_keys = share_rows(rows, keys)
+    rows = [unique_rows[i] for i in row_index]
 
     table = nms()
     table.rows = rows
+    table.unique_rows = unique_rows
+    table.row_index = row_index
+    table.row_keys = unique_keys
+    table.default_reductions = default_reductions
     table.index_to_state  = index_to_state
     table.index_to_symbol = index_to_symbol
     table.index_to_rule = index_to_rule
+    table.algorithm = algorithm
     table.ctx = ctx
     return table
 
+def generate_slr_table(ctx, algorithm='slr'):
+    '''
+    the algorithm can be found in page 253, in the dragon book
+    algorithm decides the lookaheads of the reductions:
+        'slr':  follow() of the rule's lhs
+        'lalr': LALR(1) lookaheads (see lalr_lookaheads()), same states, fewer conflicts
+        'lr1':  lookaheads of the LR(1) automaton, ctx has to come from create_states(bnf, 'lr1')
+    the lookaheads are kept in ctx.lookaheads (None for 'slr')
+    '''
+    #follow() sets as bitsets of symbol numbers
+    sets = grammar_sets(ctx)
+    lookaheads = table_lookaheads(ctx, algorithm)
+    ctx.lookaheads = lookaheads
+    numbering = number_table(ctx)
+    index_to_state, index_to_symbol, index_to_rule = numbering
+    #rows are state indices, columns are gotos based on symbols
+    rows = []
+    keys = []
+    for state in index_to_state:
+        row, key = table_row(state, ctx, sets, lookaheads, index_to_symbol)
+        rows.append(row)
+        keys.append(key)
+    return mk_table(ctx, algorithm, rows, keys, numbering)
 
 
 def dprint(when, *args, **kwargs):
@@ -859,6 +1474,10 @@ def parse_cmd_line_args():
                         help='input file')
     parser.add_argument('--out', default='p.out',
                         help='out file')
+    parser.add_argument('--mmap', action='store_true',
+                        help='memory map the input file instead of reading it')
+    parser.add_argument('--algorithm', default='slr', choices=ALGORITHMS,
+                        help='how reduce lookaheads are computed')
     parser.add_argument('-v', action='store_true')
 
     args = vars(parser.parse_args())
@@ -870,15 +1489,14 @@ def parse_cmd_line_args():
 
 
 def main():
-    global TSRC
-
     args = parse_cmd_line_args()
-    input_str = open(args['in']).read()
-    TSRC = token_source(input_str)
-    
-    ast = grammar() #returns a tree like dictionary (nested SimpleNamespace)
+    with open_grammar(args['in'], args['mmap']) as tsrc:
+        try:
+            ast = grammar_parser(tsrc).grammar() #returns a tree like dictionary (nested SimpleNamespace)
+        except grammar_error as e:
+            err(str(e))
     bnf = extract_bnf(ast)
-    ctx = create_states(bnf)
+    ctx = create_states(bnf, args['algorithm'])
 
     for i in ctx.items:
         dprint(1, pretty_item(i))
@@ -889,7 +1507,7 @@ def main():
     dprint(1, indent(pretty_first_or_last(first),4))
     dprint(1, 'follow:')
     dprint(1, indent(pretty_first_or_last(follow),4))
-    table = generate_slr_table(ctx)
+    table = generate_slr_table(ctx, args['algorithm'])
     dprint(1, pretty_slr_table(table, 8))
 
 
@@ -0,0 +1,291 @@
+#!/usr/bin/env python3
+'''
+Author: nilputs@nilput.com
+see COPYRIGHTS file which is included in this project
+'''
+'''
+ a table driven LR parser in python, for the tables of lrgen (no C involved)
+
+ the table is turned into flat integer arrays (compile_table()), which can be saved with dumps() and loaded with loads(),
+ so a program that parses doesn't need the grammar:
+    ACTION[action_base[state] + terminal]  shift: target + 1, reduce: -(rule + 1), error (and accept): 0
+    GOTO[goto_base[state] + nonterminal]   the target state
+ identical rows are stored once (like the C tables)
+
+ usage:
+    p = lrparse.parser(table, actions={'expression -> expression \'+\' term': lambda a, plus, b: a + b})
+    p.parse([('1', 1), ('+', '+'), ('2', 2)])              #tokens are (kind, value)
+    p.parse_many(inputs)                                   #a list of the results, see parse_many()
+
+ kind is the name of a T_ token (T_num) or the text of a literal ('+'), the end of the iterable is _END
+ a reduce calls the action of the rule with the values of the rhs, rules without an action give the value of the first symbol
+'''
+
+import sys
+import argparse
+from array import array
+sys.path.append('.')
+import lrgen
+import table_cache
+from nms import nms
+from ids import *
+
+TABLES_MAGIC   = b'LRGP'
+TABLES_VERSION = 1
+#the stacks start this deep and double when needed
+STACK_SIZE = 64
+
+class parse_error(ValueError):
+    '''
+    a token that the grammar doesn't allow where it is
+    .token is the (kind, value) pair (None at the end of the input), .expected the kinds that were allowed
+    '''
+    def __init__(self, token, expected):
+        self.token = token
+        self.expected = expected
+        where = 'the end of the input' if token is None else 'token {!r}'.format(token)
+        super().__init__('unexpected {}, expected one of: {}'.format(where, ', '.join(expected)))
+
+def symbol_kind(symbol):
+    '''
+    what tokens of symbol are called, the text of a literal or the symbol's name
+    '''
+    return symbol.val if symbol.name.startswith('T_LITERAL') else symbol.name
+
+def rule_string(rule):
+    '''
+    the name of a rule in the actions of a parser: "lhs -> a 'b' c"
+    '''
+    return ' '.join([rule.lhs, '->'] + ["'{}'".format(s.val) if s.name.startswith('T_LITERAL') else s.name for s in rule.seq])
+
+def compile_table(table):
+    '''
+    the arrays of the parser of table (from lrgen.generate_slr_table() or table_cache.load())
+    '''
+    productions = table.ctx.bnf.productions
+    terminals = [s for s in table.index_to_symbol if s.name not in productions]
+    nonterminals = [s for s in table.index_to_symbol if s.name in productions]
+    term_col = {s.sym_num: i for i,s in enumerate(terminals)}
+    nonterm_col = {s.sym_num: i for i,s in enumerate(nonterminals)}
+    nonterm_index = {s.name: i for i,s in enumerate(nonterminals)}
+
+    action = array('i', [0]) * (len(table.unique_rows) * len(terminals))
+    goto = array('i', [0]) * (len(table.unique_rows) * len(nonterminals))
+    accept_rows = set()
+    for u,key in enumerate(table.row_keys):
+        for sym_num, entry_action, number in key:
+            if entry_action == EA_SHIFT:
+                action[u * len(terminals) + term_col[sym_num]] = number + 1
+            elif entry_action == EA_REDUCE:
+                action[u * len(terminals) + term_col[sym_num]] = -(number + 1)
+            elif entry_action == EA_GOTO:
+                goto[u * len(nonterminals) + nonterm_col[sym_num]] = number
+            elif entry_action == EA_ACC:
+                accept_rows.add(u)
+    #_START -> X _END •, accepts when the input ends again after _END
+    accept_state = next(state_num for state_num,u in enumerate(table.row_index) if u in accept_rows)
+
+    rt = nms()
+    rt.terminals = [symbol_kind(s) for s in terminals]
+    rt.nonterminals = [s.name for s in nonterminals]
+    rt.rules = [rule_string(rule) for rule in table.index_to_rule]
+    rt.rule_len = array('i', [len(rule.seq) for rule in table.index_to_rule])
+    rt.rule_lhs = array('i', [nonterm_index[rule.lhs] for rule in table.index_to_rule])
+    rt.row_index = array('i', table.row_index)
+    rt.default_reductions = array('i', [-1 if r is None else r for r in table.default_reductions])
+    rt.action = action
+    rt.goto = goto
+    rt.end = rt.terminals.index('_END')
+    rt.accept_state = accept_state
+    return rt
+
+def dumps(rt):
+    '''
+    the arrays of compile_table() as bytes
+    '''
+    w = table_cache.writer()
+    w.blob(TABLES_MAGIC)
+    w.u32(TABLES_VERSION)
+    for names in (rt.terminals, rt.nonterminals, rt.rules):
+        w.blob('\0'.join(names).encode())
+    for values in (rt.rule_len, rt.rule_lhs, rt.row_index, rt.default_reductions, rt.action, rt.goto):
+        w.ints('i', values)
+    w.ints('i', [rt.end, rt.accept_state])
+    return w.getvalue()
+
+def loads(data):
+    '''
+    the arrays of compile_table() from the bytes of dumps()
+    '''
+    r = table_cache.reader(data)
+    if r.blob() != TABLES_MAGIC or r.u32() != TABLES_VERSION:
+        raise ValueError('not parse tables of this version')
+    rt = nms()
+    rt.terminals, rt.nonterminals, rt.rules = [r.blob().decode().split('\0') for i in range(3)]
+    rt.rule_len, rt.rule_lhs, rt.row_index, rt.default_reductions, rt.action, rt.goto = [r.ints('i') for i in range(6)]
+    rt.end, rt.accept_state = r.ints('i')
+    return rt
+
+class parser:
+    '''
+    parses token iterables with the arrays of compile_table()
+    tables:  a table of lrgen, the arrays of compile_table() or the bytes of dumps()
+    actions: {rule: callable}, rule is a rule number or its rule_string() (see .rules)
+    the parser doesn't change while parsing (the stacks belong to each call), so it can be shared between threads
+    '''
+    def __init__(self, tables, actions=None):
+        if isinstance(tables, (bytes, bytearray, memoryview)):
+            tables = loads(tables)
+        elif not hasattr(tables, 'action'):
+            tables = compile_table(tables)
+        self.tables = tables
+        self.rules = list(tables.rules)
+        self.terminals = {kind: i for i,kind in enumerate(tables.terminals)}
+        nterms = len(tables.terminals)
+        nnonterms = len(tables.nonterminals)
+        #rows are looked up by state, the row number is multiplied once here instead of on every lookup
+        self.action_base = [u * nterms for u in tables.row_index]
+        self.goto_base = [u * nnonterms for u in tables.row_index]
+        #the parse loop indexes lists, in cpython that's faster than indexing arrays (no int is made per lookup)
+        self.action = tables.action.tolist()
+        self.goto = tables.goto.tolist()
+        self.default_reductions = tables.default_reductions.tolist()
+        self.rule_len = tables.rule_len.tolist()
+        self.rule_lhs = tables.rule_lhs.tolist()
+        self.rule_fn = [None] * len(self.rules)
+        rule_num = {name: i for i,name in enumerate(self.rules)}
+        for rule, fn in (actions or {}).items():
+            if not isinstance(rule, int):
+                if rule not in rule_num:
+                    raise KeyError('no rule {!r}, the rules are:\n    {}'.format(rule, '\n    '.join(self.rules)))
+                rule = rule_num[rule]
+            self.rule_fn[rule] = fn
+
+    def dumps(self):
+        return dumps(self.tables)
+
+    def expected(self, state):
+        '''
+        the kinds of the tokens that state has an action for
+        '''
+        base = self.action_base[state]
+        kinds = [kind for i,kind in enumerate(self.tables.terminals) if self.tables.action[base + i]]
+        if state == self.tables.accept_state:
+            kinds.append('_END')
+        return kinds
+
+    def parse(self, tokens):
+        '''
+        the value of the input (what the action of the start symbol's rule returned), raises parse_error
+        '''
+        return self.parse_many((tokens,), raise_errors=True)[0]
+
+    def parse_many(self, inputs, raise_errors=False):
+        '''
+        parses every token iterable of inputs, returns a list of their values,
+        an input that doesn't parse has its parse_error in its place, unless raise_errors
+        the tables and the stacks are set up once for the whole batch
+        '''
+        tables = self.tables
+        action = self.action
+        goto = self.goto
+        default_reductions = self.default_reductions
+        rule_len = self.rule_len
+        rule_lhs = self.rule_lhs
+        end = tables.end
+        accept_state = tables.accept_state
+        action_base = self.action_base
+        goto_base = self.goto_base
+        rule_fn = self.rule_fn
+        terminals = self.terminals
+        cap = STACK_SIZE
+        states = [0] * cap
+        values = [None] * cap
+        results = []
+        for tokens in inputs:
+            it = iter(tokens)
+            sp = 0
+            states[0] = 0
+            t = -1 #no lookahead
+            tok = value = None
+            try:
+                while True:
+                    state = states[sp]
+                    r = default_reductions[state]
+                    if r < 0:
+                        if t < 0:
+                            tok = next(it, None)
+                            if tok is None:
+                                t = end
+                                value = None
+                            else:
+                                kind, value = tok
+                                t = terminals.get(kind, -1)
+                                if t < 0 or kind == '_END':
+                                    raise parse_error(tok, self.expected(state))
+                        a = action[action_base[state] + t]
+                        if a > 0:
+                            sp += 1
+                            if sp == cap:
+                                states.extend([0] * cap)
+                                values.extend([None] * cap)
+                                cap *= 2
+                            states[sp] = a - 1
+                            values[sp] = value
+                            t = -1
+                            continue
+                        if a == 0:
+                            if t == end and state == accept_state:
+                                #the stack is X _END
+                                results.append(values[sp - 1])
+                                break
+                            raise parse_error(tok, self.expected(state))
+                        r = -a - 1
+                    #reduce
+                    n = rule_len[r]
+                    fn = rule_fn[r]
+                    if fn is not None:
+                        v = fn(*values[sp - n + 1:sp + 1]) if n else fn()
+                    else:
+                        v = values[sp - n + 1] if n else None
+                    sp -= n - 1
+                    if sp == cap:
+                        states.extend([0] * cap)
+                        values.extend([None] * cap)
+                        cap *= 2
+                    states[sp] = goto[goto_base[states[sp - 1]] + rule_lhs[r]]
+                    values[sp] = v
+            except parse_error as e:
+                if raise_errors:
+                    raise
+                results.append(e)
+        return results
+
+def parse_cmd_line_args():
+    '''
+    parses command line args, returns a dictionary of them
+    '''
+    stdin_linux = '/dev/fd/0'
+    parser = argparse.ArgumentParser(description='saves the parse tables of a grammar for lrparse.parser')
+    parser.add_argument('--in', default=stdin_linux,
+            help='input file')
+    parser.add_argument('--out', required=True,
+            help='where the tables are written')
+    parser.add_argument('--algorithm', default='slr', choices=lrgen.ALGORITHMS,
+            help='how reduce lookaheads are computed')
+    return vars(parser.parse_args())
+
+def main():
+    args = parse_cmd_line_args()
+    with lrgen.open_grammar(args['in']) as tsrc:
+        try:
+            ast = lrgen.grammar_parser(tsrc).grammar()
+        except lrgen.grammar_error as e:
+            lrgen.err(str(e))
+    bnf = lrgen.extract_bnf(ast)
+    table = lrgen.generate_slr_table(lrgen.create_states(bnf, args['algorithm']), args['algorithm'])
+    with open(args['out'], 'wb') as f:
+        f.write(dumps(compile_table(table)))
+
+if __name__ == '__main__':
+    main()
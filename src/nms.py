@@ -1,4 +1,5 @@
 import inspect
+import reprlib
 from types import SimpleNamespace
 class nms(SimpleNamespace):
     def __getattr__(self, name):
@@ -11,3 +12,20 @@ class nms(SimpleNamespace):
         err += 'available memebers: \n'
         err += ', '.join(map(lambda x: "\n  '{}':{}".format(x[0],(str(x[1]) if (len(str([x[1]])) < 50) else (str(x[1])[:50] + '...'))), self.__dict__.items()))
         raise AttributeError(err)
+
+class slots_ns:
+    '''
+    base class for the compact datastructures (rptrs, rules, symbols, table entries, ...)
+    subclasses list their members in __slots__, so they don't carry a __dict__
+    members that weren't given to the constructor are None
+    '''
+    __slots__ = ()
+    def __init__(self, **kwargs):
+        for name in self.__slots__:
+            setattr(self, name, kwargs.pop(name, None))
+        if kwargs:
+            raise AttributeError('{} has no members: {}'.format(type(self).__name__, ', '.join(kwargs)))
+    @reprlib.recursive_repr()
+    def __repr__(self):
+        members = ', '.join('{}={!r}'.format(name, getattr(self, name)) for name in self.__slots__)
+        return '{}({})'.format(type(self).__name__, members)
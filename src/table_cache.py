@@ -0,0 +1,383 @@
+#!/usr/bin/env python3
+'''
+Author: nilputs@nilput.com
+see COPYRIGHTS file which is included in this project
+'''
+'''
+ a content addressed on-disk cache of the automaton and the table that lrgen builds
+
+ the key is a hash of the grammar's structure (the symbols and the rules, in order, without the {} actions),
+ the algorithm and the sources the entries depend on (see DIGEST_SOURCES), so editing an action reuses
+ the cached table and any change to the grammar's structure, to the table construction or to the format misses
+
+ nothing is removed from the cache directory unless prune() is called (generate_slr_c.py --cache-size),
+ it removes the least recently used entries first
+
+ usage:
+    table = table_cache.load(cache_dir, bnf, algorithm)
+    if table is None:
+        table = lrgen.generate_slr_table(lrgen.create_states(bnf, algorithm), algorithm)
+        table_cache.store(cache_dir, table)
+
+ the last version of every grammar file is remembered too (store_previous()), so after a structural edit
+ the table can be updated from the previous version's instead of being rebuilt (see incremental.py)
+'''
+
+import os
+import sys
+import struct
+import hashlib
+import tempfile
+from array import array
+sys.path.append('.')
+import lrgen
+from nms import nms
+from ids import *
+
+CACHE_MAGIC   = b'LRGC'
+CACHE_VERSION = 2
+CACHE_SUFFIX  = '.lrtable'
+PREVIOUS_SUFFIX = '.prev'
+
+#table entries are stored as an action code (0 for an empty entry) and a number
+ACTION_CODES = {action: i + 1 for i,action in enumerate(EA_ACTIONS)}
+
+#what the entries are made by (incremental.py updates tables too), how they're stored and the action codes
+DIGEST_SOURCES = ('lrgen.py', 'incremental.py', 'table_cache.py', 'ids.py')
+
+_source_digest = None
+
+def source_digest():
+    global _source_digest
+    if _source_digest is None:
+        h = hashlib.sha256()
+        here = os.path.dirname(os.path.abspath(__file__))
+        for name in DIGEST_SOURCES:
+            with open(os.path.join(here, name), 'rb') as f:
+                h.update(f.read())
+        _source_digest = h.digest()
+    return _source_digest
+
+def grammar_key(bnf, algorithm):
+    '''
+    the hex digest that names the cache entry of bnf
+    '''
+    h = hashlib.sha256()
+    h.update(CACHE_MAGIC + struct.pack('<I', CACHE_VERSION))
+    h.update(source_digest())
+    h.update(algorithm.encode() + b'\0')
+    for symbol in bnf.syms:
+        h.update('{}\0{}\0{}\0'.format(symbol.name, symbol.ttype, symbol.val).encode())
+    h.update(b'\1')
+    for rule in lrgen.iter_rules(bnf.productions):
+        h.update(rule.lhs.encode() + b'\0')
+        h.update(' '.join(symbol.name for symbol in rule.seq).encode() + b'\0')
+    return h.hexdigest()
+
+def cache_path(cache_dir, bnf, algorithm):
+    return os.path.join(cache_dir, grammar_key(bnf, algorithm) + CACHE_SUFFIX)
+
+class writer:
+    def __init__(self):
+        self.parts = []
+    def u32(self, value):
+        self.parts.append(struct.pack('<I', value))
+    def ints(self, typecode, values):
+        a = array(typecode, values)
+        if sys.byteorder != 'little':
+            a.byteswap()
+        self.u32(len(a))
+        self.parts.append(a.tobytes())
+    def blob(self, data):
+        self.u32(len(data))
+        self.parts.append(data)
+    def bits(self, bits):
+        self.blob(bits.to_bytes((bits.bit_length() + 7) // 8, 'little'))
+    def getvalue(self):
+        return b''.join(self.parts)
+
+class reader:
+    def __init__(self, data):
+        self.data = memoryview(data)
+        self.idx = 0
+    def take(self, n):
+        if self.idx + n > len(self.data):
+            raise ValueError('truncated cache entry')
+        chunk = self.data[self.idx:self.idx + n]
+        self.idx += n
+        return chunk
+    def u32(self):
+        return struct.unpack('<I', self.take(4))[0]
+    def ints(self, typecode):
+        n = self.u32()
+        a = array(typecode)
+        a.frombytes(self.take(n * a.itemsize))
+        if sys.byteorder != 'little':
+            a.byteswap()
+        return a
+    def blob(self):
+        return bytes(self.take(self.u32()))
+    def bits(self):
+        return int.from_bytes(self.take(self.u32()), 'little')
+
+def serialize(table):
+    '''
+    the automaton (every state's rptrs, kernel, closure, lookaheads and gotos), the grammar_sets(),
+    the transition follow sets of lalr and the table as bytes
+    '''
+    ctx = table.ctx
+    sym_index = {symbol.name: symbol.sym_num for symbol in table.index_to_symbol}
+    w = writer()
+    w.blob(CACHE_MAGIC)
+    w.u32(CACHE_VERSION)
+    w.blob(table.algorithm.encode())
+    w.u32(len(table.index_to_state))
+    for state in table.index_to_state:
+        w.ints('Q', map(lrgen.rptr_pack, state.rptrs))
+        w.ints('Q', state.kernel)
+        #.has and .lookaheads are None in the states of some algorithms
+        w.u32(state.has is not None)
+        if state.has is not None:
+            w.ints('I', sorted(sym_index[name] for name in state.has))
+        w.u32(state.lookaheads is not None)
+        if state.lookaheads is not None:
+            w.u32(len(state.lookaheads))
+            for bits in state.lookaheads:
+                w.bits(bits)
+        w.ints('i', [sym_index.get(state.on, -1)])
+        gotos = [(sym_index[name], target.state_num) for name,target in state.goto.items()]
+        w.ints('I', [n for pair in gotos for n in pair])
+    lookaheads = ctx.lookaheads or {}
+    w.u32(len(lookaheads))
+    for (state_num, rule_num),bits in lookaheads.items():
+        w.ints('I', (state_num, rule_num))
+        w.bits(bits)
+    #what incremental.update() starts from, the sets are numbered like table.index_to_symbol
+    sets = ctx.sets
+    w.u32(sets is not None)
+    if sets is not None:
+        w.bits(sets.nullable)
+        w.u32(len(sets.first))
+        for bits in sets.first + sets.follow:
+            w.bits(bits)
+    transition_follow = ctx.transition_follow
+    w.u32(transition_follow is not None)
+    if transition_follow is not None:
+        w.u32(len(transition_follow))
+        for (state_num, name),bits in transition_follow.items():
+            w.ints('I', (state_num, sym_index[name]))
+            w.bits(bits)
+    w.u32(len(table.unique_rows))
+    for row in table.unique_rows:
+        w.ints('B', [0 if entry is None else ACTION_CODES[entry.action] for entry in row])
+        w.ints('i', [0 if entry is None or entry.number is None else entry.number for entry in row])
+    w.ints('I', table.row_index)
+    w.ints('i', [-1 if r is None else r for r in table.default_reductions])
+    return w.getvalue()
+
+def deserialize(data, bnf, algorithm):
+    '''
+    the table (like generate_slr_table() returns) of bnf from the bytes of serialize()
+    '''
+    r = reader(data)
+    if r.blob() != CACHE_MAGIC or r.u32() != CACHE_VERSION or r.blob().decode() != algorithm:
+        raise ValueError('not a cache entry of this version')
+    codes = {code: action for action,code in ACTION_CODES.items()}
+
+    bnf.syms.special_symbol('_START')
+    bnf.syms.special_symbol('_END')
+    index_to_symbol = []
+    for i,symbol in enumerate(bnf.syms):
+        symbol.sym_num = i
+        index_to_symbol.append(symbol)
+    index_to_rule = list(lrgen.iter_rules(bnf.productions))
+    for i,rule in enumerate(index_to_rule):
+        rule.rule_num = i
+
+    def rptr(packed):
+        rule_num, index = lrgen.rptr_unpack(packed)
+        return lrgen.mk_rptr(index_to_rule[rule_num], index)
+
+    states = []
+    gotos = []
+    for state_num in range(r.u32()):
+        rptrs = [rptr(packed) for packed in r.ints('Q')]
+        kernel = tuple(r.ints('Q'))
+        has = None
+        if r.u32():
+            has = set(index_to_symbol[i].name for i in r.ints('I'))
+        lookaheads = None
+        if r.u32():
+            lookaheads = [r.bits() for i in range(r.u32())]
+        on = r.ints('i')[0]
+        states.append(lrgen.lr_item(rptrs=rptrs, kernel=kernel, has=has, lookaheads=lookaheads, goto=dict(),
+                                    state_num=state_num, on=index_to_symbol[on].name if on >= 0 else '?'))
+        gotos.append(r.ints('I'))
+    for state,pairs in zip(states, gotos):
+        for i in range(0, len(pairs), 2):
+            state.goto[index_to_symbol[pairs[i]].name] = states[pairs[i + 1]]
+    lookaheads = {}
+    for i in range(r.u32()):
+        state_num, rule_num = r.ints('I')
+        lookaheads[(state_num, rule_num)] = r.bits()
+    sets = None
+    if r.u32():
+        sets = nms()
+        sets.index_to_symbol = list(index_to_symbol)
+        sets.sym_index = {symbol.name: i for i,symbol in enumerate(index_to_symbol)}
+        sets.nullable = r.bits()
+        nsyms = r.u32()
+        sets.first = [r.bits() for i in range(nsyms)]
+        sets.follow = [r.bits() for i in range(nsyms)]
+    transition_follow = None
+    if r.u32():
+        transition_follow = {}
+        for i in range(r.u32()):
+            state_num, sym_num = r.ints('I')
+            transition_follow[(state_num, index_to_symbol[sym_num].name)] = r.bits()
+
+    unique_rows = []
+    row_keys = []
+    for i in range(r.u32()):
+        actions = r.ints('B')
+        numbers = r.ints('i')
+        unique_rows.append([None if code == 0 else lrgen.mk_slr_entry(codes[code], number)
+                            for code,number in zip(actions, numbers)])
+        row_keys.append(tuple((col, codes[code], number) for col,(code,number) in enumerate(zip(actions, numbers)) if code))
+    row_index = list(r.ints('I'))
+    default_reductions = [None if n < 0 else n for n in r.ints('i')]
+
+    ctx = lrgen.mk_ctx(bnf, algorithm)
+    ctx.items = states
+    ctx.lookaheads = lookaheads if algorithm != 'slr' else None
+    ctx.sets = sets
+    ctx.transition_follow = transition_follow
+
+    table = nms()
+    table.rows = [unique_rows[i] for i in row_index]
+    table.unique_rows = unique_rows
+    table.row_index = row_index
+    table.row_keys = row_keys
+    table.default_reductions = default_reductions
+    table.index_to_state  = states
+    table.index_to_symbol = index_to_symbol
+    table.index_to_rule = index_to_rule
+    table.algorithm = algorithm
+    table.ctx = ctx
+    return table
+
+def load(cache_dir, bnf, algorithm):
+    '''
+    the cached table of bnf, or None when there's no (valid) entry
+    '''
+    path = cache_path(cache_dir, bnf, algorithm)
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+    except OSError:
+        return None
+    try:
+        table = deserialize(data, bnf, algorithm)
+    except (ValueError, IndexError, KeyError, struct.error):
+        return None
+    touch(path)
+    return table
+
+def write_atomic(path, data):
+    '''
+    writes data (bytes) to path through a temporary file in the same directory that's renamed,
+    so readers see the old or the new file and never a part of it, raises OSError
+    '''
+    directory = os.path.dirname(path) or '.'
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.chmod(tmp, 0o644)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+def write_entry(path, data):
+    '''
+    writes a cache file, errors are reported and ignored (the cache is only an optimization)
+    '''
+    try:
+        write_atomic(path, data)
+    except OSError as e:
+        print('couldn\'t write the table cache {}: {}'.format(path, e), file=sys.stderr)
+
+def store(cache_dir, table):
+    '''
+    writes the entry of table
+    '''
+    write_entry(cache_path(cache_dir, table.ctx.bnf, table.algorithm), serialize(table))
+
+def previous_path(cache_dir, filename, algorithm):
+    key = hashlib.sha256('{}\0{}'.format(os.path.abspath(filename), algorithm).encode()).hexdigest()
+    return os.path.join(cache_dir, key + PREVIOUS_SUFFIX)
+
+def store_previous(cache_dir, filename, algorithm, content):
+    '''
+    remembers content (the text of the grammar file filename) as the last version of filename,
+    see load_previous()
+    '''
+    data = content.encode() if isinstance(content, str) else bytes(content)
+    write_entry(previous_path(cache_dir, filename, algorithm), data)
+
+def touch(path):
+    '''
+    marks an entry as used, prune() removes the entries that weren't used for the longest first
+    '''
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+
+def prune(cache_dir, max_bytes):
+    '''
+    removes the least recently used files of the cache (entries and previous versions)
+    until the rest take at most max_bytes
+    '''
+    try:
+        names = os.listdir(cache_dir)
+    except OSError:
+        return
+    files = []
+    for name in names:
+        if not name.endswith((CACHE_SUFFIX, PREVIOUS_SUFFIX)):
+            continue
+        path = os.path.join(cache_dir, name)
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        files.append((st.st_mtime, st.st_size, path))
+    total = sum(size for mtime,size,path in files)
+    for mtime,size,path in sorted(files):
+        if total <= max_bytes:
+            break
+        try:
+            os.unlink(path)
+        except OSError:
+            #another process pruned it
+            pass
+        total -= size
+
+def load_previous(cache_dir, filename, algorithm):
+    '''
+    the cached table of the last version of filename that store_previous() saw, or None
+    it's what incremental.update() starts from when the current version misses
+    '''
+    try:
+        with open(previous_path(cache_dir, filename, algorithm), 'rb') as f:
+            content = f.read()
+    except OSError:
+        return None
+    try:
+        bnf = lrgen.extract_bnf(lrgen.grammar_parser(lrgen.token_source(content, filename)).grammar())
+    except ValueError:
+        return None
+    return load(cache_dir, bnf, algorithm)